@@ -0,0 +1,182 @@
+"""
+Casos de benchmark. Cada função registrada com `@case` faz o preparo (fora da
+medição) e devolve a função medida, síncrona ou `async`.
+"""
+import asyncio
+import glob
+import io
+import os
+import random
+import tempfile
+
+from datetime import datetime, timedelta
+
+from PIL import Image
+
+from fakes import FakeRedis
+
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+CASES = {}
+
+
+def case(name, rounds=20, **params):
+    """Registra um caso; `params` viram parte do nome (ex.: process_jobs[jobs=10000])."""
+    def register(fn):
+        label = name + ("[" + ",".join(f"{k}={v}" for k, v in params.items()) + "]" if params else "")
+        CASES[label] = (fn, params, rounds)
+        return fn
+    return register
+
+
+def realistic_png(width=960, height=1704, seed=0) -> bytes:
+    """PNG no tamanho das saídas do ComfyUI, com ruído suave (não comprime como imagem lisa)."""
+    rng = random.Random(seed)
+    small = Image.new("RGB", (width // 8, height // 8))
+    small.putdata([(rng.randrange(256), rng.randrange(256), rng.randrange(256)) for _ in range(small.width * small.height)])
+    buf = io.BytesIO()
+    small.resize((width, height), Image.BILINEAR).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# ---------- worker ----------
+
+def _populate_jobs(redis: FakeRedis, total: int) -> None:
+    """Mistura típica de um evento: a maioria dos jobs já concluída, alguns na fila ou processando."""
+    now = datetime.utcnow()
+    for i in range(total):
+        roll = i % 100
+        enqueued = (now - timedelta(seconds=total - i)).isoformat()
+        if roll < 90:
+            data = {"status": "done", "input": f"input/{i}/a.png", "output": "url", "enqueued_at": enqueued}
+        elif roll < 98:
+            data = {"status": "queued", "input": f"input/{i}/a.png", "attempt": "1", "enqueued_at": enqueued}
+        else:
+            data = {
+                "status": "processing", "input": f"input/{i}/a.png", "attempt": "1", "enqueued_at": enqueued,
+                "server": f"http://srv{i % 4}", "proc_start_at": now.isoformat(), "percent": "99",
+            }
+        redis.store[f"job:{i:08d}"] = data
+
+
+def _worker(redis: FakeRedis):
+    import worker as worker_module
+
+    worker_module.redis = redis
+    w = worker_module.Worker(server_list=[f"http://srv{i}" for i in range(4)])
+    return w
+
+
+def process_jobs_tick(jobs):
+    redis = FakeRedis()
+    _populate_jobs(redis, jobs)
+    w = _worker(redis)
+    asyncio.run(w.process_jobs())  # a primeira passada popula queued_jobs; mede o regime
+    return w.process_jobs
+
+
+def get_earliest_job(queued):
+    w = _worker(FakeRedis())
+    base = datetime(2026, 1, 1)
+    rng = random.Random(queued)
+    jobs = {
+        str(i): {
+            "job_id": str(i),
+            "created_at": (base + timedelta(seconds=rng.random() * 86400)).isoformat(),
+            "avoid_servers": {"http://srv0"} if i % 10 == 0 else set(),
+        }
+        for i in range(queued)
+    }
+    free = {f"http://srv{i}" for i in range(4)}
+    return lambda: w.get_earliest_job(jobs, "http://srv0", free)
+
+
+for _n in (1_000, 10_000, 100_000):
+    case("process_jobs_tick", rounds=5 if _n >= 100_000 else 20, jobs=_n)(process_jobs_tick)
+    case("get_earliest_job", rounds=10, queued=_n)(get_earliest_job)
+
+
+# ---------- cliente ComfyUI ----------
+
+@case("prompt_materialization", rounds=50)
+def prompt_materialization():
+    """Monta o prompt (cópia do template + parâmetros) de todos os workflows em src/workflows."""
+    from core.workflow_params import PARAMS_SUFFIX, WorkflowTemplates
+
+    templates = WorkflowTemplates("3", "6")
+    paths = [
+        p for p in sorted(glob.glob(os.path.join(ROOT, "src", "workflows", "*.json")))
+        if not p.endswith(PARAMS_SUFFIX)
+    ]
+    for p in paths:
+        templates.get(p)
+
+    def run():
+        for p in paths:
+            templates.build_prompt(p)
+    return run
+
+
+@case("save_image_buffer", rounds=10, size="960x1704")
+def save_image_buffer(size):
+    from core.multi_comfyui_api import MultiComfyUiAPI
+
+    images = {"9": [realistic_png()]}
+    return lambda: MultiComfyUiAPI.save_image_buffer(None, images)
+
+
+@case("as_png_buffer", rounds=10, size="960x1704")
+def as_png_buffer(size):
+    """Caminho atual das saídas: PNG do ComfyUI segue sem recodificar."""
+    from core.multi_comfyui_api import MultiComfyUiAPI
+
+    data = realistic_png()
+    return lambda: MultiComfyUiAPI._as_png_buffer(data)
+
+
+# ---------- arquivos e logs ----------
+
+@case("create_zip_of_images", rounds=10, images=20)
+def create_zip_of_images(images):
+    from utils.files import create_zip_of_images as create_zip
+
+    folder = tempfile.mkdtemp(prefix="bench-zip-")
+    data = realistic_png()
+    for i in range(images):
+        with open(os.path.join(folder, f"{i}.png"), "wb") as f:
+            f.write(data)
+    return lambda: create_zip(folder)
+
+
+class _OkResponse:
+    status_code = 200
+
+
+class _NullSession:
+    def post(self, url, data=None, timeout=None):
+        return _OkResponse()
+
+    def close(self):
+        pass
+
+
+@case("log_sender_drain", rounds=10, records=5000)
+def log_sender_drain(records):
+    """Grava `records` registros e mede o `_drain` completo (HTTP substituído por uma sessão nula)."""
+    from utils.log_sender import LogSender
+
+    tmp = tempfile.mkdtemp(prefix="bench-logs-")
+    LogSender.csv_filename = os.path.join(tmp, "datalogs.csv")
+    LogSender.backup_filename = os.path.join(tmp, "datalogs_backup.csv")
+    LogSender.segment_dir = os.path.join(tmp, "segments")
+    LogSender.cursor_filename = os.path.join(tmp, "segments", "cursor.json")
+    sender = LogSender("http://logs", "bench", autostart=False, buffer_capacity=records, fsync_policy="never")
+    sender.session = _NullSession()
+
+    def run():
+        for i in range(records):
+            sender.log("played", additional=str(i))
+        sender.flush()
+        sent, ok = sender._drain()
+        assert ok and sent == records
+    return run
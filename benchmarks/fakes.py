@@ -0,0 +1,86 @@
+import fnmatch
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+            return self
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class FakeRedis:
+    """
+    Redis em memória com o subconjunto de comandos usado pelo worker.
+    Sem I/O: os benchmarks medem só o custo do código do worker.
+    """
+
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def scan_iter(self, pattern):
+        for key in list(self.store):
+            if fnmatch.fnmatchcase(key, pattern):
+                yield key
+
+    async def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+    async def hget(self, key, field):
+        return self.store.get(key, {}).get(field)
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        data = self.store.setdefault(key, {})
+        if field is not None:
+            data[field] = value
+        data.update(mapping or {})
+
+    async def hincrby(self, key, field, amount=1):
+        data = self.store.setdefault(key, {})
+        data[field] = str(int(data.get(field, 0)) + amount)
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key, 0)) + 1)
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def zadd(self, key, mapping):
+        self.store.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.store.get(key, {}).pop(m, None)
+
+    async def lrange(self, key, start, end):
+        items = self.store.get(key, [])
+        return items[start:] if end == -1 else items[start:end + 1]
+
+    async def lpush(self, key, *values):
+        self.store.setdefault(key, [])[:0] = reversed(values)
+
+    async def ltrim(self, key, start, end):
+        self.store[key] = self.store.get(key, [])[start:end + 1]
+
+    async def rpop(self, key):
+        items = self.store.get(key)
+        return items.pop() if items else None
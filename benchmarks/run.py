@@ -0,0 +1,207 @@
+"""
+Micro-benchmarks dos caminhos quentes do worker e do cliente ComfyUI.
+
+    python benchmarks/run.py run                        # roda e mostra os tempos
+    python benchmarks/run.py run --save main            # grava benchmarks/baselines/main.json
+    python benchmarks/run.py run -k process_jobs        # só os casos que contêm o texto
+    python benchmarks/run.py compare main               # roda agora e compara com o baseline
+    python benchmarks/run.py compare main antes.json    # compara dois resultados gravados
+
+`compare` sai com código 1 se algum caso ficou mais lento que `--threshold`
+(padrão 15%, pela mediana), para poder ser usado antes de um evento ou na CI.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+from datetime import datetime, timezone
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+BASELINE_DIR = os.path.join(HERE, "baselines")
+
+sys.path.insert(0, os.path.join(ROOT, "src"))
+sys.path.insert(0, HERE)
+
+# mesmo ambiente mínimo dos testes, para importar core.config sem .env
+for _key, _value in {
+    "BASE_URL": "http://bench",
+    "STATIC_DIR": "static",
+    "REDIS_URL": "redis://localhost:6379/0",
+    "AWS_REGION": "us-east-1",
+    "S3_BUCKET": "bench-bucket",
+    "COMFYUI_API_SERVER1": "http://localhost",
+    "COMFYUI_API_SERVER2": "http://localhost",
+    "COMFYUI_API_SERVER3": "http://localhost",
+    "COMFYUI_API_SERVER4": "http://localhost",
+    "TIMER_TERMS": "20",
+    "CONFIG_INDEX": "6",
+    "WORKFLOW_PATH": os.path.join(ROOT, "src", "workflows", "no_flux_ex_v01_api.json"),
+    "WORKFLOW_NODE_ID_KSAMPLER": "3",
+    "WORKFLOW_NODE_ID_IMAGE_LOAD": "3023",
+    "WORKFLOW_NODE_ID_TEXT_INPUT": "6",
+    "DERIVATIVE_PREGENERATE": "",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+
+def measure(fn, rounds: int, min_time: float = 0.2, max_time: float = 30.0):
+    """Executa `fn` (1 aquecimento + pelo menos `rounds` vezes) e devolve os tempos em segundos."""
+    loop = asyncio.new_event_loop() if asyncio.iscoroutinefunction(fn) else None
+    call = (lambda: loop.run_until_complete(fn())) if loop else fn
+    try:
+        call()
+        times = []
+        started = time.perf_counter()
+        while len(times) < rounds or time.perf_counter() - started < min_time:
+            t0 = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - t0)
+            if time.perf_counter() - started > max_time and len(times) >= 3:
+                break
+        return times
+    finally:
+        if loop:
+            loop.close()
+
+
+def stats(times):
+    return {
+        "rounds": len(times),
+        "min": min(times),
+        "median": statistics.median(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "ops": 1.0 / statistics.median(times) if statistics.median(times) > 0 else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_cases(keyword=None):
+    import structlog
+    import logging
+
+    # os casos chamam código que loga a cada operação; a medição não deve incluir isso
+    logging.disable(logging.CRITICAL)
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.CRITICAL))
+
+    from cases import CASES
+
+    results = {}
+    errors = {}
+    for name, (fn, params, rounds) in CASES.items():
+        if keyword and keyword not in name:
+            continue
+        try:
+            target = fn(**params)
+            results[name] = stats(measure(target, rounds))
+        except Exception as e:
+            # um caso quebrado não derruba os demais; o erro vai no relatório
+            errors[name] = f"{type(e).__name__}: {e}"
+            print(f"{name:48s} ERRO {errors[name]}", flush=True)
+            continue
+        print(f"{name:48s} median={results[name]['median'] * 1000:10.3f}ms  "
+              f"min={results[name]['min'] * 1000:10.3f}ms  rounds={results[name]['rounds']}", flush=True)
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} {os.cpu_count()} cpus",
+        "results": results,
+        "errors": errors,
+    }
+
+
+def baseline_path(name):
+    if name.endswith(".json") or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def load(name):
+    with open(baseline_path(name), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(report, name):
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"baseline gravado em {path}")
+
+
+def compare(baseline, current, threshold):
+    """
+    Lista a variação da mediana de cada caso; retorna os nomes que regrediram
+    além de `threshold` ou que falharam na rodada atual.
+    """
+    regressions = []
+    print(f"\n{'caso':48s} {'baseline':>12s} {'atual':>12s} {'variação':>9s}")
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:48s} {'-':>12s} {cur['median'] * 1000:10.3f}ms {'novo':>9s}")
+            continue
+        change = cur["median"] / base["median"] - 1 if base["median"] else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSÃO"
+        print(f"{name:48s} {base['median'] * 1000:10.3f}ms {cur['median'] * 1000:10.3f}ms {change:+8.1%}{flag}")
+    for name, error in current.get("errors", {}).items():
+        regressions.append(name)
+        print(f"{name:48s} {'ERRO':>12s}  {error}")
+    if baseline.get("machine") != current.get("machine"):
+        print(f"\natenção: máquinas diferentes ({baseline.get('machine')} x {current.get('machine')})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="roda os benchmarks")
+    p_run.add_argument("-k", dest="keyword", help="só os casos cujo nome contém o texto")
+    p_run.add_argument("--save", metavar="NOME", help="grava o resultado como baseline")
+
+    p_cmp = sub.add_parser("compare", help="compara com um baseline")
+    p_cmp.add_argument("baseline", help="nome em benchmarks/baselines ou caminho .json")
+    p_cmp.add_argument("current", nargs="?", help="resultado gravado (padrão: roda os benchmarks agora)")
+    p_cmp.add_argument("-k", dest="keyword")
+    p_cmp.add_argument("--threshold", type=float, default=0.15, help="regressão tolerada na mediana (0.15 = 15%%)")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        report = run_cases(args.keyword)
+        if args.save:
+            save(report, args.save)
+        if report["errors"]:
+            print(f"\n{len(report['errors'])} caso(s) com erro: {', '.join(report['errors'])}")
+            return 1
+        return 0
+
+    baseline = load(args.baseline)
+    current = load(args.current) if args.current else run_cases(args.keyword)
+    regressions = compare(baseline, current, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} caso(s) acima de {args.threshold:.0%} ou com erro: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
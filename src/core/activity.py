@@ -0,0 +1,134 @@
+import os
+
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+
+STATS_VERSION_KEY = "stats:version"
+STATS_TOTALS_KEY = "stats:totals"
+
+
+def hour_bucket(when: datetime) -> datetime:
+    return when.replace(minute=0, second=0, microsecond=0)
+
+
+def _field(workflow: str, status: str) -> str:
+    return f"{workflow}|{status}"
+
+
+def _split_field(field: str):
+    workflow, _, status = field.rpartition("|")
+    return workflow, status
+
+
+class ActivityIndex:
+    """
+    Índice de atividade mantido incrementalmente no Redis.
+
+    Cada job que termina incrementa um contador em `stats:hour:{AAAAMMDDHH}`
+    (campo `{workflow}|{status}`) e no agregado `stats:totals`, e avança
+    `stats:version` (usado para invalidar caches de gráficos). As consultas
+    leem um hash por hora do intervalo, sem varrer a pasta de saídas.
+    Horários em UTC.
+    """
+
+    def __init__(self, redis, retention_days: int = 90):
+        self.redis = redis
+        self.retention_seconds = retention_days * 86400
+
+    @staticmethod
+    def _hour_key(hour: datetime) -> str:
+        return f"stats:hour:{hour:%Y%m%d%H}"
+
+    async def record(self, workflow: str, status: str, when: Optional[datetime] = None, count: int = 1) -> None:
+        hour = hour_bucket(when or datetime.utcnow())
+        key = self._hour_key(hour)
+        field = _field(workflow, status)
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hincrby(key, field, count)
+        pipe.expire(key, self.retention_seconds)
+        pipe.hincrby(STATS_TOTALS_KEY, field, count)
+        pipe.incr(STATS_VERSION_KEY)
+        await pipe.execute()
+
+    async def version(self) -> int:
+        return int(await self.redis.get(STATS_VERSION_KEY) or 0)
+
+    async def by_hour(
+        self,
+        start: datetime,
+        end: datetime,
+        workflow: Optional[str] = None,
+        status: Optional[str] = "done",
+    ) -> Dict[datetime, int]:
+        """
+        Contagem por hora entre `start` e `end` (inclusive), no mesmo formato de
+        `utils.files.count_files_by_hour`. Horas sem atividade ficam de fora.
+        """
+        hours = []
+        hour = hour_bucket(start)
+        while hour <= end:
+            hours.append(hour)
+            hour += timedelta(hours=1)
+        if not hours:
+            return {}
+
+        pipe = self.redis.pipeline(transaction=False)
+        for hour in hours:
+            pipe.hgetall(self._hour_key(hour))
+        buckets = await pipe.execute()
+
+        result: Dict[datetime, int] = {}
+        for hour, bucket in zip(hours, buckets):
+            total = sum(
+                int(v) for f, v in (bucket or {}).items()
+                if self._matches(f, workflow, status)
+            )
+            if total:
+                result[hour] = total
+        return result
+
+    async def count_between(self, start: datetime, end: datetime, **filters) -> int:
+        return sum((await self.by_hour(start, end, **filters)).values())
+
+    async def totals(self) -> Dict[str, Any]:
+        """Totais desde o início: {"by_status": {...}, "by_workflow": {...}, "total": n}."""
+        raw = await self.redis.hgetall(STATS_TOTALS_KEY) or {}
+        by_status: Dict[str, int] = {}
+        by_workflow: Dict[str, Dict[str, int]] = {}
+        for field, value in raw.items():
+            workflow, status = _split_field(field)
+            by_status[status] = by_status.get(status, 0) + int(value)
+            by_workflow.setdefault(workflow, {})
+            by_workflow[workflow][status] = by_workflow[workflow].get(status, 0) + int(value)
+        return {
+            "by_status": by_status,
+            "by_workflow": by_workflow,
+            "total": sum(by_status.values()),
+        }
+
+    async def backfill_directory(self, directory_path: str, workflow: str = "default", status: str = "done") -> int:
+        """
+        Importa, uma única vez, os jobs já existentes em uma pasta de saídas
+        (agrupados pela hora de modificação). Cada arquivo ou subpasta conta como
+        um job (as saídas locais ficam em `output/{request_id}/`). Chamadas
+        seguintes para a mesma pasta não fazem nada. Retorna a quantidade importada.
+        """
+        guard = f"stats:backfilled:{os.path.abspath(directory_path)}"
+        if not os.path.isdir(directory_path) or not await self.redis.set(guard, "1", nx=True):
+            return 0
+
+        counts: Dict[datetime, int] = {}
+        for entry in os.scandir(directory_path):
+            if entry.is_file() or entry.is_dir():
+                hour = hour_bucket(datetime.utcfromtimestamp(entry.stat().st_mtime))
+                counts[hour] = counts.get(hour, 0) + 1
+
+        for hour, count in counts.items():
+            await self.record(workflow, status, when=hour, count=count)
+        return sum(counts.values())
+
+    @staticmethod
+    def _matches(field: str, workflow: Optional[str], status: Optional[str]) -> bool:
+        wf, st = _split_field(field)
+        return (workflow is None or wf == workflow) and (status is None or st == status)
@@ -0,0 +1,83 @@
+import math
+
+from typing import Iterable, Optional
+
+from pydantic import BaseModel
+
+from core.latency import LatencyModel, QUEUE_INDEX_KEY
+
+
+class AdmissionDecision(BaseModel):
+    admitted: bool
+    queue_depth: int
+    throughput: float            # jobs/s estimados para os servidores ativos
+    estimated_wait: float        # espera em fila prevista para o novo job, em segundos
+    retry_after: int = 0
+    reason: str = ""
+
+
+class AdmissionController:
+    """
+    Controle de admissão das rotas de envio.
+
+    A espera prevista de um novo job é (jobs na fila à frente) / vazão, com a
+    vazão medida pelo modelo de latência (soma de 1/p50 dos servidores ativos).
+    Acima de `max_wait` segundos (ou de `max_queue` jobs na fila) o job é
+    recusado e `retry_after` indica em quanto tempo a fila deve ter escoado o
+    excedente.
+
+    A checagem não reserva vaga: envios simultâneos podem passar um pouco do
+    limite, o que é aceitável para um limite de espera.
+
+    :param max_wait: Espera máxima em fila, em segundos (0 desativa).
+    :param max_queue: Profundidade máxima da fila (0 desativa).
+    """
+
+    def __init__(
+        self,
+        redis,
+        latency: LatencyModel,
+        max_wait: float = 600.0,
+        max_queue: int = 0,
+        min_retry_after: int = 5,
+        max_retry_after: int = 600,
+    ):
+        self.redis = redis
+        self.latency = latency
+        self.max_wait = max_wait
+        self.max_queue = max_queue
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_wait or self.max_queue)
+
+    def _retry_after(self, excess_jobs: float, throughput: float) -> int:
+        seconds = excess_jobs / throughput if throughput > 0 else self.max_retry_after
+        return int(min(max(math.ceil(seconds), self.min_retry_after), self.max_retry_after))
+
+    async def check(self, workflow: str, servers: Iterable[str], count: int = 1) -> AdmissionDecision:
+        """Decide se `count` novos jobs de `workflow` entram na fila agora."""
+        depth = int(await self.redis.zcard(QUEUE_INDEX_KEY) or 0)
+        throughput = await self.latency.throughput(workflow, servers)
+        # o último dos `count` jobs espera os que já estão na fila e os demais do próprio envio
+        ahead = depth + count - 1
+        wait = ahead / throughput if throughput > 0 else math.inf
+
+        reason: Optional[str] = None
+        excess = 0.0
+        if self.max_queue and depth + count > self.max_queue:
+            reason = "queue_full"
+            excess = depth + count - self.max_queue
+        elif self.max_wait and wait > self.max_wait:
+            reason = "wait_too_long"
+            excess = ahead - self.max_wait * throughput
+        return AdmissionDecision(
+            admitted=reason is None,
+            queue_depth=depth,
+            throughput=throughput,
+            estimated_wait=wait if math.isfinite(wait) else -1,
+            retry_after=self._retry_after(excess, throughput) if reason else 0,
+            reason=reason or "",
+        )
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import time
+import uuid
+import structlog
+
+from typing import Dict, List, Optional
+
+from core.server_health import BREAKERS_KEY, OPEN
+
+
+log = structlog.get_logger()
+
+PROBE_RESULT_KEY = "health:comfyui"
+PROBE_SLOT_KEY = "health:comfyui:slot"
+
+
+class ComfyUiHealthProbe:
+    """
+    Health-check dos servidores ComfyUI servido a partir de cache.
+
+    Uma task em background sonda todos os servidores em paralelo a cada `ttl`
+    segundos, com um único prazo (`deadline`) para a rodada inteira, e guarda o
+    resultado. As chamadas de `/alive/comfyui` só leem esse cache; se a task não
+    estiver rodando, o cache vencido é renovado uma única vez (single-flight).
+
+    Com Redis, a rodada é de um processo só: quem pega a vaga (`SET NX` em
+    `PROBE_SLOT_KEY`, válida por `ttl`) sonda e publica o resultado em
+    `PROBE_RESULT_KEY`; os demais processos (e réplicas) leem de lá. Assim cada
+    servidor ComfyUI recebe um probe por `ttl`, qualquer que seja o número de
+    processos da API.
+    """
+
+    def __init__(self, servers: List[str], redis=None, ttl: float = 5.0, deadline: float = 3.0):
+        self.servers = servers
+        self.redis = redis
+        self.ttl = ttl
+        self.deadline = deadline
+        self.token = uuid.uuid4().hex
+        self._cache: Optional[Dict] = None
+        self._cached_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _ws_url(server: str) -> str:
+        base = server.rstrip('/').replace("http://", "ws://").replace("https://", "wss://")
+        if not base.startswith(("ws://", "wss://")):
+            base = "ws://" + base
+        return base + f"/ws?clientId={uuid.uuid4().hex}"
+
+    async def _probe_one(self, server: str, deadline_at: float) -> Dict:
+        import websockets
+
+        loop = asyncio.get_running_loop()
+        try:
+            remaining = max(deadline_at - loop.time(), 0.01)
+            async with websockets.connect(self._ws_url(server), open_timeout=remaining, ping_interval=None) as ws:
+                try:
+                    remaining = max(deadline_at - loop.time(), 0.01)
+                    msg = await asyncio.wait_for(ws.recv(), timeout=remaining)
+                    data = json.loads(msg)
+                except (asyncio.TimeoutError, ValueError, TypeError):
+                    data = None
+                return {"status": "ok", "first_message": data}
+        except Exception as e:
+            return {"status": "error", "error": str(e) or type(e).__name__}
+
+    async def probe_all(self) -> Dict:
+        """Sonda todos os servidores em paralelo, com prazo único para a rodada."""
+        started = time.monotonic()
+        deadline_at = asyncio.get_running_loop().time() + self.deadline
+        tasks = {server: asyncio.create_task(self._probe_one(server, deadline_at)) for server in self.servers}
+        results: Dict[str, Dict] = {}
+        if tasks:
+            # pequena folga para os probes encerrarem sozinhos no prazo
+            done, pending = await asyncio.wait(tasks.values(), timeout=self.deadline + 0.5)
+            for task in pending:
+                task.cancel()
+            for server, task in tasks.items():
+                if task in done:
+                    results[server] = task.result()
+                else:
+                    results[server] = {"status": "error", "error": "probe deadline exceeded"}
+
+        await self._merge_breakers(results)
+
+        if results and all(r["status"] == "ok" for r in results.values()):
+            overall = "ok"
+        elif any(r["status"] == "ok" for r in results.values()):
+            overall = "partial"
+        else:
+            overall = "error"
+
+        return {
+            "status": overall,
+            "details": results,
+            "probe_seconds": round(time.monotonic() - started, 3),
+        }
+
+    async def _merge_breakers(self, results: Dict[str, Dict]) -> None:
+        """Anexa o estado dos circuit breakers publicado pelo worker."""
+        if self.redis is None:
+            return
+        try:
+            breakers = await self.redis.hgetall(BREAKERS_KEY)
+        except Exception as e:
+            log.warning("comfyui_probe.breakers_unavailable", error=str(e))
+            return
+        for server, result in results.items():
+            breaker = json.loads(breakers[server]) if server in breakers else None
+            result["breaker"] = breaker
+            if breaker and breaker.get("state") == OPEN and result["status"] == "ok":
+                result["status"] = "circuit_open"
+
+    async def _claim_slot(self) -> bool:
+        """True se este processo deve sondar nesta rodada."""
+        if self.redis is None:
+            return True
+        try:
+            return bool(await self.redis.set(PROBE_SLOT_KEY, self.token, nx=True, px=int(self.ttl * 1000)))
+        except Exception as e:
+            # sem Redis não há como coordenar: cada processo sonda por conta própria
+            log.warning("comfyui_probe.slot_unavailable", error=str(e))
+            return True
+
+    async def _publish(self) -> None:
+        if self.redis is None:
+            return
+        payload = json.dumps({**self._cache, "probed_at": self._cached_at})
+        try:
+            await self.redis.set(PROBE_RESULT_KEY, payload, px=int(self.ttl * 3000))
+        except Exception as e:
+            log.warning("comfyui_probe.publish_failed", error=str(e))
+
+    async def _load_shared(self) -> None:
+        """Lê o resultado publicado pelo processo que sondou por último."""
+        try:
+            raw = await self.redis.get(PROBE_RESULT_KEY)
+        except Exception as e:
+            log.warning("comfyui_probe.shared_unavailable", error=str(e))
+            return
+        if raw:
+            data = json.loads(raw)
+            self._cached_at = data.pop("probed_at", time.time())
+            self._cache = data
+
+    async def refresh(self) -> Dict:
+        if await self._claim_slot():
+            self._cache = await self.probe_all()
+            self._cached_at = time.time()
+            await self._publish()
+        else:
+            await self._load_shared()
+        return self._cache
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                log.error("comfyui_probe.error", error=str(e))
+            await asyncio.sleep(self.ttl)
+
+    def start(self) -> None:
+        """Inicia a sondagem em background (idempotente)."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def snapshot(self) -> Dict:
+        """Último resultado em cache, com a idade em segundos."""
+        if self._cache is None or time.time() - self._cached_at > self.ttl * 2:
+            if self._refreshing is None or self._refreshing.done():
+                self._refreshing = asyncio.create_task(self.refresh())
+            await asyncio.shield(self._refreshing)
+        if self._cache is None:
+            # outro processo está fazendo a primeira rodada e ainda não publicou
+            return {"status": "pending", "details": {}, "age_seconds": None}
+        return {**self._cache, "age_seconds": round(time.time() - self._cached_at, 3)}
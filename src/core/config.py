@@ -19,10 +19,45 @@ class Settings(BaseSettings):
     CONFIG_INDEX: str = Field(default=6, env="CONFIG_INDEX")
     DEBUG_WORKER: bool = Field(default=False, env="DEBUG_WORKER")
     DEFAULT_PROCESSING_TIME: int = Field(8000, env="DEFAULT_PROCESSING_TIME")
+    ETA_DEFAULT_SECONDS: float = Field(default=80.0, env="ETA_DEFAULT_SECONDS")
+    LATENCY_WINDOW: int = Field(default=200, env="LATENCY_WINDOW")
+    BREAKER_WINDOW_SECONDS: float = Field(default=300.0, env="BREAKER_WINDOW_SECONDS")
+    BREAKER_MIN_SAMPLES: int = Field(default=4, env="BREAKER_MIN_SAMPLES")
+    BREAKER_ERROR_RATE: float = Field(default=0.5, env="BREAKER_ERROR_RATE")
+    BREAKER_CONSECUTIVE_TIMEOUTS: int = Field(default=3, env="BREAKER_CONSECUTIVE_TIMEOUTS")
+    BREAKER_COOLDOWN_SECONDS: float = Field(default=30.0, env="BREAKER_COOLDOWN_SECONDS")
+    HEALTH_PROBE_TTL: float = Field(default=5.0, env="HEALTH_PROBE_TTL")
+    HEALTH_PROBE_DEADLINE: float = Field(default=3.0, env="HEALTH_PROBE_DEADLINE")
+    ADMISSION_MAX_WAIT: float = Field(default=600.0, env="ADMISSION_MAX_WAIT")  # 0 desativa
+    ADMISSION_MAX_QUEUE: int = Field(default=0, env="ADMISSION_MAX_QUEUE")  # 0 = sem limite
+    JOB_QUEUE_DEADLINE: float = Field(default=900.0, env="JOB_QUEUE_DEADLINE")  # 0 desativa
+    BATCH_MAX_IMAGES: int = Field(default=500, env="BATCH_MAX_IMAGES")
+    BATCH_UPLOAD_CONCURRENCY: int = Field(default=8, env="BATCH_UPLOAD_CONCURRENCY")
+    STATS_RETENTION_DAYS: int = Field(default=90, env="STATS_RETENTION_DAYS")
+    EXPIRY_SWEEP_INTERVAL: float = Field(default=60.0, env="EXPIRY_SWEEP_INTERVAL")
+    EXPIRY_DOWNLOAD_TTL: int = Field(default=600, env="EXPIRY_DOWNLOAD_TTL")
+    EXPIRY_INPUT_TTL: int = Field(default=86400, env="EXPIRY_INPUT_TTL")
+    EXPIRY_OUTPUT_TTL: int = Field(default=7 * 86400, env="EXPIRY_OUTPUT_TTL")
+    EXPIRY_TEMP_TTL: int = Field(default=3600, env="EXPIRY_TEMP_TTL")
+    IMAGE_CACHE_MAX_BYTES: int = Field(default=64 * 1024 * 1024, env="IMAGE_CACHE_MAX_BYTES")
+    IMAGE_CACHE_MAX_FILE_BYTES: int = Field(default=8 * 1024 * 1024, env="IMAGE_CACHE_MAX_FILE_BYTES")
+    DERIVATIVE_WORKERS: int = Field(default=2, env="DERIVATIVE_WORKERS")
+    DERIVATIVE_CACHE_MAX_BYTES: int = Field(default=32 * 1024 * 1024, env="DERIVATIVE_CACHE_MAX_BYTES")
+    WORKER_METRICS_PORT: int = Field(default=9101, env="WORKER_METRICS_PORT")
+    WORKER_STATUS_LOG_INTERVAL: float = Field(default=30.0, env="WORKER_STATUS_LOG_INTERVAL")
+    WORKER_MAX_IN_FLIGHT: int = Field(default=0, env="WORKER_MAX_IN_FLIGHT")  # 0 = sem limite global
+    WORKER_MAX_PER_SERVER: int = Field(default=1, env="WORKER_MAX_PER_SERVER")
+    WORKER_DRAIN_TIMEOUT: float = Field(default=100.0, env="WORKER_DRAIN_TIMEOUT")
+    DERIVATIVE_PREGENERATE: str = Field(default="", env="DERIVATIVE_PREGENERATE")  # ex.: "320:webp,1024:webp"
     LOG_API: Optional[str] = Field(default=None, env="LOG_API")
     LOG_PROJECT_ID: Optional[str] = Field(default=None, env="LOG_PROJECT_ID")
+    LOG_BUFFER_CAPACITY: int = Field(default=10000, env="LOG_BUFFER_CAPACITY")
+    LOG_OVERFLOW_POLICY: str = Field(default="drop_oldest", env="LOG_OVERFLOW_POLICY")
+    LOG_FSYNC_POLICY: str = Field(default="interval", env="LOG_FSYNC_POLICY")
+    LEADER_LOCK_TTL: float = Field(default=30.0, env="LEADER_LOCK_TTL")
     REDIS_URL: str = Field(..., env="REDIS_URL")
     SENTRY_DSN: Optional[str] = Field(default=None, env="SENTRY_DSN")
+    SENTRY_TRACES_SAMPLE_RATE: float = Field(default=0.1, env="SENTRY_TRACES_SAMPLE_RATE")
     SMS_API_URL: Optional[str] = Field(default=None, env='SMS_API_URL')
     SMS_API_KEY: Optional[str] = Field(default=None, env='SMS_API_KEY')
     AWS_REGION: str = Field(..., env="AWS_REGION")
@@ -0,0 +1,106 @@
+import asyncio
+import os
+import shutil
+import time
+import structlog
+
+from typing import Iterable, List, Optional
+
+
+log = structlog.get_logger()
+
+EXPIRY_KEY = "expiry:deadlines"
+
+
+class ExpiryScheduler:
+    """
+    Remoção agendada de arquivos e pastas locais.
+
+    Quem cria o arquivo registra o prazo de expiração em um sorted set do Redis
+    (`expiry:deadlines`, score = timestamp do prazo). O sweeper lê só as
+    entradas vencidas, remove do disco e tira do set; entre uma rodada e outra
+    dorme até o próximo prazo (limitado a `max_interval`). Nada é listado no
+    disco, exceto em `seed_directory`, usado uma vez na inicialização para
+    agendar o que já existia.
+
+    Só caminhos dentro de `roots` são removidos.
+    """
+
+    def __init__(self, redis, roots: Iterable[str], batch_size: int = 200):
+        self.redis = redis
+        self.roots = [os.path.abspath(r) for r in roots if r]
+        self.batch_size = batch_size
+
+    def _allowed(self, path: str) -> bool:
+        path = os.path.abspath(path)
+        return any(path != root and path.startswith(root + os.sep) for root in self.roots)
+
+    async def schedule(self, paths, ttl: float, now: Optional[float] = None) -> None:
+        """Agenda a remoção de um ou mais caminhos daqui a `ttl` segundos."""
+        if isinstance(paths, str):
+            paths = [paths]
+        deadline = (time.time() if now is None else now) + ttl
+        mapping = {os.path.abspath(p): deadline for p in paths if self._allowed(p)}
+        if mapping:
+            await self.redis.zadd(EXPIRY_KEY, mapping)
+
+    async def seed_directory(self, directory: str, ttl: float) -> int:
+        """
+        Agenda as entradas de `directory` que ainda não têm prazo, usando a data
+        de criação de cada uma como base. Retorna quantas foram agendadas.
+        """
+        if not os.path.isdir(directory):
+            return 0
+        seeded = 0
+        for entry in os.scandir(directory):
+            path = os.path.abspath(entry.path)
+            if not self._allowed(path) or await self.redis.zscore(EXPIRY_KEY, path) is not None:
+                continue
+            await self.schedule(path, ttl, now=entry.stat().st_ctime)
+            seeded += 1
+        return seeded
+
+    @staticmethod
+    def _remove(paths: List[str]) -> None:
+        for path in paths:
+            try:
+                if os.path.isdir(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+                log.info("expiry.removed", path=path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning("expiry.remove_failed", path=path, error=str(e))
+
+    async def sweep(self, now: Optional[float] = None) -> int:
+        """Remove tudo o que já venceu; retorna a quantidade de entradas processadas."""
+        now = time.time() if now is None else now
+        removed = 0
+        while True:
+            due = await self.redis.zrangebyscore(EXPIRY_KEY, "-inf", now, start=0, num=self.batch_size)
+            if not due:
+                break
+            await asyncio.to_thread(self._remove, [p for p in due if self._allowed(p)])
+            await self.redis.zrem(EXPIRY_KEY, *due)
+            removed += len(due)
+            if len(due) < self.batch_size:
+                break
+        return removed
+
+    async def next_deadline(self) -> Optional[float]:
+        head = await self.redis.zrange(EXPIRY_KEY, 0, 0, withscores=True)
+        return float(head[0][1]) if head else None
+
+    async def run(self, max_interval: float = 60.0) -> None:
+        """Loop do sweeper: varre o que venceu e dorme até o próximo prazo."""
+        while True:
+            try:
+                await self.sweep()
+                deadline = await self.next_deadline()
+            except Exception as e:
+                log.error("expiry.sweep_error", error=str(e))
+                deadline = None
+            delay = max_interval if deadline is None else min(max_interval, max(deadline - time.time(), 0.5))
+            await asyncio.sleep(delay)
@@ -0,0 +1,52 @@
+from datetime import datetime
+from typing import Dict, Optional
+
+from core.latency import QUEUE_INDEX_KEY, enqueued_score
+
+
+def job_key(request_id: str) -> str:
+    return f"job:{request_id}"
+
+
+def new_job(
+    input_key: str,
+    enqueued_at: Optional[str] = None,
+    workflow_path: Optional[str] = None,
+    params: Optional[str] = None,
+    trace: Optional[Dict[str, str]] = None,
+    **extra: str,
+) -> Dict[str, str]:
+    """
+    Hash inicial de um job na fila. Campos opcionais ausentes não são gravados
+    (nada de "None" como string); `params` já vem validado/serializado.
+    """
+    mapping = {
+        "status": "queued",
+        "input": input_key,
+        "output": "",
+        "attempt": "1",
+        "enqueued_at": enqueued_at or datetime.utcnow().isoformat(),
+    }
+    if workflow_path:
+        mapping["workflow_path"] = workflow_path
+    if params:
+        mapping["params"] = params
+    mapping.update(trace or {})
+    mapping.update(extra)
+    return mapping
+
+
+def add_job(pipe, request_id: str, job: Dict[str, str], score: Optional[float] = None) -> None:
+    """Acrescenta ao pipeline a criação do hash do job e sua entrada no índice da fila."""
+    pipe.hset(job_key(request_id), mapping=job)
+    pipe.zadd(QUEUE_INDEX_KEY, {request_id: enqueued_score(job["enqueued_at"]) if score is None else score})
+
+
+async def enqueue(redis, request_id: str, job: Dict[str, str]) -> None:
+    """
+    Cria o job em uma única transação (MULTI/EXEC): hash e índice da fila
+    aparecem juntos para o worker, que consome o job sem reescrevê-lo.
+    """
+    pipe = redis.pipeline(transaction=True)
+    add_job(pipe, request_id, job)
+    await pipe.execute()
@@ -0,0 +1,114 @@
+import os
+import time
+
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+
+ALL_SERVERS = "*"
+QUEUE_INDEX_KEY = "jobs:queued"
+ACTIVE_SERVERS_KEY = "comfyui:active_servers"
+
+
+def workflow_key(workflow_path: Optional[str]) -> str:
+    """Nome curto do workflow usado como chave das métricas (ex.: 'orfeu_production_model_v11')."""
+    if not workflow_path:
+        return "default"
+    return os.path.splitext(os.path.basename(workflow_path))[0]
+
+
+def enqueued_score(enqueued_at: Optional[str]) -> float:
+    """Score do job no índice da fila: timestamp de `enqueued_at` (ISO) ou agora."""
+    try:
+        return datetime.fromisoformat(enqueued_at or "").timestamp()
+    except (TypeError, ValueError):
+        return time.time()
+
+
+def quantile(sorted_values, q: float) -> float:
+    """Quantil por interpolação linear sobre uma lista já ordenada."""
+    if not sorted_values:
+        raise ValueError("lista vazia")
+    pos = (len(sorted_values) - 1) * q
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+
+class LatencyModel:
+    """
+    Modelo de latência por (workflow, servidor).
+
+    Cada job concluído grava sua duração em uma janela deslizante no Redis
+    (`latency:{workflow}:{server}` e o agregado `latency:{workflow}:*`).
+    Os quantis p50/p90 são calculados sobre essa janela e ficam em cache local
+    por `cache_ttl` segundos, para que o loop do worker e as rotas não consultem
+    o Redis a cada chamada.
+    """
+
+    def __init__(self, redis, window: int = 200, default_seconds: float = 80.0, cache_ttl: float = 5.0):
+        self.redis = redis
+        self.window = window
+        self.default_seconds = default_seconds
+        self.cache_ttl = cache_ttl
+        self._cache: Dict[str, tuple] = {}
+
+    @staticmethod
+    def _key(workflow: str, server: str) -> str:
+        return f"latency:{workflow}:{server}"
+
+    async def record(self, workflow: str, server: str, duration: float) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in (self._key(workflow, server), self._key(workflow, ALL_SERVERS)):
+            pipe.lpush(key, f"{duration:.3f}")
+            pipe.ltrim(key, 0, self.window - 1)
+            self._cache.pop(key, None)
+        await pipe.execute()
+
+    async def _samples(self, key: str):
+        cached = self._cache.get(key)
+        now = time.monotonic()
+        if cached and now - cached[0] < self.cache_ttl:
+            return cached[1]
+        raw = await self.redis.lrange(key, 0, -1)
+        values = sorted(float(v) for v in raw or [])
+        self._cache[key] = (now, values)
+        return values
+
+    async def quantiles(self, workflow: str, server: Optional[str] = None) -> Dict[str, float]:
+        """
+        Retorna {"p50", "p90", "count"} para (workflow, server).
+        Sem amostras para o servidor, usa o agregado do workflow; sem nenhuma
+        amostra, usa `default_seconds`.
+        """
+        values = []
+        if server:
+            values = await self._samples(self._key(workflow, server))
+        if not values:
+            values = await self._samples(self._key(workflow, ALL_SERVERS))
+        if not values:
+            return {"p50": self.default_seconds, "p90": self.default_seconds, "count": 0}
+        return {"p50": quantile(values, 0.5), "p90": quantile(values, 0.9), "count": len(values)}
+
+    async def _per_server(self, workflow: str, servers: Iterable[str], q: str):
+        servers = [s for s in servers if s] or [ALL_SERVERS]
+        return [(await self.quantiles(workflow, s))[q] for s in servers]
+
+    async def throughput(self, workflow: str, servers: Iterable[str], q: str = "p50") -> float:
+        """Vazão da fila em jobs/s: soma de 1/`q` dos servidores ativos."""
+        return sum(1.0 / max(v, 0.001) for v in await self._per_server(workflow, servers, q))
+
+    async def estimate_wait(self, position: int, workflow: str, servers: Iterable[str]) -> Dict[str, float]:
+        """
+        Estima o tempo até o resultado de um job com `position` jobs à frente no índice.
+
+        A vazão da fila é a soma de 1/p50 dos servidores ativos; o tempo até o job
+        começar é position/vazão e a ele se soma a execução do próprio job.
+        """
+        est = {}
+        for q in ("p50", "p90"):
+            per_server = await self._per_server(workflow, servers, q)
+            throughput = sum(1.0 / max(v, 0.001) for v in per_server)
+            own = sum(per_server) / len(per_server)
+            est[q] = max(position, 0) / throughput + own
+        return est
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import socket
+import uuid
+import structlog
+
+from typing import Callable, Optional
+
+
+log = structlog.get_logger()
+
+# renova o lock só se ele ainda for deste processo
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class LeaderLock:
+    """
+    Eleição de líder entre os processos da API por um lock no Redis
+    (`SET key token NX PX ttl`, renovado a cada `interval` segundos).
+
+    Serve para o que precisa rodar uma vez só, mesmo com vários processos do
+    servidor (ex.: o envio dos datalogs). Se o líder morrer, o lock expira em
+    `ttl` segundos e outro processo assume. `on_elected`/`on_deposed` são
+    chamados nas trocas (funções síncronas; rodam em uma thread).
+
+    :param name: Nome do papel; a chave no Redis é `leader:{name}`.
+    """
+
+    def __init__(
+        self,
+        redis,
+        name: str,
+        ttl: float = 30.0,
+        interval: float = 10.0,
+        on_elected: Optional[Callable[[], None]] = None,
+        on_deposed: Optional[Callable[[], None]] = None,
+    ):
+        self.redis = redis
+        self.key = f"leader:{name}"
+        self.token = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl_ms = int(ttl * 1000)
+        self.interval = interval
+        self.on_elected = on_elected
+        self.on_deposed = on_deposed
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def _try_acquire(self) -> bool:
+        if self.is_leader:
+            return bool(await self.redis.eval(RENEW_SCRIPT, 1, self.key, self.token, self.ttl_ms))
+        return bool(await self.redis.set(self.key, self.token, nx=True, px=self.ttl_ms))
+
+    async def _set_leader(self, leader: bool) -> None:
+        if leader == self.is_leader:
+            return
+        self.is_leader = leader
+        log.info("leader.elected" if leader else "leader.deposed", key=self.key, token=self.token)
+        callback = self.on_elected if leader else self.on_deposed
+        if callback:
+            await asyncio.to_thread(callback)
+
+    async def tick(self) -> bool:
+        """Tenta obter/renovar o lock; retorna se este processo é o líder."""
+        try:
+            leader = await self._try_acquire()
+        except Exception as e:
+            # sem Redis não dá para garantir exclusividade: deixa de ser líder
+            log.warning("leader.redis_error", key=self.key, error=str(e))
+            leader = False
+        await self._set_leader(leader)
+        return leader
+
+    async def _run(self) -> None:
+        while True:
+            await self.tick()
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Para a renovação e libera o lock (outro processo assume sem esperar o ttl)."""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            try:
+                await self.redis.eval(RELEASE_SCRIPT, 1, self.key, self.token)
+            except Exception as e:
+                log.warning("leader.release_failed", key=self.key, error=str(e))
+            await self._set_leader(False)
@@ -0,0 +1,85 @@
+import os
+import time
+
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    REGISTRY,
+    generate_latest,
+    start_http_server,
+)
+
+
+# etapas do pipeline de um job (label `stage` de STAGE_SECONDS)
+INPUT_UPLOAD = "input_upload"        # API -> storage
+INPUT_DOWNLOAD = "input_download"    # storage -> worker
+QUEUE_WAIT = "queue_wait"            # enqueued_at -> início no worker
+COMFYUI_UPLOAD = "comfyui_upload"    # /upload/image
+EXECUTION = "execution"              # /prompt até o fim da execução (websocket)
+VIEW_FETCH = "view_fetch"            # /view de cada imagem gerada
+TRANSCODE = "transcode"              # conversões de imagem (PNG, derivadas)
+STORAGE_UPLOAD = "storage_upload"    # worker -> storage
+SMS = "sms"
+
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 90, 120, 180, 300, 600)
+
+STAGE_SECONDS = Histogram(
+    "comfyui_job_stage_seconds",
+    "Duração de cada etapa do pipeline de um job.",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+EXECUTION_SECONDS = Histogram(
+    "comfyui_execution_seconds",
+    "Tempo de execução no ComfyUI por workflow e servidor.",
+    ["workflow", "server"],
+    buckets=STAGE_BUCKETS,
+)
+JOBS = Gauge("comfyui_jobs", "Jobs no Redis por status (visão do worker).", ["status"])
+SERVER_SLOTS = Gauge("comfyui_server_slots", "Servidores ComfyUI por estado (busy, free, open).", ["state"])
+WORKER_JOBS = Gauge("comfyui_worker_jobs", "Jobs do worker por estado (in_flight, draining, orphaned).", ["state"])
+JOBS_HANDED_BACK = Counter("comfyui_worker_jobs_handed_back_total", "Jobs devolvidos à fila no desligamento do worker.")
+JOBS_FINISHED = Counter("comfyui_jobs_finished_total", "Jobs encerrados por resultado.", ["result"])
+RETRIES = Counter("comfyui_job_retries_total", "Tentativas que falharam e foram reagendadas.", ["failure_class", "stage"])
+TIMEOUTS = Counter("comfyui_timeouts_total", "Timeouts por etapa.", ["stage"])
+ADMISSIONS = Counter("comfyui_admissions_total", "Decisões do controle de admissão.", ["result"])
+CACHE_REQUESTS = Counter("comfyui_cache_requests_total", "Consultas a caches em memória.", ["cache", "result"])
+
+
+@contextmanager
+def timed(stage: str):
+    """Observa a duração do bloco em STAGE_SECONDS (também quando ele falha)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - start)
+
+
+def cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def render_latest():
+    """
+    (corpo, content-type) para o endpoint /metrics. Com PROMETHEUS_MULTIPROC_DIR
+    definido (vários processos do servidor), agrega as métricas de todos eles.
+    """
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def start_metrics_server(port: int) -> None:
+    """Expõe /metrics em uma porta própria (usado pelo worker). Porta 0 desativa."""
+    if port:
+        start_http_server(port)
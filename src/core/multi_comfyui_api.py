@@ -10,15 +10,38 @@ import websocket
 import structlog
 import aiohttp
 import time
+import sentry_sdk
 
 from PIL import Image
 
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from core import metrics, tracing
+from core.latency import workflow_key
+from core.server_health import ServerHealthRegistry
+from core.workflow_params import WorkflowTemplates
 from utils.files import generate_timestamped_filename
 
 log = structlog.get_logger()
 
 
+class ComfyUiPromptError(RuntimeError):
+    """O ComfyUI rejeitou a entrada (4xx em /upload/image ou /prompt): workflow ou imagem inválidos."""
+
+
+class ComfyUiExecutionError(RuntimeError):
+    """O ComfyUI aceitou o prompt mas a execução falhou (evento execution_error, OOM...)."""
+
+
+class ComfyUiInterrupted(RuntimeError):
+    """A execução do prompt foi interrompida (/interrupt) antes de terminar."""
+
+
 class MultiComfyUiAPI:
+    # downloads simultâneos de /view ao coletar as saídas de um prompt
+    VIEW_FETCH_CONCURRENCY = 8
+
     def __init__(
         self,
         server_address_list: list[str],
@@ -27,39 +50,58 @@ class MultiComfyUiAPI:
         node_id_ksampler: str,
         node_id_image_load: str,
         node_id_text_input: str,
+        health: Optional[ServerHealthRegistry] = None,
+        templates: Optional[WorkflowTemplates] = None,
     ):
         self.server_address_list = server_address_list
+        self.health = health or ServerHealthRegistry()
         self.img_temp_folder = img_temp_folder
         self.node_id_ksampler = node_id_ksampler
         self.node_id_image_load = node_id_image_load
         self.node_id_text_input = node_id_text_input
         self.session = requests.Session()
+        # websockets abertos por prompt_id, para `cancel_prompt` soltar a thread que espera a execução
+        self._open_ws: Dict[str, websocket.WebSocket] = {}
 
-        with open(workflow_path, "r", encoding="utf-8") as f:
-            self.workflow_template = json.load(f)
+        self.workflow_path = workflow_path
+        # template em cache compartilhado entre instâncias (não é relido a cada job)
+        self.templates = templates or WorkflowTemplates(node_id_ksampler, node_id_text_input)
+        self.workflow_template, self.params_schema = self.templates.get(workflow_path)
 
     @staticmethod
-    async def is_comfyui_busy(server_url: str) -> bool:
+    async def probe_queue(server_url: str) -> Optional[bool]:
         """
-        Returns True if the ComfyUI server is currently processing a job,
-        False if it's idle.
+        Consulta /queue do servidor ComfyUI.
+        Retorna True se estiver processando, False se ocioso e None se inacessível.
 
         :param server_url: Base URL of the ComfyUI server, e.g. 'http://127.0.0.1:8188'
         """
         status_url = f"{server_url.rstrip('/')}/queue"
 
         try:
-            async with aiohttp.ClientSession() as session:
+            timeout = aiohttp.ClientTimeout(total=5)
+            async with aiohttp.ClientSession(timeout=timeout) as session:
                 async with session.get(status_url) as response:
                     if response.status == 200:
                         data = await response.json()
-                        return data.get("queue_running", False)
+                        return bool(data.get("queue_running", False))
                     else:
                         log.warning(f"Error: HTTP {response.status} from ComfyUI")
         except Exception as e:
             log.warning(f"Failed to connect to ComfyUI at {server_url}: {e}")
 
-        return True  # Assume busy or unreachable
+        return None
+
+    @staticmethod
+    async def is_comfyui_busy(server_url: str) -> bool:
+        """
+        Returns True if the ComfyUI server is currently processing a job,
+        False if it's idle.
+
+        :param server_url: Base URL of the ComfyUI server, e.g. 'http://127.0.0.1:8188'
+        """
+        busy = await MultiComfyUiAPI.probe_queue(server_url)
+        return True if busy is None else busy  # Assume busy or unreachable
 
     @staticmethod
     def strip_http_scheme(url: str) -> str:
@@ -225,18 +267,31 @@ class MultiComfyUiAPI:
         raise RuntimeError("Nenhuma imagem encontrada para salvar.")
 
     async def get_available_server_addresses(self):
+        """
+        Servidores ociosos e com circuit breaker liberado, ordenados pela nota de saúde.
+        Servidores inacessíveis contam como falha no breaker.
+        """
         result = []
         for server_address in self.server_address_list:
             if not server_address or len(server_address) == 0:
                 continue
+            if not self.health.allow(server_address):
+                log.debug(f"server '{server_address}' skipped: circuit breaker open")
+                continue
             log.debug(f"checking server '{server_address}'")
-            busy = await self.is_comfyui_busy(server_address)
-            if not busy:
+            busy = await self.probe_queue(server_address)
+            if busy is None:
+                log.debug(f"server '{server_address}' is not running")
+                if self.health.record_failure(server_address, timeout=True):
+                    log.warning("comfyui.breaker_opened", server=server_address)
+            elif not busy:
                 log.debug(f"server '{server_address}' is not busy")
+                self.health.record_reachable(server_address)
                 result.append(server_address)
             else:
-                log.debug(f"server '{server_address}' is busy or not running")
-        return result
+                log.debug(f"server '{server_address}' is busy")
+                self.health.record_reachable(server_address)
+        return self.health.rank(result)
 
     def generate_image_buffer(self, server_address, file_obj) -> str:
         """
@@ -298,20 +353,71 @@ class MultiComfyUiAPI:
     def _post_prompt_api_workflow(self, server_address: str, workflow_api: dict, client_id: str) -> str:
         url = f"{server_address.rstrip('/')}/prompt"
         r = self.session.post(url, json={"prompt": workflow_api, "client_id": client_id}, timeout=30)
-        if r.status_code >= 400:
+        if 400 <= r.status_code < 500:
+            raise ComfyUiPromptError(f"POST {url} -> {r.status_code}: {r.text}")
+        if r.status_code >= 500:
             raise RuntimeError(f"POST {url} -> {r.status_code}: {r.text}")
         d = r.json()
         return d.get("prompt_id") or d.get("id") or d.get("server_id")
 
 
-    def generate_image_buffer_from_bytes(self, server_address: str, file_obj, request_id: str) -> io.BytesIO:
+    def cancel_prompt(self, server_address: str, prompt_id: str) -> str:
+        """
+        Libera o servidor de um prompt que ninguém mais espera: interrompe a
+        execução se ele estiver rodando (/interrupt) ou o remove da fila do
+        ComfyUI (/queue delete) se ainda estiver pendente. O websocket que
+        aguardava o prompt é abortado em seguida.
+
+        Retorna 'interrupted', 'deleted' ou 'not_found'.
+        """
+        base = server_address.rstrip("/")
+        try:
+            r = self.session.get(f"{base}/queue", timeout=5)
+            r.raise_for_status()
+            queue = r.json()
+
+            def in_queue(entries):
+                # entradas no formato do ComfyUI: [número, prompt_id, prompt, extra, saídas]
+                return any(len(e) > 1 and e[1] == prompt_id for e in entries or [])
+
+            if in_queue(queue.get("queue_running")):
+                self.session.post(f"{base}/interrupt", json={"prompt_id": prompt_id}, timeout=5).raise_for_status()
+                result = "interrupted"
+            elif in_queue(queue.get("queue_pending")):
+                self.session.post(f"{base}/queue", json={"delete": [prompt_id]}, timeout=5).raise_for_status()
+                result = "deleted"
+            else:
+                result = "not_found"
+        finally:
+            ws = self._open_ws.pop(prompt_id, None)
+            if ws is not None:
+                try:
+                    ws.abort()
+                except Exception:
+                    pass
+        log.info("comfyui.prompt_cancelled", server=server_address, prompt_id=prompt_id, result=result)
+        return result
+
+    def generate_images_from_bytes(
+        self,
+        server_address: str,
+        file_obj,
+        request_id: str,
+        params: Optional[dict] = None,
+        on_prompt: Optional[Callable[[str], None]] = None,
+    ) -> List[io.BytesIO]:
         """
         1) Upload da imagem via /upload/image (com filename e mimetype coerentes)
         2) Injeta nome no node LoadImage (id self.node_id_image_load)
-        3) Executa, espera ws terminar, baixa /view e retorna o buffer PNG
+        3) Executa, espera ws terminar, baixa /view e retorna um buffer PNG por
+           imagem gerada (batch_size > 1 e vários SaveImage incluídos)
+
+        `params` são os parâmetros do job (seed, prompt...), validados contra o
+        schema do workflow (ver core.workflow_params).
 
         request_id é usado apenas para contexto/log (o controle de status/progresso
-        continua sendo feito no Worker).
+        continua sendo feito no Worker). `on_prompt` recebe o prompt_id assim que
+        o ComfyUI aceita o prompt (é o que permite cancelá-lo, ver `cancel_prompt`).
         """
         # normaliza para bytes e deduz extensão
         raw = file_obj.read() if hasattr(file_obj, "read") else bytes(file_obj)
@@ -322,7 +428,10 @@ class MultiComfyUiAPI:
         files = {"image": (fname, io.BytesIO(raw))}
         data = {"overwrite": "true"}
         url_up = f"{server_address.rstrip('/')}/upload/image"
-        r = self.session.post(url_up, files=files, data=data, timeout=30)
+        with tracing.stage(metrics.COMFYUI_UPLOAD):
+            r = self.session.post(url_up, files=files, data=data, timeout=30)
+        if 400 <= r.status_code < 500:
+            raise ComfyUiPromptError(f"upload_image {url_up} -> {r.status_code}: {r.text}")
         if r.status_code != 200:
             raise RuntimeError(f"upload_image {url_up} -> {r.status_code}: {r.text}")
 
@@ -331,50 +440,114 @@ class MultiComfyUiAPI:
         if payload.get("subfolder"):
             comfy_name = f"{payload['subfolder']}/{comfy_name}"
 
-        # 2) monta prompt a partir do template, injeta imagem no node LoadImage
-        prompt = copy.deepcopy(self.workflow_template)
+        # 2) monta prompt a partir do template (com os parâmetros do job), injeta imagem no node LoadImage
+        prompt = self.templates.build_prompt(self.workflow_path, params)
         prompt[self.node_id_image_load]["inputs"]["image"] = comfy_name
 
+        # 3) abre o websocket antes de enviar o prompt (senão os primeiros
+        #    eventos, ou até o fim de uma execução em cache, podem se perder)
         client_id = str(uuid.uuid4())
-        prompt_id = self._post_prompt_api_workflow(server_address, prompt, client_id)
-
-        # 3) abre websocket e espera o fim da execução
         ws_url = self.http_scheme_to_ws(server_address).rstrip("/") + f"/ws?clientId={client_id}"
         ws = websocket.WebSocket()
         ws.connect(ws_url)
+        prompt_id = None
         try:
-            while True:
-                m = ws.recv()
-                if isinstance(m, str):
-                    j = json.loads(m)
-                    if (
-                        j.get("type") == "executing"
-                        and j.get("data", {}).get("node") is None
-                        and j["data"].get("prompt_id") == prompt_id
-                    ):
-                        # execução desse prompt terminou
-                        break
+            with sentry_sdk.start_span(op="job.stage", name=metrics.EXECUTION):
+                exec_start = time.perf_counter()
+                prompt_id = self._post_prompt_api_workflow(server_address, prompt, client_id)
+                self._open_ws[prompt_id] = ws
+                if on_prompt:
+                    on_prompt(prompt_id)
+                self._wait_for_execution(ws, prompt_id, prompt)
+                elapsed = time.perf_counter() - exec_start
+            metrics.STAGE_SECONDS.labels(stage=metrics.EXECUTION).observe(elapsed)
+            metrics.EXECUTION_SECONDS.labels(
+                workflow=workflow_key(self.workflow_path), server=server_address
+            ).observe(elapsed)
         finally:
+            self._open_ws.pop(prompt_id, None)
             try:
                 ws.close()
             except Exception:
                 pass
 
-        # 4) consulta histórico e baixa as imagens geradas
+        # 4) consulta histórico e baixa todas as imagens geradas
+        with sentry_sdk.start_span(op="job.stage", name="collect_outputs"):
+            return self.collect_outputs(server_address, prompt_id)
+
+    @staticmethod
+    def _wait_for_execution(ws, prompt_id: str, prompt: dict) -> None:
+        """
+        Lê o websocket até o fim da execução do prompt, abrindo um span por
+        node a cada evento `executing` (ver core.tracing.NodeSpans).
+
+        :raises ComfyUiExecutionError: Em um evento `execution_error` do prompt.
+        :raises ComfyUiInterrupted: Em um evento `execution_interrupted` do prompt.
+        """
+        nodes = tracing.NodeSpans(prompt)
+        while True:
+            m = ws.recv()
+            if m == "":
+                # frame de close: o ComfyUI caiu ou derrubou a conexão no meio da execução
+                raise websocket.WebSocketConnectionClosedException("websocket fechado durante a execução")
+            if not isinstance(m, str):
+                continue  # previews binários
+            j = json.loads(m)
+            data = j.get("data") or {}
+            if data.get("prompt_id") != prompt_id:
+                continue
+            if j.get("type") == "executing":
+                nodes.executing(data.get("node"))
+                if data.get("node") is None:
+                    # execução desse prompt terminou
+                    return
+            elif j.get("type") == "execution_cached":
+                nodes.cached(data.get("nodes"))
+            elif j.get("type") == "execution_error":
+                nodes.finish("internal_error")
+                raise ComfyUiExecutionError(
+                    f"node {data.get('node_id')} ({data.get('node_type')}): {data.get('exception_message')}"
+                )
+            elif j.get("type") == "execution_interrupted":
+                nodes.finish("cancelled")
+                raise ComfyUiInterrupted(f"prompt {prompt_id} interrompido no node {data.get('node_id')}")
+
+    def generate_image_buffer_from_bytes(self, server_address: str, file_obj, request_id: str) -> io.BytesIO:
+        """Como `generate_images_from_bytes`, mas devolve só a primeira imagem (PNG)."""
+        return self.generate_images_from_bytes(server_address, file_obj, request_id)[0]
+
+    def collect_outputs(self, server_address: str, prompt_id: str) -> List[io.BytesIO]:
+        """
+        Baixa todas as imagens de saída do prompt (todos os nodes SaveImage e todo
+        o batch), com as requisições /view em paralelo. A ordem é estável:
+        por node_id e, dentro do node, pela ordem do batch. Previews ('temp')
+        só são usados quando o workflow não tem nenhuma saída 'output'.
+        """
         hist = self.get_history(server_address, prompt_id).get(prompt_id, {})
-        out = {}
-        for nid, outnode in (hist.get("outputs") or {}).items():
-            imgs = outnode.get("images") or []
-            if imgs:
-                out[nid] = [
-                    self.get_image(
-                        server_address,
-                        i["filename"],
-                        i["subfolder"],
-                        i["type"],
-                    )
-                    for i in imgs
-                ]
+        outputs = hist.get("outputs") or {}
+        # ids numéricos em ordem numérica ("9" antes de "12")
+        node_order = sorted(outputs, key=lambda n: (0, int(n), "") if str(n).isdigit() else (1, 0, str(n)))
+        refs = [i for nid in node_order for i in (outputs[nid].get("images") or [])]
+        saved = [i for i in refs if i.get("type") == "output"]
+        refs = saved or refs
+        if not refs:
+            raise RuntimeError("Nenhuma imagem encontrada para salvar.")
+
+        with ThreadPoolExecutor(max_workers=min(len(refs), self.VIEW_FETCH_CONCURRENCY)) as pool:
+            images = list(pool.map(lambda i: self._fetch_view(server_address, i), refs))
+        return [self._as_png_buffer(b) for b in images]
+
+    def _fetch_view(self, server_address: str, ref: dict) -> bytes:
+        with metrics.timed(metrics.VIEW_FETCH):
+            return self.get_image(server_address, ref["filename"], ref["subfolder"], ref["type"])
 
-        # 5) combina em um único buffer (implementação já existente na classe)
-        return self.save_image_buffer(out)
+    @staticmethod
+    def _as_png_buffer(img_bytes: bytes) -> io.BytesIO:
+        """PNG vindo do ComfyUI segue como está; outros formatos são convertidos."""
+        if img_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+            return io.BytesIO(img_bytes)
+        buf = io.BytesIO()
+        with metrics.timed(metrics.TRANSCODE):
+            Image.open(io.BytesIO(img_bytes)).save(buf, format="PNG", optimize=True)
+        buf.seek(0)
+        return buf
@@ -0,0 +1,96 @@
+import asyncio
+import random
+import socket
+import urllib.error
+
+from typing import Optional
+
+import requests
+import websocket
+
+from core.multi_comfyui_api import ComfyUiExecutionError, ComfyUiInterrupted, ComfyUiPromptError
+from core.workflow_params import WorkflowParamError
+
+
+# classes de falha
+TRANSIENT = "transient"   # rede, timeout, servidor inacessível
+SERVER = "server"         # ComfyUI aceitou o prompt mas a execução falhou (execution_error, OOM)
+PERMANENT = "permanent"   # entrada inválida, arquivo inexistente no storage
+
+PERMANENT_STORAGE_CODES = {"NoSuchKey", "404", "NotFound", "InvalidObjectState"}
+
+
+class RetryPolicy:
+    """
+    Backoff exponencial com "full jitter": o atraso da tentativa n é sorteado
+    em [0, min(max_delay, base_delay * factor ** (n - 1))].
+    """
+
+    def __init__(self, max_attempts: int, base_delay: float = 0.0, max_delay: float = 0.0, factor: float = 2.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.factor = factor
+
+    def should_retry(self, attempt: int) -> bool:
+        return attempt < self.max_attempts
+
+    def next_delay(self, attempt: int) -> float:
+        cap = min(self.max_delay, self.base_delay * (self.factor ** max(attempt - 1, 0)))
+        return random.uniform(0, cap)
+
+
+POLICIES = {
+    TRANSIENT: RetryPolicy(max_attempts=5, base_delay=2.0, max_delay=60.0),
+    SERVER: RetryPolicy(max_attempts=3, base_delay=5.0, max_delay=120.0),
+    PERMANENT: RetryPolicy(max_attempts=1),
+}
+
+
+def _storage_error_code(exc: BaseException) -> Optional[str]:
+    """Código de erro de um botocore ClientError, sem importar o botocore."""
+    response = getattr(exc, "response", None)
+    if isinstance(response, dict):
+        return str(response.get("Error", {}).get("Code", "")) or None
+    return None
+
+
+def classify_failure(exc: Optional[BaseException], stage: str = "") -> str:
+    """
+    Classifica a falha de uma tentativa em TRANSIENT, SERVER ou PERMANENT.
+
+    :param exc: Exceção que causou a falha (None quando só há a mensagem).
+    :param stage: Etapa do pipeline ('load_workflow', 'download_input', 'generate', 'upload_output', 'processing').
+    """
+    if stage == "load_workflow":
+        # workflow removido ou inválido: nenhuma nova tentativa resolve
+        return PERMANENT
+    if isinstance(exc, (ComfyUiPromptError, WorkflowParamError)):
+        return PERMANENT
+    if isinstance(exc, ComfyUiInterrupted):
+        # cancelamento do usuário ou prazo: não é defeito do servidor nem vale repetir
+        return PERMANENT
+    if isinstance(exc, ComfyUiExecutionError):
+        return SERVER
+    if isinstance(exc, FileNotFoundError) or _storage_error_code(exc) in PERMANENT_STORAGE_CODES:
+        return PERMANENT
+    if stage == "download_input" and isinstance(exc, (ValueError, RuntimeError)):
+        # corpo vazio ou chave inválida: tentar de novo não resolve
+        return PERMANENT
+    if isinstance(exc, (
+        asyncio.TimeoutError,
+        TimeoutError,
+        ConnectionError,
+        socket.timeout,
+        urllib.error.URLError,
+        requests.ConnectionError,
+        requests.Timeout,
+        websocket.WebSocketException,
+        OSError,
+    )):
+        return TRANSIENT
+    return SERVER
+
+
+def policy_for(failure_class: str) -> RetryPolicy:
+    return POLICIES.get(failure_class, POLICIES[SERVER])
@@ -0,0 +1,203 @@
+import json
+import time
+
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BREAKERS_KEY = "comfyui:breakers"
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker de um servidor ComfyUI.
+
+    - closed: recebe jobs normalmente; abre quando a taxa de erro da janela
+      (`window_seconds`) passa de `error_rate_threshold` com pelo menos
+      `min_samples` amostras, ou após `max_consecutive_timeouts` timeouts seguidos.
+    - open: não recebe jobs por `cooldown` segundos (dobra a cada nova abertura
+      seguida, até `max_cooldown`).
+    - half_open: libera um único job de teste; sucesso fecha, falha reabre.
+    """
+
+    def __init__(
+        self,
+        window_seconds: float = 300.0,
+        min_samples: int = 4,
+        error_rate_threshold: float = 0.5,
+        max_consecutive_timeouts: int = 3,
+        cooldown: float = 30.0,
+        max_cooldown: float = 300.0,
+        probe_timeout: float = 300.0,
+    ):
+        self.window_seconds = window_seconds
+        self.min_samples = min_samples
+        self.error_rate_threshold = error_rate_threshold
+        self.max_consecutive_timeouts = max_consecutive_timeouts
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.probe_timeout = probe_timeout
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        self.consecutive_timeouts = 0
+        self.probe_started_at: Optional[float] = None
+        self.latency_ema: Optional[float] = None
+        self._samples = deque()  # (timestamp, ok)
+
+    def _prune(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    def _current_cooldown(self) -> float:
+        return min(self.max_cooldown, self.cooldown * (2 ** max(self.trips - 1, 0)))
+
+    def _refresh(self, now: float) -> None:
+        if self.state == OPEN and now - self.opened_at >= self._current_cooldown():
+            self.state = HALF_OPEN
+            self.probe_started_at = None
+        if self.state == HALF_OPEN and self.probe_started_at and now - self.probe_started_at > self.probe_timeout:
+            # o job de teste nunca reportou: libera outro
+            self.probe_started_at = None
+
+    def _trip(self, now: float) -> None:
+        self.state = OPEN
+        self.opened_at = now
+        self.trips += 1
+        self.probe_started_at = None
+
+    def error_rate(self, now: Optional[float] = None) -> float:
+        self._prune(time.time() if now is None else now)
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok in self._samples if not ok) / len(self._samples)
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        """True se o servidor pode receber um job agora."""
+        now = time.time() if now is None else now
+        self._refresh(now)
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN:
+            return self.probe_started_at is None
+        return False
+
+    def acquire(self, now: Optional[float] = None) -> None:
+        """Marca que um job foi despachado (em half_open, ele é o job de teste)."""
+        now = time.time() if now is None else now
+        self._refresh(now)
+        if self.state == HALF_OPEN:
+            self.probe_started_at = now
+
+    def record_success(self, duration: Optional[float] = None, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._samples.append((now, True))
+        self._prune(now)
+        self.consecutive_timeouts = 0
+        if duration is not None:
+            self.latency_ema = duration if self.latency_ema is None else 0.8 * self.latency_ema + 0.2 * duration
+        if self.state == HALF_OPEN:
+            self.state = CLOSED
+            self.trips = 0
+            self.probe_started_at = None
+            self._samples.clear()
+
+    def record_reachable(self) -> None:
+        """O servidor respondeu a um probe: zera a sequência de timeouts."""
+        self.consecutive_timeouts = 0
+
+    def record_failure(self, timeout: bool = False, now: Optional[float] = None) -> None:
+        now = time.time() if now is None else now
+        self._samples.append((now, False))
+        self._prune(now)
+        self.consecutive_timeouts = self.consecutive_timeouts + 1 if timeout else 0
+
+        if self.state == HALF_OPEN:
+            self._trip(now)
+        elif self.state == CLOSED and (
+            self.consecutive_timeouts >= self.max_consecutive_timeouts
+            or (len(self._samples) >= self.min_samples and self.error_rate(now) >= self.error_rate_threshold)
+        ):
+            self._trip(now)
+
+    def score(self, now: Optional[float] = None) -> float:
+        """
+        Nota de saúde em [0, 1] usada para ordenar servidores: taxa de sucesso
+        suavizada, penalizada pela latência média. Zero enquanto aberto.
+        """
+        now = time.time() if now is None else now
+        self._refresh(now)
+        if self.state == OPEN:
+            return 0.0
+        self._prune(now)
+        ok = sum(1 for _, s in self._samples if s)
+        success = (ok + 1) / (len(self._samples) + 2)
+        latency_penalty = 1.0 / (1.0 + (self.latency_ema or 0.0) / 60.0)
+        score = success * latency_penalty
+        return score * 0.5 if self.state == HALF_OPEN else score
+
+    def to_dict(self, now: Optional[float] = None) -> dict:
+        now = time.time() if now is None else now
+        return {
+            "state": self.state,
+            "score": round(self.score(now), 3),
+            "error_rate": round(self.error_rate(now), 3),
+            "samples": len(self._samples),
+            "consecutive_timeouts": self.consecutive_timeouts,
+            "trips": self.trips,
+            "latency_ema": round(self.latency_ema, 3) if self.latency_ema is not None else None,
+            "reopen_at": (self.opened_at + self._current_cooldown()) if self.state == OPEN else None,
+        }
+
+
+class ServerHealthRegistry:
+    """Um CircuitBreaker por servidor, criado sob demanda com os mesmos parâmetros."""
+
+    def __init__(self, **breaker_kwargs):
+        self.breaker_kwargs = breaker_kwargs
+        self.breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, server: str) -> CircuitBreaker:
+        breaker = self.breakers.get(server)
+        if breaker is None:
+            breaker = self.breakers[server] = CircuitBreaker(**self.breaker_kwargs)
+        return breaker
+
+    def allow(self, server: str) -> bool:
+        return self.get(server).allow()
+
+    def acquire(self, server: str) -> None:
+        self.get(server).acquire()
+
+    def record_success(self, server: str, duration: Optional[float] = None) -> None:
+        self.get(server).record_success(duration)
+
+    def record_reachable(self, server: str) -> None:
+        self.get(server).record_reachable()
+
+    def record_failure(self, server: str, timeout: bool = False) -> bool:
+        """Registra a falha; retorna True se o breaker mudou de estado."""
+        breaker = self.get(server)
+        previous = breaker.state
+        breaker.record_failure(timeout=timeout)
+        return previous != breaker.state
+
+    def rank(self, servers: Iterable[str]) -> List[str]:
+        """Ordena servidores pela nota de saúde (maior primeiro), mantendo a ordem em empates."""
+        servers = list(servers)
+        return sorted(servers, key=lambda s: -self.get(s).score())
+
+    def snapshot(self) -> Dict[str, dict]:
+        now = time.time()
+        return {server: b.to_dict(now) for server, b in self.breakers.items()}
+
+    async def publish(self, redis) -> None:
+        """Grava o estado dos breakers no Redis para o health-check da API."""
+        snap = self.snapshot()
+        if snap:
+            await redis.hset(BREAKERS_KEY, mapping={s: json.dumps(d) for s, d in snap.items()})
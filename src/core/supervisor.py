@@ -0,0 +1,116 @@
+import asyncio
+import structlog
+
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+
+log = structlog.get_logger()
+
+
+class JobSupervisor:
+    """
+    Grupo de tasks dos jobs em execução no worker.
+
+    Guarda a referência de cada task (por request_id, com o servidor e dados
+    extras como a API e o prompt_id), aplica os limites de jobs em voo
+    (global e por servidor), repassa exceções não tratadas a `on_crash` em vez
+    de deixá-las sumir no loop e, no desligamento, para de aceitar jobs e
+    espera os que estão rodando (ver `drain`). Tarefas auxiliares disparadas
+    sem await (tratamento de crash, cancelamento de prompt, derivadas) passam
+    por `spawn`, que guarda a referência até o fim (o loop só guarda uma fraca).
+
+    :param max_in_flight: Máximo de jobs em voo no processo (0 = sem limite).
+    :param max_per_server: Máximo de jobs em voo por servidor ComfyUI.
+    :param on_crash: Corrotina chamada com (request_id, exceção) quando a task do job quebra.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 0,
+        max_per_server: int = 1,
+        on_crash: Optional[Callable[[str, BaseException], Awaitable[None]]] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_per_server = max_per_server
+        self.on_crash = on_crash
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self.background: Set[asyncio.Task] = set()
+        self.draining = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self.jobs)
+
+    def server_load(self, server: str) -> int:
+        return sum(1 for job in self.jobs.values() if job["server"] == server)
+
+    def servers(self) -> set:
+        return {job["server"] for job in self.jobs.values()}
+
+    def can_start(self, server: Optional[str] = None) -> bool:
+        """True se cabe mais um job (no processo e, se informado, no servidor)."""
+        if self.draining:
+            return False
+        if self.max_in_flight and self.in_flight >= self.max_in_flight:
+            return False
+        if server is not None and self.max_per_server and self.server_load(server) >= self.max_per_server:
+            return False
+        return True
+
+    def start(self, request_id: str, server: str, coro: Awaitable[None], **info: Any) -> asyncio.Task:
+        task = asyncio.create_task(coro, name=f"job:{request_id}")
+        self.jobs[request_id] = {"task": task, "server": server, **info}
+        task.add_done_callback(lambda t: self._finished(request_id, t))
+        return task
+
+    def spawn(self, coro: Awaitable[Any], name: Optional[str] = None) -> asyncio.Task:
+        """Roda uma tarefa auxiliar em background, mantendo a referência até ela terminar."""
+        task = asyncio.create_task(coro, name=name)
+        self.background.add(task)
+        task.add_done_callback(self._background_done)
+        return task
+
+    def _background_done(self, task: asyncio.Task) -> None:
+        self.background.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            log.error("worker.background_task_failed", task=task.get_name(), error=repr(task.exception()))
+
+    def _finished(self, request_id: str, task: asyncio.Task) -> None:
+        if self.jobs.get(request_id, {}).get("task") is task:
+            del self.jobs[request_id]
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            log.error("worker.job_task_crashed", request_id=request_id, error=repr(exc), exc_info=exc)
+            if self.on_crash:
+                self.spawn(self.on_crash(request_id, exc), name=f"crash:{request_id}")
+
+    def get(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(request_id)
+
+    def pop(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Tira o job do grupo (o done-callback da task não o conta mais)."""
+        return self.jobs.pop(request_id, None)
+
+    def __contains__(self, request_id: str) -> bool:
+        return request_id in self.jobs
+
+    async def wait(self, timeout: Optional[float] = None) -> None:
+        """Espera até algum job terminar (ou `timeout`)."""
+        tasks = [job["task"] for job in self.jobs.values()]
+        if tasks:
+            await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+    async def wait_background(self, timeout: Optional[float] = None) -> None:
+        """Espera as tarefas auxiliares em andamento (ou `timeout`)."""
+        if self.background:
+            await asyncio.wait(list(self.background), timeout=timeout)
+
+    def cancel_all(self) -> List[tuple]:
+        """Cancela as tasks restantes e devolve [(request_id, dados do job)]."""
+        leftover = list(self.jobs.items())
+        self.jobs.clear()
+        for _, job in leftover:
+            job["task"].cancel()
+        return leftover
@@ -0,0 +1,109 @@
+import sentry_sdk
+
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from core import metrics
+
+
+# campos do hash job:{id} (e do payload da fila) com o contexto do trace de origem
+TRACE_FIELD = "sentry_trace"
+BAGGAGE_FIELD = "baggage"
+
+# rotas que não valem um trace (health checks, scrape do Prometheus, estáticos)
+UNTRACED_PREFIXES = ("/alive", "/metrics", "/assets", "/image/")
+
+
+def make_traces_sampler(rate: float):
+    """
+    Sampler do Sentry: segue a decisão do trace pai (o worker herda a da
+    rota que criou o job), ignora health checks e estáticos e amostra o
+    restante com `rate`.
+    """
+    def sampler(ctx: Dict[str, Any]) -> float:
+        parent = ctx.get("parent_sampled")
+        if parent is not None:
+            return float(parent)
+        path = (ctx.get("asgi_scope") or {}).get("path") or ""
+        if path.startswith(UNTRACED_PREFIXES):
+            return 0.0
+        return rate
+
+    return sampler
+
+
+def init_sentry(dsn: Optional[str], traces_sample_rate: float, **kwargs) -> None:
+    sentry_sdk.init(dsn=dsn, traces_sampler=make_traces_sampler(traces_sample_rate), **kwargs)
+
+
+def trace_fields() -> Dict[str, str]:
+    """Contexto do trace atual para gravar junto com o job (vazio se não houver)."""
+    fields = {TRACE_FIELD: sentry_sdk.get_traceparent(), BAGGAGE_FIELD: sentry_sdk.get_baggage()}
+    return {k: v for k, v in fields.items() if v}
+
+
+@contextmanager
+def job_transaction(job_data: Dict[str, Any], name: str, **data):
+    """
+    Retoma no worker o trace salvo no job (ver `trace_fields`). Cada tentativa
+    vira uma transação `queue.process` filha do span `queue.publish` da rota,
+    em um escopo isolado para não misturar jobs que rodam em paralelo.
+    """
+    headers = {
+        "sentry-trace": job_data.get(TRACE_FIELD) or "",
+        "baggage": job_data.get(BAGGAGE_FIELD) or "",
+    }
+    with sentry_sdk.isolation_scope():
+        transaction = sentry_sdk.continue_trace(headers, op="queue.process", name=name)
+        with sentry_sdk.start_transaction(transaction) as tx:
+            for key, value in data.items():
+                tx.set_data(key, value)
+            yield tx
+
+
+@contextmanager
+def stage(name: str):
+    """Etapa do pipeline: span no trace atual + histograma STAGE_SECONDS."""
+    with sentry_sdk.start_span(op="job.stage", name=name), metrics.timed(name):
+        yield
+
+
+class NodeSpans:
+    """
+    Um span por node executado no ComfyUI, a partir dos eventos `executing`
+    do websocket: cada evento abre o span do node e fecha o anterior; o
+    evento com node None (fim do prompt) fecha o último.
+    """
+
+    def __init__(self, prompt: dict):
+        self.prompt = prompt
+        self.parent = sentry_sdk.get_current_span()
+        self.current = None
+
+    def executing(self, node: Optional[str]) -> None:
+        self.finish()
+        if node is None or self.parent is None:
+            return
+        class_type = self.prompt.get(str(node), {}).get("class_type", "")
+        self.current = self.parent.start_child(op="comfyui.node", name=f"{node} {class_type}".strip())
+        self.current.set_data("node_id", str(node))
+
+    def cached(self, nodes) -> None:
+        if self.parent is not None and nodes:
+            self.parent.set_data("comfyui.cached_nodes", list(nodes))
+
+    def finish(self, status: Optional[str] = None) -> None:
+        if self.current is not None:
+            if status:
+                self.current.set_status(status)
+            self.current.finish()
+            self.current = None
+
+
+def mark_failed(stage_name: str, failure_class: str) -> None:
+    """Marca o span atual (a transação do job, no worker) como falho."""
+    span = sentry_sdk.get_current_span()
+    if span is not None:
+        span.set_status("internal_error")
+        span.set_tag("job.failed_stage", stage_name)
+        span.set_tag("job.failure_class", failure_class)
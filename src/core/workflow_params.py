@@ -0,0 +1,212 @@
+import copy
+import json
+import math
+import os
+import random
+import threading
+
+from typing import Any, Dict, List, Literal, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+PARAMS_SUFFIX = ".params.json"
+SEED_MAX = 2**32 - 1
+RANDOM_SEED = -1
+
+
+class WorkflowParamError(ValueError):
+    """Parâmetros do job não batem com o schema do workflow."""
+
+
+class ParamSpec(BaseModel):
+    """
+    Um parâmetro do workflow: nome público -> input de um node do prompt.
+
+    `type` "seed" aceita um inteiro ou -1 (sorteia uma seed a cada job);
+    vazio mantém o valor do template.
+    """
+
+    type: Literal["int", "float", "str", "bool", "seed"]
+    node: str
+    input: str
+    default: Optional[Any] = None
+    min: Optional[float] = None
+    max: Optional[float] = None
+    max_length: Optional[int] = None
+    choices: Optional[List[Any]] = None
+    description: str = ""
+
+
+def params_path(workflow_path: str) -> str:
+    """Arquivo de schema ao lado do workflow (ex.: foo.json -> foo.params.json)."""
+    return os.path.splitext(workflow_path)[0] + PARAMS_SUFFIX
+
+
+def default_schema(template: dict, node_id_ksampler: str, node_id_text_input: str) -> Dict[str, ParamSpec]:
+    """
+    Schema usado quando o workflow não tem arquivo `.params.json`: expõe seed e
+    strength do node KSampler e o texto do node de prompt configurados no .env,
+    se esses nodes existirem no workflow.
+    """
+    schema: Dict[str, ParamSpec] = {}
+    sampler = template.get(node_id_ksampler, {}).get("inputs", {})
+    for seed_input in ("seed", "noise_seed"):
+        if seed_input in sampler:
+            schema["seed"] = ParamSpec(type="seed", node=node_id_ksampler, input=seed_input)
+            break
+    if "denoise" in sampler:
+        schema["strength"] = ParamSpec(type="float", node=node_id_ksampler, input="denoise", min=0.0, max=1.0)
+    if "text" in template.get(node_id_text_input, {}).get("inputs", {}):
+        schema["prompt"] = ParamSpec(type="str", node=node_id_text_input, input="text", max_length=4000)
+    return schema
+
+
+def load_schema(workflow_path: str, template: dict, node_id_ksampler: str, node_id_text_input: str) -> Dict[str, ParamSpec]:
+    """
+    Lê o schema do arquivo `.params.json` do workflow, se existir, e confere
+    que cada parâmetro aponta para um input existente no template.
+    """
+    path = params_path(workflow_path)
+    if not os.path.isfile(path):
+        return default_schema(template, node_id_ksampler, node_id_text_input)
+
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    schema = {name: ParamSpec(**spec) for name, spec in raw.get("params", {}).items()}
+    for name, spec in schema.items():
+        if spec.input not in template.get(spec.node, {}).get("inputs", {}):
+            raise WorkflowParamError(f"{path}: '{name}' aponta para {spec.node}.{spec.input}, que não existe no workflow")
+    return schema
+
+
+def _coerce(name: str, spec: ParamSpec, value: Any) -> Any:
+    try:
+        if spec.type == "seed":
+            if value in (None, ""):
+                return None
+            value = int(value)
+            if value == RANDOM_SEED:
+                return value
+            if not 0 <= value <= SEED_MAX:
+                raise WorkflowParamError(f"'{name}' deve estar entre 0 e {SEED_MAX}")
+            return value
+        if spec.type == "int":
+            if isinstance(value, float) and not value.is_integer():
+                raise ValueError
+            value = int(value)
+        elif spec.type == "float":
+            value = float(value)
+            if not math.isfinite(value):
+                # nan/inf passam por qualquer comparação com min/max
+                raise ValueError
+        elif spec.type == "bool":
+            if isinstance(value, str):
+                if value.lower() not in ("true", "false", "1", "0"):
+                    raise ValueError
+                value = value.lower() in ("true", "1")
+            else:
+                value = bool(value)
+        else:
+            value = str(value)
+    except (TypeError, ValueError, OverflowError):
+        raise WorkflowParamError(f"'{name}' deve ser do tipo {spec.type}")
+
+    if spec.min is not None and value < spec.min:
+        raise WorkflowParamError(f"'{name}' deve ser >= {spec.min}")
+    if spec.max is not None and value > spec.max:
+        raise WorkflowParamError(f"'{name}' deve ser <= {spec.max}")
+    if spec.max_length is not None and len(value) > spec.max_length:
+        raise WorkflowParamError(f"'{name}' excede {spec.max_length} caracteres")
+    if spec.choices is not None and value not in spec.choices:
+        raise WorkflowParamError(f"'{name}' deve ser um de {spec.choices}")
+    return value
+
+
+def validate_params(schema: Dict[str, ParamSpec], params: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Valida e converte os parâmetros enviados pelo cliente.
+
+    :raises WorkflowParamError: Parâmetro desconhecido, tipo errado ou fora dos limites.
+    """
+    params = params or {}
+    if not isinstance(params, dict):
+        raise WorkflowParamError("params deve ser um objeto JSON")
+    unknown = sorted(set(params) - set(schema))
+    if unknown:
+        raise WorkflowParamError(f"parâmetros desconhecidos: {', '.join(unknown)} (aceitos: {', '.join(sorted(schema)) or 'nenhum'})")
+    return {name: _coerce(name, schema[name], value) for name, value in params.items()}
+
+
+def apply_params(prompt: dict, schema: Dict[str, ParamSpec], params: Dict[str, Any]) -> dict:
+    """
+    Aplica os parâmetros (já validados) e os defaults do schema ao prompt, in-place.
+    Seeds -1 são sorteadas a cada chamada; sem valor, fica o do template.
+    """
+    for name, spec in schema.items():
+        value = params.get(name, spec.default)
+        if spec.type == "seed" and value == RANDOM_SEED:
+            value = random.randint(0, SEED_MAX)
+        if value is None:
+            continue
+        prompt[spec.node]["inputs"][spec.input] = value
+    return prompt
+
+
+def parse_params_field(raw: Optional[str]) -> Dict[str, Any]:
+    """Converte o campo de formulário `params` (JSON) em dict."""
+    if not raw:
+        return {}
+    try:
+        value = json.loads(raw)
+    except ValueError:
+        raise WorkflowParamError("params não é um JSON válido")
+    if not isinstance(value, dict):
+        raise WorkflowParamError("params deve ser um objeto JSON")
+    return value
+
+
+class WorkflowTemplates:
+    """
+    Cache de templates de workflow e respectivos schemas, recarregados só
+    quando o arquivo (ou o `.params.json`) muda.
+    """
+
+    def __init__(self, node_id_ksampler: str, node_id_text_input: str):
+        self.node_id_ksampler = node_id_ksampler
+        self.node_id_text_input = node_id_text_input
+        self._cache: Dict[str, Tuple[tuple, dict, Dict[str, ParamSpec]]] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stamp(workflow_path: str) -> tuple:
+        sidecar = params_path(workflow_path)
+        return (
+            os.stat(workflow_path).st_mtime_ns,
+            os.stat(sidecar).st_mtime_ns if os.path.isfile(sidecar) else None,
+        )
+
+    def get(self, workflow_path: str) -> Tuple[dict, Dict[str, ParamSpec]]:
+        """(template, schema) do workflow. O template não deve ser alterado: use `build_prompt`."""
+        stamp = self._stamp(workflow_path)
+        with self._lock:
+            cached = self._cache.get(workflow_path)
+            if cached and cached[0] == stamp:
+                return cached[1], cached[2]
+        with open(workflow_path, "r", encoding="utf-8") as f:
+            template = json.load(f)
+        schema = load_schema(workflow_path, template, self.node_id_ksampler, self.node_id_text_input)
+        with self._lock:
+            self._cache[workflow_path] = (stamp, template, schema)
+        return template, schema
+
+    def schema(self, workflow_path: str) -> Dict[str, ParamSpec]:
+        return self.get(workflow_path)[1]
+
+    def build_params(self, workflow_path: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Valida `params` contra o schema do workflow (sem montar o prompt)."""
+        return validate_params(self.schema(workflow_path), params)
+
+    def build_prompt(self, workflow_path: str, params: Optional[Dict[str, Any]] = None) -> dict:
+        template, schema = self.get(workflow_path)
+        return apply_params(copy.deepcopy(template), schema, validate_params(schema, params))
@@ -1,122 +1,426 @@
+"""
+Simulador do ComfyUI para desenvolvimento e testes de carga.
+
+Imita as chamadas usadas pelo backend (`/upload/image`, `/prompt`, `/history`,
+`/view`, `/queue`, `/interrupt` e o WebSocket `/ws`) com fila FIFO de verdade
+(um prompt executando por servidor), eventos `execution_start`, `executing`,
+`progress`, `executed`, `execution_error` e tempos de execução sorteados de
+uma distribuição configurável. Falhas, lentidão e quedas de websocket podem ser
+injetadas na inicialização ou em tempo de execução via `POST /sim/faults`.
+
+Um servidor (compatível com o uso antigo):
+
+    uvicorn dummy_comfyui_server:app --app-dir src --port 8188
+
+Vários servidores no mesmo processo (portas 8188, 8189, ...):
+
+    python src/dummy_comfyui_server.py --servers 4 --latency lognormal:8,0.3 --error-rate 0.02
+"""
 import os
 import io
+import math
+import time
+import random
 import asyncio
+import argparse
+from contextlib import asynccontextmanager
 from uuid import uuid4
-from typing import Dict, Any
+from typing import Any, Dict, List, Optional
 
 from fastapi import FastAPI, UploadFile, File, Form, WebSocket, WebSocketDisconnect, Response
 from PIL import Image, ImageDraw
 
+
 PROCESSING_DELAY = float(os.getenv("DEFAULT_PROCESSING_TIME", "1000")) / 1000.0
 
-app = FastAPI()
 
-uploaded_images: Dict[str, bytes] = {}
-jobs: Dict[str, Dict[str, Any]] = {}
-websockets: Dict[str, WebSocket] = {}
-queue_running: bool = False
+class LatencyDist:
+    """
+    Distribuição do tempo de execução de um prompt, em segundos.
+
+    Formatos aceitos em `parse`: "fixed:8", "uniform:5,12", "normal:8,1.5",
+    "lognormal:8,0.3" (mediana, sigma) e "exp:8" (média). Nunca retorna
+    menos que `minimum`.
+    """
+
+    KINDS = ("fixed", "uniform", "normal", "lognormal", "exp")
 
+    def __init__(self, kind: str, a: float, b: float = 0.0, minimum: float = 0.05):
+        if kind not in self.KINDS:
+            raise ValueError(f"distribuição desconhecida: {kind}")
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self.minimum = minimum
 
-@app.post("/upload/image")
-async def upload_image(image: UploadFile = File(...), subfolder: str = Form(""), overwrite: str = Form("false")):
-    content = await image.read()
-    filename = f"{uuid4().hex}.png"
-    uploaded_images[filename] = content
-    return {"name": filename, "subfolder": subfolder}
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyDist":
+        kind, _, args = (spec or "").partition(":")
+        if not args:
+            # só um número: atraso fixo (compatível com DEFAULT_PROCESSING_TIME)
+            return cls("fixed", float(kind))
+        values = [float(v) for v in args.split(",")]
+        return cls(kind, values[0], values[1] if len(values) > 1 else 0.0)
 
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "fixed":
+            value = self.a
+        elif self.kind == "uniform":
+            value = rng.uniform(self.a, self.b)
+        elif self.kind == "normal":
+            value = rng.gauss(self.a, self.b)
+        elif self.kind == "lognormal":
+            value = self.a * math.exp(rng.gauss(0.0, self.b))
+        else:
+            value = rng.expovariate(1.0 / self.a)
+        return max(value, self.minimum)
 
-@app.post("/prompt")
-async def prompt_endpoint(payload: Dict[str, Any]):
-    prompt = payload.get("prompt", {})
-    client_id = payload.get("client_id")
-    prompt_id = uuid4().hex
+    def __repr__(self) -> str:
+        return f"{self.kind}:{self.a},{self.b}"
 
-    image_path = None
-    for node in prompt.values():
-        if isinstance(node, dict) and "inputs" in node and "image" in node["inputs"]:
-            image_path = node["inputs"]["image"]
-            break
 
-    jobs[prompt_id] = {"status": "processing", "outputs": {}}
-    global queue_running
-    queue_running = True
+class Faults:
+    """Falhas injetáveis (alteráveis em tempo de execução via /sim/faults)."""
 
-    asyncio.create_task(process_job(prompt_id, client_id, image_path))
-    return {"prompt_id": prompt_id}
+    def __init__(self, error_rate: float = 0.0, disconnect_rate: float = 0.0, slowdown: float = 1.0, down: bool = False):
+        self.error_rate = error_rate            # fração dos prompts que terminam em execution_error
+        self.disconnect_rate = disconnect_rate  # fração dos prompts em que o websocket cai no meio
+        self.slowdown = slowdown                # multiplicador do tempo de execução
+        self.down = down                        # servidor "fora do ar": HTTP 503 em tudo
 
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
 
-async def process_job(prompt_id: str, client_id: str, image_path: str):
-    await asyncio.sleep(PROCESSING_DELAY)
 
-    img_bytes = None
-    if image_path:
-        key = os.path.basename(image_path)
-        img_bytes = uploaded_images.get(key)
+class SimulatedComfyUI:
+    """
+    Estado de um servidor simulado: imagens enviadas, histórico, websockets
+    por client_id e a fila de prompts, executada por uma única task.
+    """
 
-    if not img_bytes:
-        img = Image.new("RGB", (512, 512), color="white")
-    else:
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    def __init__(
+        self,
+        latency: LatencyDist,
+        steps: int = 20,
+        faults: Optional[Faults] = None,
+        seed: Optional[int] = None,
+        name: str = "sim",
+    ):
+        self.latency = latency
+        self.steps = steps
+        self.faults = faults or Faults()
+        self.rng = random.Random(seed)
+        self.name = name
+        self.images: Dict[str, bytes] = {}
+        self.history: Dict[str, Dict[str, Any]] = {}
+        self.sockets: Dict[str, Any] = {}
+        self.pending: List[Dict[str, Any]] = []
+        self.running: Optional[Dict[str, Any]] = None
+        self.number = 0
+        self.completed = 0
+        self.failed = 0
+        self._wakeup = asyncio.Event()
+        self._interrupted = False
 
-    draw = ImageDraw.Draw(img)
-    draw.text((10, 10), "dummy", fill=(255, 0, 0))
+    # ---------- fila ----------
 
-    buf = io.BytesIO()
-    img.save(buf, format="PNG")
-    data = buf.getvalue()
-    out_name = f"{uuid4().hex}.png"
-    uploaded_images[out_name] = data
+    def enqueue(self, prompt: dict, client_id: Optional[str]) -> Dict[str, Any]:
+        item = {"prompt_id": uuid4().hex, "number": self.number, "prompt": prompt, "client_id": client_id}
+        self.number += 1
+        self.pending.append(item)
+        self._wakeup.set()
+        return item
 
-    jobs[prompt_id] = {
-        "status": "complete",
-        "outputs": {
-            "0": {
-                "images": [
-                    {"filename": out_name, "subfolder": "", "type": "output"}
-                ]
-            }
-        },
-    }
+    def delete(self, prompt_ids) -> None:
+        self.pending = [p for p in self.pending if p["prompt_id"] not in set(prompt_ids)]
 
-    global queue_running
-    queue_running = False
+    def interrupt(self) -> None:
+        if self.running is not None:
+            self._interrupted = True
 
-    ws = websockets.get(client_id)
-    if ws:
+    def queue_status(self) -> Dict[str, Any]:
+        """Mesmo formato do /queue do ComfyUI: listas [number, prompt_id, prompt, extra, outputs]."""
+        def entry(p):
+            return [p["number"], p["prompt_id"], {}, {"client_id": p["client_id"]}, []]
+        return {
+            "queue_running": [entry(self.running)] if self.running else [],
+            "queue_pending": [entry(p) for p in self.pending],
+        }
+
+    async def run(self) -> None:
+        """Executa os prompts da fila, um por vez, em ordem de chegada."""
+        while True:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            self.running = self.pending.pop(0)
+            try:
+                await self.execute(self.running)
+            finally:
+                self.running = None
+                self._interrupted = False
+
+    # ---------- execução ----------
+
+    async def send(self, client_id: Optional[str], message: Dict[str, Any]) -> None:
+        ws = self.sockets.get(client_id)
+        if ws is None:
+            return
         try:
-            await ws.send_json({"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+            await ws.send_json(message)
         except Exception:
+            self.sockets.pop(client_id, None)
+
+    async def drop_socket(self, client_id: Optional[str]) -> None:
+        ws = self.sockets.pop(client_id, None)
+        if ws is not None:
+            try:
+                await ws.close(code=1011)
+            except Exception:
+                pass
+
+    @staticmethod
+    def _plan(prompt: dict):
+        """(ordem dos nodes, node do sampler, nodes SaveImage, batch_size) do prompt."""
+        order = sorted(prompt, key=lambda n: (0, int(n), "") if str(n).isdigit() else (1, 0, str(n)))
+        sampler = next((n for n in order if "steps" in prompt[n].get("inputs", {})), order[-1] if order else None)
+        outputs = [n for n in order if prompt[n].get("class_type") == "SaveImage"] or ["0"]
+        batch = 1
+        for n in order:
+            value = prompt[n].get("inputs", {}).get("batch_size")
+            if isinstance(value, int):
+                batch = max(batch, value)
+        return order, sampler, outputs, batch
+
+    async def execute(self, item: Dict[str, Any]) -> None:
+        prompt_id, client_id, prompt = item["prompt_id"], item["client_id"], item["prompt"]
+        order, sampler, outputs, batch = self._plan(prompt)
+        duration = self.latency.sample(self.rng) * self.faults.slowdown
+        fail_at = self.rng.random() * duration if self.rng.random() < self.faults.error_rate else None
+        drop_at = self.rng.random() * duration if self.rng.random() < self.faults.disconnect_rate else None
+        started = time.monotonic()
+
+        await self.send(client_id, {"type": "execution_start", "data": {"prompt_id": prompt_id}})
+        await self.send(client_id, {"type": "execution_cached", "data": {"nodes": [], "prompt_id": prompt_id}})
+
+        # quase todo o tempo fica no sampler, com um evento `progress` por step
+        other = [n for n in order if n != sampler]
+        per_node = duration * 0.1 / max(len(other), 1)
+        per_step = duration * (0.9 if other else 1.0) / max(self.steps, 1)
+        for node in order:
+            await self.send(client_id, {"type": "executing", "data": {"node": node, "prompt_id": prompt_id}})
+            ticks = self.steps if node == sampler else 1
+            for step in range(1, ticks + 1):
+                await asyncio.sleep(per_step if node == sampler else per_node)
+                elapsed = time.monotonic() - started
+                if self._interrupted:
+                    self.history[prompt_id] = {"status": {"status_str": "error", "completed": False}, "outputs": {}}
+                    await self.send(client_id, {"type": "execution_interrupted", "data": {
+                        "prompt_id": prompt_id, "node_id": node, "node_type": prompt[node].get("class_type", ""),
+                    }})
+                    return
+                if drop_at is not None and elapsed >= drop_at:
+                    drop_at = None
+                    await self.drop_socket(client_id)
+                if fail_at is not None and elapsed >= fail_at:
+                    self.failed += 1
+                    self.history[prompt_id] = {"status": {"status_str": "error", "completed": False}, "outputs": {}}
+                    await self.send(client_id, {"type": "execution_error", "data": {
+                        "prompt_id": prompt_id,
+                        "node_id": node,
+                        "node_type": prompt[node].get("class_type", ""),
+                        "exception_type": "torch.cuda.OutOfMemoryError",
+                        "exception_message": "simulated failure",
+                    }})
+                    return
+                if node == sampler:
+                    await self.send(client_id, {"type": "progress", "data": {
+                        "value": step, "max": ticks, "prompt_id": prompt_id, "node": node,
+                    }})
+
+        history_outputs = {}
+        source = self._input_image(prompt)
+        for node in outputs:
+            refs = []
+            for i in range(batch):
+                name = f"{uuid4().hex}.png"
+                self.images[name] = self._render(source, f"{self.name} #{item['number']} [{i}]")
+                refs.append({"filename": name, "subfolder": "", "type": "output"})
+            history_outputs[node] = {"images": refs}
+            await self.send(client_id, {"type": "executed", "data": {
+                "node": node, "output": {"images": refs}, "prompt_id": prompt_id,
+            }})
+        self.history[prompt_id] = {"status": {"status_str": "success", "completed": True}, "outputs": history_outputs}
+        self.completed += 1
+        await self.send(client_id, {"type": "executing", "data": {"node": None, "prompt_id": prompt_id}})
+        await self.send(client_id, {"type": "execution_success", "data": {"prompt_id": prompt_id}})
+
+    def _input_image(self, prompt: dict) -> Optional[bytes]:
+        for node in prompt.values():
+            image = node.get("inputs", {}).get("image") if isinstance(node, dict) else None
+            if isinstance(image, str):
+                return self.images.get(os.path.basename(image))
+        return None
+
+    @staticmethod
+    def _render(source: Optional[bytes], label: str) -> bytes:
+        img = Image.open(io.BytesIO(source)).convert("RGB") if source else Image.new("RGB", (512, 512), color="white")
+        draw = ImageDraw.Draw(img)
+        draw.text((10, 10), f"dummy {label}", fill=(255, 0, 0))
+        buf = io.BytesIO()
+        img.save(buf, format="PNG")
+        return buf.getvalue()
+
+
+def create_app(sim: SimulatedComfyUI) -> FastAPI:
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        task = asyncio.create_task(sim.run())
+        yield
+        task.cancel()
+
+    app = FastAPI(lifespan=lifespan)
+    app.state.sim = sim
+
+    @app.middleware("http")
+    async def outage(request, call_next):
+        if sim.faults.down and not request.url.path.startswith("/sim/"):
+            return Response(status_code=503)
+        return await call_next(request)
+
+    @app.post("/upload/image")
+    async def upload_image(image: UploadFile = File(...), subfolder: str = Form(""), overwrite: str = Form("false")):
+        content = await image.read()
+        filename = f"{uuid4().hex}.png"
+        sim.images[filename] = content
+        return {"name": filename, "subfolder": subfolder, "type": "input"}
+
+    @app.post("/prompt")
+    async def prompt_endpoint(payload: Dict[str, Any]):
+        item = sim.enqueue(payload.get("prompt", {}), payload.get("client_id"))
+        return {"prompt_id": item["prompt_id"], "number": item["number"], "node_errors": {}}
+
+    @app.get("/history/{prompt_id}")
+    async def get_history(prompt_id: str):
+        entry = sim.history.get(prompt_id)
+        return {prompt_id: entry} if entry else {}
+
+    @app.get("/view")
+    async def view_image(filename: str, subfolder: str = "", type: str = "output"):
+        data = sim.images.get(filename)
+        if data is None:
+            return Response(status_code=404)
+        return Response(content=data, media_type="image/png")
+
+    @app.get("/queue")
+    async def queue_status():
+        return sim.queue_status()
+
+    @app.post("/queue")
+    async def queue_delete(payload: Dict[str, Any]):
+        if payload.get("clear"):
+            sim.pending.clear()
+        sim.delete(payload.get("delete") or [])
+        return {}
+
+    @app.post("/interrupt")
+    async def interrupt():
+        sim.interrupt()
+        return {}
+
+    @app.get("/sim/stats")
+    async def sim_stats():
+        return {
+            "name": sim.name,
+            "latency": repr(sim.latency),
+            "faults": sim.faults.to_dict(),
+            "pending": len(sim.pending),
+            "running": sim.running is not None,
+            "completed": sim.completed,
+            "failed": sim.failed,
+        }
+
+    @app.post("/sim/faults")
+    async def set_faults(payload: Dict[str, Any]):
+        """Altera as falhas injetadas, ex.: {"slowdown": 3} ou {"down": true}."""
+        for field, value in payload.items():
+            if field == "down":
+                sim.faults.down = bool(value)
+            elif hasattr(sim.faults, field):
+                setattr(sim.faults, field, float(value))
+        if payload.get("drop_sockets"):
+            for client_id in list(sim.sockets):
+                await sim.drop_socket(client_id)
+        return sim.faults.to_dict()
+
+    @app.websocket("/ws")
+    async def websocket_endpoint(websocket: WebSocket, clientId: str = ""):
+        await websocket.accept()
+        sim.sockets[clientId] = websocket
+        await websocket.send_json({"type": "status", "data": {
+            "status": {"exec_info": {"queue_remaining": len(sim.pending) + (sim.running is not None)}},
+            "sid": clientId,
+        }})
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
             pass
+        finally:
+            if sim.sockets.get(clientId) is websocket:
+                sim.sockets.pop(clientId, None)
 
+    return app
 
-@app.get("/history/{prompt_id}")
-async def get_history(prompt_id: str):
-    job = jobs.get(prompt_id, {"status": "processing", "outputs": {}})
-    return {prompt_id: job}
 
+def simulator_from_env(name: str = "sim") -> SimulatedComfyUI:
+    latency = os.getenv("SIM_LATENCY")
+    return SimulatedComfyUI(
+        LatencyDist.parse(latency) if latency else LatencyDist("fixed", PROCESSING_DELAY),
+        steps=int(os.getenv("SIM_STEPS", "20")),
+        faults=Faults(
+            error_rate=float(os.getenv("SIM_ERROR_RATE", "0")),
+            disconnect_rate=float(os.getenv("SIM_DISCONNECT_RATE", "0")),
+            slowdown=float(os.getenv("SIM_SLOWDOWN", "1")),
+        ),
+        name=name,
+    )
 
-@app.get("/view")
-async def view_image(filename: str, subfolder: str = "", type: str = "output"):
-    data = uploaded_images.get(filename)
-    if data is None:
-        return Response(status_code=404)
-    return Response(content=data, media_type="image/png")
 
+app = create_app(simulator_from_env())
 
-@app.get("/queue")
-async def queue_status():
-    return {"queue_running": queue_running}
 
+async def serve(args) -> None:
+    import uvicorn
+
+    servers = []
+    for i in range(args.servers):
+        sim = SimulatedComfyUI(
+            LatencyDist.parse(args.latency),
+            steps=args.steps,
+            faults=Faults(args.error_rate, args.disconnect_rate, args.slowdown),
+            seed=None if args.seed is None else args.seed + i,
+            name=f"sim{i + 1}",
+        )
+        config = uvicorn.Config(create_app(sim), host=args.host, port=args.base_port + i, log_level=args.log_level)
+        servers.append(uvicorn.Server(config))
+    print("ComfyUI simulado em:", ", ".join(f"http://{args.host}:{args.base_port + i}" for i in range(args.servers)))
+    await asyncio.gather(*(s.serve() for s in servers))
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket, clientId: str):
-    await websocket.accept()
-    websockets[clientId] = websocket
-    try:
-        while True:
-            await asyncio.sleep(0.1)
-    except WebSocketDisconnect:
-        pass
-    finally:
-        websockets.pop(clientId, None)
 
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de N servidores ComfyUI")
+    parser.add_argument("--servers", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--base-port", type=int, default=8188)
+    parser.add_argument("--latency", default=os.getenv("SIM_LATENCY", f"fixed:{PROCESSING_DELAY}"),
+                        help="fixed:S | uniform:A,B | normal:MEDIA,DESVIO | lognormal:MEDIANA,SIGMA | exp:MEDIA")
+    parser.add_argument("--steps", type=int, default=20, help="eventos progress por prompt")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--disconnect-rate", type=float, default=0.0)
+    parser.add_argument("--slowdown", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--log-level", default="warning")
+    asyncio.run(serve(parser.parse_args()))
@@ -3,7 +3,7 @@ import { Header } from "../../components/header";
 import * as Styled from "./styles";
 import PlusButton from "../../assets/imgs/bt_mais.png"
 import { useEffect, useRef, useState } from "react";
-import { uploadImage } from "../../services/root";
+import { cancelJob, uploadImage } from "../../services/root";
 import { toast } from "react-toastify";
 import BTGerar from "../../assets/imgs/bt_gerar.png"
 import BTGerarDesk from "../../assets/imgs/bt_gerar_desk.png"
@@ -102,6 +102,12 @@ export const Home = () => {
     const handleUpload = async () => {
         if (!image) return;
 
+        // nova foto: o job anterior, se ainda estiver na fila ou rodando, libera o servidor
+        const previousJobId = localStorage.getItem('job_id');
+        if (previousJobId) {
+            cancelJob(previousJobId).catch(() => undefined);
+        }
+
         try {
             const response = await uploadImage(image, currentProject.projectName);
 
@@ -8,7 +8,7 @@ import { Footer } from '../../components/footer';
 
 
 interface JobStatusResponse {
-    status: 'queued' | 'processing' | 'error' | 'done' | string;
+    status: 'queued' | 'processing' | 'error' | 'done' | 'cancelled' | string;
     image_url?: string;
     error?: string;
 }
@@ -44,6 +44,9 @@ export const Result = () => {
                     case 'error':
                         setStatus(`Erro: ${data.error || 'Erro desconhecido.'}`);
                         return;
+                    case 'cancelled':
+                        setStatus('Job cancelado.');
+                        return;
                     case 'done':
                         setStatus('Imagem pronta!');
                         if (data.image_url) setImageUrl(data.image_url);
@@ -27,3 +27,9 @@ export const getJobStatus = async (jobId: string) => {
 
   return response.data;
 };
+
+export const cancelJob = async (jobId: string) => {
+  const response = await API.delete(`/jobs/${jobId}`);
+
+  return response.data;
+};
@@ -0,0 +1,223 @@
+"""
+Gerador de carga para `/api/upload`.
+
+Envia jobs em taxa-alvo (chegadas de Poisson, ou intervalo constante), em um
+ou mais estágios, acompanha cada um por `/api/result` e reporta vazão fim a
+fim, espera em fila e latência p50/p95/p99. Combinado com o simulador
+(`dummy_comfyui_server.py --servers N`) permite dimensionar uma ativação sem
+GPUs:
+
+    python src/dummy_comfyui_server.py --servers 4 --latency lognormal:8,0.3
+    python src/load_generator.py --base-url http://localhost:5000 --rates 0.2,0.4,0.6 --stage-duration 120
+"""
+import io
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import aiohttp
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Percentil por nearest-rank (q em 0–100); None para lista vazia."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = min(max(math.ceil(q * len(ordered) / 100), 1), len(ordered))
+    return ordered[rank - 1]
+
+
+def _seconds_between(start: Optional[str], end: Optional[str]) -> Optional[float]:
+    if not start or not end:
+        return None
+    return (datetime.fromisoformat(end) - datetime.fromisoformat(start)).total_seconds()
+
+
+def summarize(results: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    """
+    Agrega os resultados de um estágio.
+
+    Cada resultado tem `status` (done, error, cancelled, timeout, rejected), `latency`
+    (envio -> resultado, medido no cliente) e, quando disponíveis, os
+    `timings` devolvidos por /api/result.
+    """
+    done = [r for r in results if r["status"] == "done"]
+    latencies = [r["latency"] for r in done]
+
+    def between(start, end):
+        values = (_seconds_between(r.get("timings", {}).get(start), r.get("timings", {}).get(end)) for r in done)
+        return [v for v in values if v is not None]
+
+    queue_waits = between("enqueued_at", "started_at")
+    service = between("started_at", "finished_at")
+
+    def dist(values):
+        return {f"p{q}": percentile(values, q) for q in (50, 95, 99)} | {"max": max(values) if values else None}
+
+    counts: Dict[str, int] = {}
+    for r in results:
+        counts[r["status"]] = counts.get(r["status"], 0) + 1
+    return {
+        "submitted": len(results),
+        "counts": counts,
+        "throughput": len(done) / duration if duration > 0 else 0.0,
+        "latency": dist(latencies),
+        "queue_wait": dist(queue_waits),
+        "service_time": dist(service),
+        "retries": sum(1 for r in done if r.get("timings", {}).get("attempt", 1) > 1),
+    }
+
+
+def sample_image(size: int = 512) -> bytes:
+    from PIL import Image
+
+    buf = io.BytesIO()
+    Image.new("RGB", (size, size), color=(120, 160, 200)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+class LoadGenerator:
+
+    def __init__(
+        self,
+        base_url: str,
+        image: bytes,
+        workflow: Optional[str] = None,
+        poll_interval: float = 1.0,
+        job_timeout: float = 600.0,
+        max_in_flight: int = 1000,
+        arrivals: str = "poisson",
+        seed: Optional[int] = None,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.image = image
+        self.workflow = workflow
+        self.poll_interval = poll_interval
+        self.job_timeout = job_timeout
+        self.arrivals = arrivals
+        self.rng = random.Random(seed)
+        self._in_flight = asyncio.Semaphore(max_in_flight)
+
+    async def submit(self, session: aiohttp.ClientSession) -> Optional[str]:
+        form = aiohttp.FormData()
+        form.add_field("image", self.image, filename="load.png", content_type="image/png")
+        if self.workflow:
+            form.add_field("workflow", self.workflow)
+            url = f"{self.base_url}/api/uploadwithworkflow"
+        else:
+            url = f"{self.base_url}/api/upload"
+        async with session.post(url, data=form) as r:
+            if r.status != 200:
+                return None
+            return (await r.json())["request_id"]
+
+    async def run_job(self, session: aiohttp.ClientSession) -> Dict[str, Any]:
+        async with self._in_flight:
+            start = time.monotonic()
+            try:
+                request_id = await self.submit(session)
+            except aiohttp.ClientError as e:
+                return {"status": "rejected", "latency": time.monotonic() - start, "error": str(e)}
+            if request_id is None:
+                return {"status": "rejected", "latency": time.monotonic() - start}
+
+            while time.monotonic() - start < self.job_timeout:
+                await asyncio.sleep(self.poll_interval)
+                try:
+                    async with session.get(f"{self.base_url}/api/result", params={"request_id": request_id}) as r:
+                        if r.status != 200:
+                            continue
+                        data = await r.json()
+                except aiohttp.ClientError:
+                    continue
+                if data.get("status") in ("done", "error", "cancelled"):
+                    return {
+                        "request_id": request_id,
+                        "status": data["status"],
+                        "latency": time.monotonic() - start,
+                        "timings": data.get("timings") or {},
+                    }
+            return {"request_id": request_id, "status": "timeout", "latency": time.monotonic() - start}
+
+    def _next_gap(self, rate: float) -> float:
+        if self.arrivals == "constant":
+            return 1.0 / rate
+        return self.rng.expovariate(rate)
+
+    async def run_stage(self, session: aiohttp.ClientSession, rate: float, duration: float) -> Dict[str, Any]:
+        """Envia jobs a `rate` por segundo durante `duration` segundos e espera todos terminarem."""
+        tasks = []
+        start = time.monotonic()
+        next_at = start
+        while next_at - start < duration:
+            await asyncio.sleep(max(next_at - time.monotonic(), 0))
+            tasks.append(asyncio.create_task(self.run_job(session)))
+            next_at += self._next_gap(rate)
+        results = await asyncio.gather(*tasks)
+        elapsed = time.monotonic() - start
+        return {"rate": rate, "duration": duration, "elapsed": elapsed, **summarize(results, elapsed)}
+
+    async def run(self, rates: List[float], stage_duration: float) -> List[Dict[str, Any]]:
+        timeout = aiohttp.ClientTimeout(total=60)
+        async with aiohttp.ClientSession(timeout=timeout) as session:
+            report = []
+            for rate in rates:
+                stage = await self.run_stage(session, rate, stage_duration)
+                print(format_stage(stage), flush=True)
+                report.append(stage)
+            return report
+
+
+def format_stage(stage: Dict[str, Any]) -> str:
+    def fmt(d):
+        return " ".join(f"{k}={v:.2f}s" if v is not None else f"{k}=-" for k, v in d.items())
+    return (
+        f"rate={stage['rate']:.2f}/s submitted={stage['submitted']} {stage['counts']} "
+        f"throughput={stage['throughput']:.3f}/s\n"
+        f"  latency     {fmt(stage['latency'])}\n"
+        f"  queue_wait  {fmt(stage['queue_wait'])}\n"
+        f"  service     {fmt(stage['service_time'])}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gerador de carga para /api/upload")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--rates", default="0.5", help="taxas-alvo em jobs/s, uma por estágio (ex.: 0.2,0.5,1)")
+    parser.add_argument("--stage-duration", type=float, default=60.0, help="segundos de envio por estágio")
+    parser.add_argument("--arrivals", choices=("poisson", "constant"), default="poisson")
+    parser.add_argument("--image", help="imagem enviada (padrão: PNG 512x512 gerado)")
+    parser.add_argument("--workflow", help="usa /api/uploadwithworkflow com este workflow")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--job-timeout", type=float, default=600.0)
+    parser.add_argument("--max-in-flight", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="grava o relatório em JSON")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        image = sample_image()
+
+    generator = LoadGenerator(
+        args.base_url,
+        image,
+        workflow=args.workflow,
+        poll_interval=args.poll_interval,
+        job_timeout=args.job_timeout,
+        max_in_flight=args.max_in_flight,
+        arrivals=args.arrivals,
+        seed=args.seed,
+    )
+    report = asyncio.run(generator.run([float(r) for r in args.rates.split(",")], args.stage_duration))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
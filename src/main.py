@@ -1,27 +1,40 @@
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
 import structlog
 import logging
 
-from sentry_sdk import init as sentry_init
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
+from sentry_sdk.integrations.fastapi import FastApiIntegration
+from sentry_sdk.integrations.redis import RedisIntegration
+from sentry_sdk.integrations.starlette import StarletteIntegration
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
-from pathlib import Path
-from fastapi.staticfiles import StaticFiles
-
 from core.config import settings
+from core.leader import LeaderLock
 from core.paths import ASSETS_DIR
-from utils.log_sender import LogSender
-from routes.routes import router as rest_router
+from core.redis import redis
+from core.tracing import init_sentry
+from utils import s3
+from routes.routes import router as rest_router, comfyui_probe
 
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 
-sentry_init(
-    dsn=settings.SENTRY_DSN,
-    traces_sample_rate=1.0,
+# só as integrações que a API usa: as automáticas importariam aiohttp, botocore etc. na subida
+init_sentry(
+    settings.SENTRY_DSN,
+    settings.SENTRY_TRACES_SAMPLE_RATE,
+    auto_enabling_integrations=False,
+    integrations=[StarletteIntegration(), FastApiIntegration(), RedisIntegration()],
 )
 
 structlog.configure(
@@ -40,14 +53,88 @@ structlog.configure(
 
 log = structlog.get_logger(__name__)
 
-log_sender = LogSender(
-    log_api=settings.LOG_API,
-    project_id=settings.LOG_PROJECT_ID,
-    upload_delay=120
+# cada processo do servidor tem o seu LogSender (buffer + segmentos em disco);
+# só o envio para a LOG_API roda em um único processo, o líder eleito pelo Redis
+log_sender: Optional["LogSender"] = None
+
+
+def create_log_sender() -> None:
+    from utils.log_sender import LogSender
+
+    global log_sender
+    log_sender = LogSender(
+        log_api=settings.LOG_API,
+        project_id=settings.LOG_PROJECT_ID,
+        upload_delay=120,
+        buffer_capacity=settings.LOG_BUFFER_CAPACITY,
+        overflow_policy=settings.LOG_OVERFLOW_POLICY,
+        fsync_policy=settings.LOG_FSYNC_POLICY,
+        autostart=False,
+    )
+    log_sender.start(upload=False)
+
+
+def close_log_sender() -> None:
+    global log_sender
+    if log_sender is not None:
+        log_sender.close()
+        log_sender = None
+
+
+def start_log_upload() -> None:
+    if log_sender is not None:
+        log_sender.start_uploader()
+
+
+def stop_log_upload() -> None:
+    if log_sender is not None:
+        log_sender.stop_uploader()
+
+
+log_sender_leader = LeaderLock(
+    redis,
+    "log_sender",
+    ttl=settings.LEADER_LOCK_TTL,
+    interval=settings.LEADER_LOCK_TTL / 3,
+    on_elected=start_log_upload,
+    on_deposed=stop_log_upload,
 )
 
 
-app = FastAPI()
+async def _warm_up_storage() -> None:
+    started = time.perf_counter()
+    try:
+        use_s3 = await asyncio.to_thread(s3.warm_up)
+        log.info("api.storage_ready", use_s3=use_s3, seconds=round(time.perf_counter() - started, 3))
+    except Exception as e:
+        # o primeiro upload tenta de novo; a API não deixa de subir por isso
+        log.warning("api.storage_warm_up_failed", error=str(e))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # singletons com threads/tasks nascem aqui, em cada processo do servidor, e não no import
+    started = time.perf_counter()
+    create_log_sender()
+    comfyui_probe.start()
+    log_sender_leader.start()
+    # credenciais/cliente do S3 em background: a API já atende enquanto isso
+    warm_up = asyncio.create_task(_warm_up_storage())
+    log.info(
+        "api.startup",
+        import_seconds=round(_app_ready - _import_started, 3),
+        lifespan_seconds=round(time.perf_counter() - started, 3),
+        ready_seconds=round(time.perf_counter() - _import_started, 3),
+    )
+    yield
+    warm_up.cancel()
+    await log_sender_leader.stop()
+    await asyncio.to_thread(close_log_sender)
+    await comfyui_probe.stop()
+    await redis.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(SentryAsgiMiddleware)
 
 app.add_middleware(
@@ -60,3 +147,5 @@ app.add_middleware(
 app.mount("/assets", StaticFiles(directory=ASSETS_DIR), name="assets")
 
 app.include_router(rest_router)
+
+_app_ready = time.perf_counter()
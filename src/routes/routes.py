@@ -3,47 +3,170 @@ import uuid
 import os
 import json
 import asyncio
-import websockets
-import aiohttp
+import mimetypes
 
 from io import BytesIO
-from datetime import datetime
-from pathlib import Path
-from typing import Optional
+from datetime import datetime, timedelta
+from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request, BackgroundTasks
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, StreamingResponse, Response
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 
+from core import jobs, metrics, tracing
+from core.activity import ActivityIndex
+from core.admission import AdmissionController
 from core.config import settings
 from core.redis import redis
 from core.paths import DIST_DIR, WORKFLOWS_DIR
+from core.latency import LatencyModel, workflow_key, enqueued_score, QUEUE_INDEX_KEY, ACTIVE_SERVERS_KEY
+from core.comfyui_probe import ComfyUiHealthProbe
+from core.expiry import ExpiryScheduler
+from core.workflow_params import WorkflowTemplates, WorkflowParamError, PARAMS_SUFFIX, parse_params_field
 from utils.sms import format_to_e164, send_sms_download_message
-from utils.s3 import upload_fileobj
+from utils.s3 import upload_fileobj, iter_file_chunks, local_path
+from utils.charts import ChartCache, chart_etag
+from utils.image_cache import (
+    ImageCache, is_immutable_key, etag_matches, parse_range,
+    IMMUTABLE_CACHE_CONTROL, DEFAULT_CACHE_CONTROL,
+)
+from utils.derivatives import DerivativeService, derivative_etag, normalize_request
+from utils.files import IMAGE_EXTENSIONS, open_zip_images, iter_zip_stream
 
 
 router = APIRouter()
 templates = Jinja2Templates(directory="src/static/templates")
 log = structlog.get_logger()
+latency = LatencyModel(redis, window=settings.LATENCY_WINDOW, default_seconds=settings.ETA_DEFAULT_SECONDS)
+activity = ActivityIndex(redis, retention_days=settings.STATS_RETENTION_DAYS)
+charts = ChartCache()
+image_cache = ImageCache(
+    max_bytes=settings.IMAGE_CACHE_MAX_BYTES,
+    max_file_bytes=settings.IMAGE_CACHE_MAX_FILE_BYTES,
+)
+workflow_templates = WorkflowTemplates(settings.WORKFLOW_NODE_ID_KSAMPLER, settings.WORKFLOW_NODE_ID_TEXT_INPUT)
+derivatives = DerivativeService(
+    max_bytes=settings.DERIVATIVE_CACHE_MAX_BYTES,
+    workers=settings.DERIVATIVE_WORKERS,
+)
+expiry = ExpiryScheduler(redis, roots=[settings.STATIC_DIR, settings.IMAGE_TEMP_FOLDER])
+admission = AdmissionController(
+    redis,
+    latency,
+    max_wait=settings.ADMISSION_MAX_WAIT,
+    max_queue=settings.ADMISSION_MAX_QUEUE,
+)
+
+
+async def schedule_input_expiry(*rids: str) -> None:
+    """Agenda a remoção das entradas salvas localmente (no S3 vale a lifecycle rule do bucket)."""
+    paths = [local_path(f"input/{rid}") for rid in rids]
+    paths = [p for p in paths if p]
+    if paths:
+        await expiry.schedule(paths, settings.EXPIRY_INPUT_TTL)
+
+
+def configured_servers():
+    server_list = [
+        settings.COMFYUI_API_SERVER1,
+        settings.COMFYUI_API_SERVER2,
+        settings.COMFYUI_API_SERVER3,
+        settings.COMFYUI_API_SERVER4,
+    ]
+    return [s for s in server_list if s]
+
+
+comfyui_probe = ComfyUiHealthProbe(
+    configured_servers(),
+    redis=redis,
+    ttl=settings.HEALTH_PROBE_TTL,
+    deadline=settings.HEALTH_PROBE_DEADLINE,
+)
+
+
+async def estimate_queue_wait(rid: str, workflow_path: Optional[str] = None):
+    """
+    Retorna (posição, estimativa) do job: a posição vem do índice real da fila
+    (jobs à frente) e a estimativa usa os quantis por workflow dos servidores ativos.
+    """
+    pos = await redis.zrank(QUEUE_INDEX_KEY, rid)
+    pos = int(pos) if pos is not None else 0
+    est = await latency.estimate_wait(pos, workflow_key(workflow_path), await active_servers())
+    return pos, est
+
+
+async def active_servers() -> List[str]:
+    """Servidores publicados pelo worker como ativos (ou os configurados, se ainda não houver)."""
+    active = await redis.get(ACTIVE_SERVERS_KEY)
+    return json.loads(active) if active else configured_servers()
+
+
+async def admit(workflow_path: Optional[str] = None) -> None:
+    """
+    Recusa o envio com 503 + Retry-After quando a fila já passa da espera
+    máxima configurada (ver core.admission).
+    """
+    if not admission.enabled:
+        return
+    decision = await admission.check(workflow_key(workflow_path), await active_servers())
+    metrics.ADMISSIONS.labels(result="admitted" if decision.admitted else decision.reason).inc()
+    if decision.admitted:
+        return
+    log.warning("admission.rejected", **decision.model_dump())
+    raise HTTPException(
+        status_code=503,
+        detail={
+            "error": "Fila cheia, tente novamente em instantes",
+            "reason": decision.reason,
+            "queue_depth": decision.queue_depth,
+            "estimated_wait": round(decision.estimated_wait),
+            "retry_after": decision.retry_after,
+        },
+        headers={"Retry-After": str(decision.retry_after)},
+    )
+
 
 class HealthResponse(BaseModel):
     status: str
     details: dict = {}
 
-async def enqueue_job(rid: str, input_key: str, workflow_path: Optional[str] = None):
+def job_timings(data: dict) -> dict:
+    """Instantes (ISO, UTC) do ciclo de vida do job, para clientes e testes de carga."""
+    return {
+        "enqueued_at": data.get("enqueued_at") or None,
+        "started_at": data.get("proc_start_at") or None,
+        "finished_at": data.get("finished_at") or None,
+        "attempt": int(data.get("attempt") or "1"),
+    }
+
+
+def list_workflows():
+    return sorted(
+        name for name in os.listdir(WORKFLOWS_DIR)
+        if name.endswith(".json") and not name.endswith(PARAMS_SUFFIX)
+    )
+
+
+def validate_job_params(workflow_path: str, raw: Optional[str]) -> Optional[str]:
     """
-    Empilha um job na fila 'submissions_queue'.
-    Não serializa workflow_path=None como string "None".
+    Valida o campo `params` (JSON) contra o schema do workflow e devolve o JSON
+    normalizado para gravar no job (None se não houver parâmetros).
     """
-    payload = {"id": rid, "input": input_key}
-    if workflow_path:
-        payload["workflow_path"] = workflow_path
-    await redis.lpush("submissions_queue", json.dumps(payload))
+    if not raw:
+        return None
+    try:
+        params = workflow_templates.build_params(workflow_path, parse_params_field(raw))
+    except FileNotFoundError:
+        raise HTTPException(status_code=400, detail="Workflow inválido")
+    except WorkflowParamError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return json.dumps(params) if params else None
 
 
 async def send_sms_task(request_id: str, image_url: str, phone: str):
-    sent = await asyncio.to_thread(send_sms_download_message, image_url, phone)
+    with metrics.timed(metrics.SMS):
+        sent = await asyncio.to_thread(send_sms_download_message, image_url, phone)
     log.info("notify.immediate_sms", request_id=request_id, phone=phone, success=sent)
     await redis.hset(f"job:{request_id}", "sms_status", "sent" if sent else "failed")
 
@@ -53,6 +176,12 @@ async def read_index():
     return FileResponse(os.path.join(DIST_DIR, "index.html"))
 
 
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    body, content_type = metrics.render_latest()
+    return Response(body, media_type=content_type)
+
+
 @router.get("/alive")
 async def alive():
     return HealthResponse(status="ok", details={"time": asyncio.get_event_loop().time()})
@@ -60,82 +189,175 @@ async def alive():
 
 @router.get("/alive/comfyui")
 async def comfyui_health():
-    server_list = [
-        settings.COMFYUI_API_SERVER1,
-        settings.COMFYUI_API_SERVER2,
-        settings.COMFYUI_API_SERVER3,
-        settings.COMFYUI_API_SERVER4,
-    ]
-    server_list = [s for s in server_list if s]
+    # servido do cache mantido pelo probe em background
+    return await comfyui_probe.snapshot()
 
-    results = {}
-    for server in server_list:
-        ws_url = server.rstrip('/').replace("http://", "ws://").replace("https://", "wss://") + f"/ws?clientId={uuid.uuid4().hex}"
-        try:
-            async with websockets.connect(ws_url, ping_interval=10, ping_timeout=5) as ws:
-                try:
-                    msg = await asyncio.wait_for(ws.recv(), timeout=5)
-                    data = json.loads(msg)
-                except asyncio.TimeoutError:
-                    data = None
-                results[server] = {"status": "ok", "first_message": data}
-        except Exception as e:
-            results[server] = {"status": "error", "error": str(e)}
-
-    # determina o overall status
-    if all(r["status"] == "ok" for r in results.values()):
-        overall = "ok"
-    elif any(r["status"] == "ok" for r in results.values()):
-        overall = "partial"
-    else:
-        overall = "error"
-
-    return {"status": overall, "details": results}
+
+@router.get("/api/stats")
+async def stats(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    workflow: Optional[str] = Query(None),
+    status: Optional[str] = Query("done"),
+):
+    """Totais e série por hora (UTC) a partir do índice de atividade, sem varrer pastas."""
+    end = datetime.utcnow()
+    start = end - timedelta(hours=hours - 1)
+    series = await activity.by_hour(start, end, workflow=workflow, status=status)
+    return {
+        "totals": await activity.totals(),
+        "series": [{"hour": h.isoformat(), "count": c} for h, c in sorted(series.items())],
+        "version": await activity.version(),
+    }
+
+
+@router.get("/api/stats/chart")
+async def stats_chart(
+    request: Request,
+    hours: int = Query(24, ge=1, le=24 * 90),
+    workflow: Optional[str] = Query(None),
+    status: Optional[str] = Query("done"),
+    style: str = Query("bar", pattern="^(bar|line)$"),
+    format: str = Query("png", pattern="^(png|json)$"),
+):
+    """
+    Gráfico de atividade por hora. `format=png` devolve a imagem binária com
+    ETag (304 se não mudou); `format=json` devolve só a série, para o frontend desenhar.
+    """
+    end = datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(hours=hours - 1)
+
+    if format == "json":
+        series = await activity.by_hour(start, end, workflow=workflow, status=status)
+        return {"series": [{"hour": h.isoformat(), "count": c} for h, c in sorted(series.items())]}
+
+    key = (start, end, workflow, status, style, await activity.version())
+    etag = chart_etag(key)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    png = charts.get(key)
+    metrics.cache_result("chart", png is not None)
+    if png is None:
+        series = await activity.by_hour(start, end, workflow=workflow, status=status)
+        _, png = await asyncio.to_thread(charts.get_or_render, key, series, style)
+    return Response(content=png, media_type="image/png", headers=headers)
 
 
 @router.get("/image/{path:path}")
-async def serve_image(path: str):
-    file_path = os.path.join(settings.STATIC_DIR, path)
-    if not os.path.isfile(file_path):
+async def serve_image(
+    path: str,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=4096),
+    fmt: Optional[str] = Query(None),
+):
+    """
+    Imagens do armazenamento local com ETag forte (hash do conteúdo),
+    If-None-Match (304), Range (206/416) e Cache-Control imutável para as
+    chaves com UUID. Repetições de imagens recentes saem do cache em memória.
+    Com `w` e/ou `fmt` (webp, avif, jpeg, png) devolve uma variante redimensionada.
+    """
+    root = os.path.abspath(settings.STATIC_DIR)
+    file_path = os.path.abspath(os.path.join(root, path))
+    if not file_path.startswith(root + os.sep):
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
-    return FileResponse(file_path)
+
+    immutable = is_immutable_key(path)
+    if w is not None or fmt is not None:
+        return await serve_derivative(path, request, w, fmt, immutable)
+    entry = image_cache.peek(file_path) if immutable else None
+    if entry is not None and not os.path.isfile(file_path):
+        # o sweeper de expiração (no worker) removeu o arquivo: o cache deste
+        # processo não fica sabendo, então cada hit confirma com um stat
+        image_cache.evict(file_path)
+        entry = None
+    metrics.cache_result("image", entry is not None and entry.content is not None)
+    if entry is None or entry.content is None:
+        # sem os bytes em memória a resposta vem do disco (load revalida pelo stat)
+        entry = await asyncio.to_thread(image_cache.load, file_path)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL,
+        "Accept-Ranges": "bytes",
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+
+    if entry.content is None:
+        # arquivo grande: o FileResponse já trata Range lendo do disco em blocos
+        return FileResponse(file_path, headers=headers)
+
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range == entry.etag):
+        try:
+            byte_range = parse_range(range_header, entry.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{entry.size}"})
+        if byte_range:
+            start, end = byte_range
+            headers["Content-Range"] = f"bytes {start}-{end}/{entry.size}"
+            return Response(entry.content[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+    return Response(entry.content, media_type=media_type, headers=headers)
+
+
+async def serve_derivative(key: str, request: Request, w: Optional[int], fmt: Optional[str], immutable: bool):
+    try:
+        width, fmt = normalize_request(w, fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # a variante de uma chave imutável também é imutável: o ETag sai da própria chave
+    etag = derivative_etag(key, width, fmt)
+    headers = {
+        "ETag": etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if immutable else DEFAULT_CACHE_CONTROL,
+        "Vary": "Accept",
+    }
+    if immutable and etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    try:
+        data, media_type = await derivatives.get(key, width, fmt)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado")
+    if not immutable:
+        headers["ETag"] = derivative_etag(key, width, fmt, data)
+    return Response(data, media_type=media_type, headers=headers)
 
 
 @router.post("/api/upload")
 async def upload(
-    background_tasks: BackgroundTasks,
     image: UploadFile = File(...),
+    params: Optional[str] = Form(None),
 ):
     if not image.filename:
         raise HTTPException(400, "Nome de arquivo inválido")
+    job_params = validate_job_params(settings.WORKFLOW_PATH, params)
+    await admit()
 
     rid = str(uuid.uuid4())
-    key = f"job:{rid}"
 
     content = await image.read()
     bio = BytesIO(content)
-    input_key = upload_fileobj(bio, key_prefix=f"input/{rid}")
-
-    now = datetime.utcnow().isoformat()
-    await redis.hset(key, mapping={
-        "status": "queued",
-        "input": input_key,
-        "output": "",
-        "attempt": "1",
-        "enqueued_at": now
-    })
+    with tracing.stage(metrics.INPUT_UPLOAD):
+        input_key = await asyncio.to_thread(upload_fileobj, bio, f"input/{rid}")
+    await schedule_input_expiry(rid)
 
-    background_tasks.add_task(enqueue_job, rid, input_key)
+    await jobs.enqueue(redis, rid, jobs.new_job(input_key, params=job_params, trace=tracing.trace_fields()))
 
-    pos = await redis.llen("submissions_queue")
-    avg = float(await redis.get("avg_processing_time") or 80)
-    eta = int(pos) * avg
+    pos, est = await estimate_queue_wait(rid)
 
     return JSONResponse({
         "status": "QUEUED",
         "request_id": rid,
         "position_in_queue": pos,
-        "estimated_wait_seconds": eta
+        "estimated_wait_seconds": round(est["p50"]),
+        "estimated_wait_p90_seconds": round(est["p90"]),
     })
 
 
@@ -148,18 +370,23 @@ async def get_result(request_id: str = Query(...)):
 
     data = await redis.hgetall(key)
     status = data.get("status")
+    timings = job_timings(data)
 
     if status == "processing":
-        return JSONResponse({"status": "processing"})
+        return JSONResponse({"status": "processing", "timings": timings})
 
     if status == "error":
-        return JSONResponse({"status": "error", "error": data.get("error")})
+        return JSONResponse({"status": "error", "error": data.get("error"), "timings": timings})
+
+    if status == "cancelled":
+        return JSONResponse({"status": "cancelled", "timings": timings})
 
     if status == "done":
         image_url = data.get("output")
         if not image_url:
             raise HTTPException(status_code=500, detail="Imagem processada mas arquivo não encontrado")
-        return JSONResponse({"status": "done", "image_url": image_url})
+        image_urls = json.loads(data.get("outputs") or "[]") or [image_url]
+        return JSONResponse({"status": "done", "image_url": image_url, "image_urls": image_urls, "timings": timings})
 
     # se ainda não marcou como "processing"/"done"/"error", considera em fila
     return JSONResponse({"status": "queued"})
@@ -180,49 +407,58 @@ async def register_notification(
     return JSONResponse({"status": "PHONE_REGISTERED"})
 
 
+@router.get("/api/workflows")
+async def workflows_with_params():
+    """Workflows disponíveis e os parâmetros que cada um aceita em `params`."""
+    result = {}
+    for name in list_workflows():
+        try:
+            schema = workflow_templates.schema(f"src/workflows/{name}")
+        except (WorkflowParamError, ValueError, OSError) as e:
+            # schema inválido ou workflow removido entre a listagem e a leitura
+            log.warning("workflows.invalid_schema", workflow=name, error=str(e))
+            continue
+        result[name] = {param: spec.model_dump(exclude_none=True) for param, spec in schema.items()}
+    return result
+
+
 @router.get("/api/uploadwithworkflow", response_class=HTMLResponse)
 async def test_form(request: Request):
-    workflows = [f.name for f in WORKFLOWS_DIR.iterdir() if f.suffix == ".json"]
+    workflows = list_workflows()
     return templates.TemplateResponse("test_workflow.html", {"request": request, "workflows": workflows})
 
 
 @router.post("/api/uploadwithworkflow")
 async def test_submit(
-    background_tasks: BackgroundTasks,
     workflow: str = Form(...),
     image: UploadFile = File(...),
+    params: Optional[str] = Form(None),
 ):
     if not image.filename:
         raise HTTPException(status_code=400, detail="Imagem inválida")
+    workflow_path = _batch_workflow_path(workflow)
+    job_params = validate_job_params(workflow_path, params)
+    await admit(workflow_path)
 
     rid = str(uuid.uuid4())
-    key = f"job:{rid}"
 
     content = await image.read()
     bio = BytesIO(content)
-    input_key = upload_fileobj(bio, key_prefix=f"input/{rid}")
-    workflow_path = f"src/workflows/{workflow}"
-
-    now = datetime.utcnow().isoformat()
-    await redis.hset(key, mapping={
-        "status": "queued",
-        "input": input_key,
-        "output": "",
-        "attempt": "1",
-        "enqueued_at": now,
-        "workflow_path": workflow_path
-    })
+    with tracing.stage(metrics.INPUT_UPLOAD):
+        input_key = await asyncio.to_thread(upload_fileobj, bio, f"input/{rid}")
+    await schedule_input_expiry(rid)
 
-    background_tasks.add_task(enqueue_job, rid, input_key, workflow_path=workflow_path)
+    await jobs.enqueue(redis, rid, jobs.new_job(
+        input_key, workflow_path=workflow_path, params=job_params, trace=tracing.trace_fields(),
+    ))
 
-    pos = await redis.llen("submissions_queue")
-    avg = float(await redis.get("avg_processing_time") or 80)
-    eta = int(pos) * avg
+    pos, est = await estimate_queue_wait(rid, workflow_path)
 
     return {
         "request_id": rid,
         "position": pos,
-        "eta": eta
+        "eta": round(est["p50"]),
+        "eta_p90": round(est["p90"]),
     }
 
 
@@ -256,3 +492,188 @@ async def job_progress(request_id: str):
         "proc_start_at": data.get("proc_start_at", "") or "",
         "enqueued_at": data.get("enqueued_at", "") or "",
     }
+
+
+@router.delete("/api/jobs/{request_id}")
+async def cancel_job(request_id: str):
+    """
+    Cancela o job. Na fila, ele sai do índice e é marcado 'cancelled' aqui
+    mesmo; em execução, o pedido fica no hash (`cancel_requested_at`) e o
+    worker cancela a task e interrompe/remove o prompt no ComfyUI, liberando
+    o servidor (resposta 202, status 'cancelling'). Repetir o DELETE não tem efeito.
+    """
+    key = f"job:{request_id}"
+    data = await redis.hgetall(key)
+    if not data:
+        raise HTTPException(status_code=404, detail="job not found")
+
+    status = data.get("status", "")
+    if status == "cancelled":
+        return JSONResponse({"status": "cancelled", "request_id": request_id})
+    if status in ("done", "error"):
+        raise HTTPException(status_code=409, detail=f"job já finalizado ({status})")
+
+    now = datetime.utcnow().isoformat()
+    if status == "processing":
+        if not data.get("cancel_requested_at"):
+            await redis.hset(key, "cancel_requested_at", now)
+            log.info("job.cancel_requested", request_id=request_id, server=data.get("server"))
+        return JSONResponse({"status": "cancelling", "request_id": request_id}, status_code=202)
+
+    # na fila ou aguardando retry: ainda não ocupa servidor
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(key, mapping={"status": "cancelled", "cancel_requested_at": now, "finished_at": now})
+    pipe.zrem(QUEUE_INDEX_KEY, request_id)
+    await pipe.execute()
+    await activity.record(workflow_key(data.get("workflow_path")), "cancelled")
+    metrics.JOBS_FINISHED.labels(result="cancelled").inc()
+    log.info("job.cancelled", request_id=request_id, status=status)
+    return JSONResponse({"status": "cancelled", "request_id": request_id})
+
+
+def _batch_workflow_path(workflow: str) -> str:
+    name = os.path.basename(workflow)
+    if name not in list_workflows():
+        raise HTTPException(status_code=400, detail="Workflow inválido")
+    return f"src/workflows/{name}"
+
+
+@router.post("/api/batch")
+async def create_batch(
+    workflow: str = Form(...),
+    images: Optional[List[UploadFile]] = File(None),
+    archive: Optional[UploadFile] = File(None),
+    params: Optional[str] = Form(None),
+):
+    """
+    Enfileira um lote de imagens com um único workflow.
+    Aceita várias imagens (`images`) e/ou um ZIP (`archive`). As entradas são
+    enviadas ao storage com concorrência limitada e todos os jobs são criados
+    em um único pipeline do Redis. Lotes são envios do operador: não passam
+    pelo controle de admissão nem expiram pelo JOB_QUEUE_DEADLINE.
+    """
+    workflow_path = _batch_workflow_path(workflow)
+    job_params = validate_job_params(workflow_path, params)
+    images = [f for f in (images or []) if f.filename and f.filename.lower().endswith(IMAGE_EXTENSIONS)]
+
+    zf, zip_names = None, []
+    if archive is not None and archive.filename:
+        zf, zip_names = open_zip_images(archive.file, max_members=settings.BATCH_MAX_IMAGES)
+
+    total = len(images) + len(zip_names)
+    if total == 0:
+        if zf:
+            zf.close()
+        raise HTTPException(status_code=400, detail="Nenhuma imagem no lote")
+    if total > settings.BATCH_MAX_IMAGES:
+        if zf:
+            zf.close()
+        raise HTTPException(status_code=413, detail=f"Lote com mais de {settings.BATCH_MAX_IMAGES} imagens")
+
+    sem = asyncio.Semaphore(settings.BATCH_UPLOAD_CONCURRENCY)
+
+    async def store(read):
+        rid = str(uuid.uuid4())
+        async with sem:
+            content = await read()
+            with tracing.stage(metrics.INPUT_UPLOAD):
+                input_key = await asyncio.to_thread(upload_fileobj, BytesIO(content), f"input/{rid}")
+        return rid, input_key
+
+    readers = [f.read for f in images]
+    readers += [lambda name=name: asyncio.to_thread(zf.read, name) for name in zip_names]
+    try:
+        stored = await asyncio.gather(*(store(r) for r in readers))
+    finally:
+        if zf:
+            zf.close()
+
+    batch_id = str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    score = enqueued_score(now)
+    trace = tracing.trace_fields()
+
+    pipe = redis.pipeline(transaction=True)
+    pipe.hset(f"batch:{batch_id}", mapping={
+        "total": str(total),
+        "workflow_path": workflow_path,
+        "created_at": now,
+    })
+    pipe.rpush(f"batch:{batch_id}:jobs", *[rid for rid, _ in stored])
+    for i, (rid, input_key) in enumerate(stored):
+        job = jobs.new_job(
+            input_key, now, workflow_path=workflow_path, params=job_params, trace=trace, batch_id=batch_id,
+        )
+        # mantém a ordem do lote dentro do mesmo timestamp
+        jobs.add_job(pipe, rid, job, score=score + i * 1e-6)
+    await pipe.execute()
+    await schedule_input_expiry(*[rid for rid, _ in stored])
+
+    log.info("batch.created", batch_id=batch_id, total=total, workflow_path=workflow_path)
+    return JSONResponse({
+        "batch_id": batch_id,
+        "total": total,
+        "request_ids": [rid for rid, _ in stored],
+    })
+
+
+@router.get("/api/batch/{batch_id}")
+async def batch_progress(batch_id: str):
+    meta = await redis.hgetall(f"batch:{batch_id}")
+    if not meta:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+
+    rids = await redis.lrange(f"batch:{batch_id}:jobs", 0, -1)
+    pipe = redis.pipeline(transaction=False)
+    for rid in rids:
+        pipe.hget(f"job:{rid}", "status")
+    statuses = await pipe.execute()
+
+    counts = {}
+    for status in statuses:
+        status = status or "unknown"
+        counts[status] = counts.get(status, 0) + 1
+
+    total = len(rids)
+    finished = counts.get("done", 0) + counts.get("error", 0) + counts.get("cancelled", 0)
+    return {
+        "batch_id": batch_id,
+        "workflow_path": meta.get("workflow_path", ""),
+        "created_at": meta.get("created_at", ""),
+        "total": total,
+        "counts": counts,
+        "percent": int(finished * 100 / total) if total else 100,
+        "complete": finished == total,
+    }
+
+
+@router.get("/api/batch/{batch_id}/download")
+async def batch_download(batch_id: str):
+    """ZIP com os resultados já prontos do lote."""
+    rids = await redis.lrange(f"batch:{batch_id}:jobs", 0, -1)
+    if not rids:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+
+    pipe = redis.pipeline(transaction=False)
+    for rid in rids:
+        pipe.hmget(f"job:{rid}", "output_keys", "output_key")
+    keys = []
+    for rid, (output_keys, output_key) in zip(rids, await pipe.execute()):
+        job_keys = json.loads(output_keys) if output_keys else ([output_key] if output_key else [])
+        if len(job_keys) == 1:
+            keys.append((rid, job_keys[0]))
+        else:
+            keys.extend((f"{rid}_{i}", key) for i, key in enumerate(job_keys))
+    if not keys:
+        raise HTTPException(status_code=404, detail="Nenhum resultado pronto neste lote")
+
+    # membros lidos direto do storage, um bloco por vez
+    members = (
+        (f"{rid}{os.path.splitext(key)[1] or '.png'}", iter_file_chunks(key))
+        for rid, key in keys
+    )
+    return StreamingResponse(
+        iter_zip_stream(members),
+        media_type="application/zip",
+        headers={"Content-Disposition": f'attachment; filename="batch_{batch_id}.zip"'},
+    )
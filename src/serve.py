@@ -0,0 +1,65 @@
+"""
+Servidor de produção da API: N processos uvicorn atrás do mesmo socket.
+
+    python src/serve.py                      # um processo por núcleo
+    WEB_CONCURRENCY=4 python src/serve.py    # ou --workers 4
+
+Cada processo tem o seu pool do Redis, clientes de storage e caches em
+memória (o uvicorn sobe os processos com spawn; nada é herdado do pai). O que
+precisa rodar uma vez só, como o envio dos datalogs, é eleito por um lock no
+Redis (ver core.leader). As métricas dos processos são agregadas em /metrics
+pelo modo multiprocesso do prometheus_client.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+
+import uvicorn
+
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def default_workers() -> int:
+    return int(os.environ.get("WEB_CONCURRENCY") or os.cpu_count() or 1)
+
+
+def prepare_metrics_dir(workers: int) -> None:
+    """Diretório compartilhado das métricas; limpo a cada início (arquivos de PIDs antigos)."""
+    if workers <= 1:
+        return
+    path = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "prometheus-api"))
+    shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(path, exist_ok=True)
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Servidor de produção da API")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", "5000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--keep-alive", type=int, default=int(os.environ.get("KEEP_ALIVE", "5")),
+                        help="segundos de keep-alive (acima do idle timeout do load balancer, se houver)")
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="segundos para as requisições em andamento terminarem no shutdown")
+    parser.add_argument("--log-level", default=os.environ.get("LOG_LEVEL", "info"))
+    args = parser.parse_args(argv)
+
+    prepare_metrics_dir(args.workers)
+    uvicorn.run(
+        "main:app",
+        app_dir=SRC_DIR,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        backlog=args.backlog,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        log_level=args.log_level,
+    )
+
+
+if __name__ == "__main__":
+    main()
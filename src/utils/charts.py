@@ -0,0 +1,87 @@
+import io
+import hashlib
+import threading
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, Hashable, Optional, Tuple
+
+
+def render_activity_png(
+    file_activity: Dict[datetime, int],
+    style: str = "bar",
+    title: str = "Files Modified Per Hour",
+) -> bytes:
+    """
+    Renderiza o gráfico de atividade por hora em PNG.
+
+    Usa a API orientada a objetos (Figure + canvas Agg), sem o estado global do
+    pyplot, então pode rodar em paralelo em threads diferentes. O matplotlib só
+    é importado aqui, no primeiro gráfico, e não na subida da API.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    times = sorted(file_activity.keys())
+    counts = [file_activity[t] for t in times]
+
+    fig = Figure(figsize=(12, 6))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    if style.lower() == "bar":
+        # largura de ~1h em unidades de data do matplotlib (dias)
+        ax.bar(times, counts, width=1 / 24 * 0.8, edgecolor="black")
+    else:
+        ax.plot(times, counts, marker="o", linestyle="-")
+
+    ax.set_title(title)
+    ax.set_xlabel("Hour")
+    ax.set_ylabel("Number of Files")
+    ax.grid(True)
+    ax.tick_params(axis="x", labelrotation=45)
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def chart_etag(key: Hashable) -> str:
+    return '"' + hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:20] + '"'
+
+
+class ChartCache:
+    """
+    Cache LRU de PNGs renderizados.
+
+    A chave deve identificar os dados e o estilo (ex.: intervalo de horas,
+    filtros, estilo e `stats:version`); quando chegam dados novos a versão muda
+    e a chave antiga simplesmente deixa de ser usada. O ETag é derivado da
+    chave, então um If-None-Match pode ser respondido sem renderizar nada.
+    """
+
+    def __init__(self, max_entries: int = 32):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            png = self._entries.get(key)
+            if png is not None:
+                self._entries.move_to_end(key)
+            return png
+
+    def put(self, key: Hashable, png: bytes) -> None:
+        with self._lock:
+            self._entries[key] = png
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_render(self, key: Hashable, file_activity: Dict[datetime, int], style: str = "bar") -> Tuple[str, bytes]:
+        png = self.get(key)
+        if png is None:
+            png = render_activity_png(file_activity, style=style)
+            self.put(key, png)
+        return chart_etag(key), png
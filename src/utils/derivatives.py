@@ -0,0 +1,206 @@
+import io
+import os
+import hashlib
+import asyncio
+import threading
+import structlog
+
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from core import metrics
+
+
+log = structlog.get_logger()
+
+# larguras permitidas: o pedido é arredondado para cima, limitando as variantes em cache
+DERIVATIVE_WIDTHS = (160, 320, 640, 1024, 1600)
+DERIVATIVE_FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 82, "optimize": True, "progressive": True}),
+    "png": ("PNG", "image/png", {"optimize": True}),
+}
+AVIF_FORMAT = ("AVIF", "image/avif", {"quality": 60})
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+
+@lru_cache(maxsize=None)
+def supported_formats() -> Dict[str, Tuple[str, str, dict]]:
+    """Formatos de saída; o suporte a AVIF depende do build do Pillow (verificado no primeiro uso, não no import)."""
+    from PIL import features
+
+    formats = dict(DERIVATIVE_FORMATS)
+    if features.check("avif"):
+        formats["avif"] = AVIF_FORMAT
+    return formats
+
+
+def normalize_request(width: Optional[int], fmt: Optional[str]) -> Tuple[Optional[int], str]:
+    """
+    Ajusta (w, fmt) pedidos na URL para uma variante suportada.
+
+    :raises ValueError: Se o formato não for suportado.
+    """
+    fmt = FORMAT_ALIASES.get((fmt or "webp").lower(), (fmt or "webp").lower())
+    if fmt not in supported_formats():
+        raise ValueError(f"formato não suportado: {fmt}")
+    if width is not None:
+        width = next((w for w in DERIVATIVE_WIDTHS if w >= width), DERIVATIVE_WIDTHS[-1])
+    return width, fmt
+
+
+def derivative_key(key: str, width: Optional[int], fmt: str) -> str:
+    """Chave da variante ao lado do original (ex.: output/{id}/{uuid}.w320.webp)."""
+    return f"{os.path.splitext(key)[0]}.w{width or 0}.{fmt}"
+
+
+def derivative_etag(key: str, width: Optional[int], fmt: str, data: Optional[bytes] = None) -> str:
+    """ETag da variante: pela chave quando o original é imutável, senão pelo conteúdo."""
+    source = data if data is not None else derivative_key(key, width, fmt).encode("utf-8")
+    return '"' + hashlib.sha1(source).hexdigest()[:20] + '"'
+
+
+def render_derivative(data: bytes, width: Optional[int], fmt: str) -> bytes:
+    """Redimensiona (sem ampliar) e converte a imagem. Roda no pool de processos."""
+    from PIL import Image
+
+    pil_format, _, options = supported_formats()[fmt]
+    with Image.open(io.BytesIO(data)) as im:
+        if width and im.width > width:
+            height = max(1, round(im.height * width / im.width))
+            im = im.resize((width, height), Image.LANCZOS)
+        if pil_format == "JPEG" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        buf = io.BytesIO()
+        im.save(buf, format=pil_format, **options)
+    return buf.getvalue()
+
+
+class DerivativeService:
+    """
+    Gera variantes redimensionadas/convertidas das imagens do armazenamento.
+
+    Cada variante é gerada uma única vez: a ordem de busca é LRU em memória,
+    depois o armazenamento (S3 ou local, ao lado do original), e só então a
+    renderização em um pool de processos. Pedidos simultâneos da mesma
+    variante esperam a mesma renderização (single-flight).
+
+    :param load: Função que lê uma chave do armazenamento (padrão: s3.download_file).
+    :param store: Função (chave, bytes, content_type) que grava no armazenamento.
+    """
+
+    def __init__(
+        self,
+        load: Optional[Callable[[str], bytes]] = None,
+        store: Optional[Callable[[str, bytes, str], None]] = None,
+        max_bytes: int = 32 * 1024 * 1024,
+        workers: int = 2,
+        executor: Optional[Executor] = None,
+    ):
+        if load is None or store is None:
+            from utils.s3 import download_file, upload_bytes
+            load = load or download_file
+            store = store or upload_bytes
+        self.load = load
+        self.store = store
+        self.max_bytes = max_bytes
+        self.workers = workers
+        self._executor = executor
+        self._lru: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lru_bytes = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def _cache_get(self, dkey: str) -> Optional[bytes]:
+        with self._lock:
+            data = self._lru.get(dkey)
+            if data is not None:
+                self._lru.move_to_end(dkey)
+            return data
+
+    def _cache_put(self, dkey: str, data: bytes) -> None:
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._lru.pop(dkey, None)
+            if old is not None:
+                self._lru_bytes -= len(old)
+            self._lru[dkey] = data
+            self._lru_bytes += len(data)
+            while self._lru_bytes > self.max_bytes:
+                _, evicted = self._lru.popitem(last=False)
+                self._lru_bytes -= len(evicted)
+
+    def _load_or_none(self, key: str) -> Optional[bytes]:
+        try:
+            return self.load(key)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # botocore ClientError (NoSuchKey) sem importar o botocore
+            if str(getattr(e, "response", {}).get("Error", {}).get("Code", "")) in ("NoSuchKey", "404"):
+                return None
+            raise
+
+    async def _produce(self, key: str, dkey: str, width: Optional[int], fmt: str, original: Optional[bytes]) -> bytes:
+        data = await asyncio.to_thread(self._load_or_none, dkey)
+        if data is None:
+            if original is None:
+                original = await asyncio.to_thread(self._load_or_none, key)
+                if original is None:
+                    raise FileNotFoundError(key)
+            loop = asyncio.get_running_loop()
+            with metrics.timed(metrics.TRANSCODE):
+                data = await loop.run_in_executor(self.executor, render_derivative, original, width, fmt)
+            await asyncio.to_thread(self.store, dkey, data, supported_formats()[fmt][1])
+            log.info("derivative.generated", key=dkey, size=len(data))
+        self._cache_put(dkey, data)
+        return data
+
+    async def get(self, key: str, width: Optional[int], fmt: str, original: Optional[bytes] = None) -> Tuple[bytes, str]:
+        """
+        Retorna (bytes, content_type) da variante de `key`.
+
+        :raises FileNotFoundError: Se o original não existir.
+        """
+        dkey = derivative_key(key, width, fmt)
+        media_type = supported_formats()[fmt][1]
+        data = self._cache_get(dkey)
+        metrics.cache_result("derivative", data is not None)
+        if data is not None:
+            return data, media_type
+
+        future = self._inflight.get(dkey)
+        if future is None:
+            future = asyncio.ensure_future(self._produce(key, dkey, width, fmt, original))
+            self._inflight[dkey] = future
+            future.add_done_callback(lambda _: self._inflight.pop(dkey, None))
+        return await asyncio.shield(future), media_type
+
+    async def pregenerate(self, key: str, specs: Iterable[Tuple[int, str]], original: Optional[bytes] = None) -> None:
+        """Gera as variantes padrão logo após o upload (erros só são registrados)."""
+        for width, fmt in specs:
+            try:
+                await self.get(key, width, fmt, original=original)
+            except Exception as e:
+                log.warning("derivative.pregenerate_failed", key=key, width=width, fmt=fmt, error=str(e))
+
+
+def parse_specs(value: str):
+    """Converte '320:webp,1024:webp' em [(320, 'webp'), (1024, 'webp')]."""
+    specs = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        width, _, fmt = item.partition(":")
+        specs.append(normalize_request(int(width), fmt or "webp"))
+    return specs
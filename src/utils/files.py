@@ -5,41 +5,147 @@ import base64
 import shutil
 import time
 import structlog
-import matplotlib.pyplot as plt
 
 from datetime import datetime
-from typing import Dict
+from typing import Dict, Iterable, Iterator, Tuple
 from collections import defaultdict
 
 from fastapi import HTTPException
 
 from core.config import settings
+from utils.charts import render_activity_png
 
 
 log = structlog.get_logger()
 
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+# formatos já comprimidos: DEFLATE só gastaria CPU
+ZIP_STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".gif", ".zip")
+ZIP_CHUNK_SIZE = 64 * 1024
 
-def create_zip_of_images(folder_path: str) -> io.BytesIO:
+
+def open_zip_images(file_obj, max_members: int = 0):
     """
-    Cria um buffer ZIP contendo todas as imagens (.png, .jpg, .jpeg) encontradas no caminho informado.
-    
+    Abre um arquivo ZIP e lista as imagens contidas, sem extraí-las.
+    Os membros podem ser lidos depois, um a um, com `zf.read(nome)`.
+
+    :param file_obj: File-like (seekable) com o conteúdo do ZIP.
+    :param max_members: Limite de imagens (0 = sem limite).
+    :return: Tupla (ZipFile aberto, lista de nomes das imagens).
+    :raises HTTPException: Se o arquivo não for um ZIP válido ou exceder o limite.
+    """
+    try:
+        zf = zipfile.ZipFile(file_obj)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Arquivo ZIP inválido")
+
+    names = [
+        info.filename for info in zf.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith(IMAGE_EXTENSIONS)
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+    if max_members and len(names) > max_members:
+        zf.close()
+        raise HTTPException(status_code=413, detail=f"ZIP com mais de {max_members} imagens")
+    return zf, names
+
+
+class _ChunkBuffer(io.RawIOBase):
+    """Destino não-seekable do ZipFile: acumula o que foi escrito até ser drenado."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_local_file(path: str, chunk_size: int = ZIP_CHUNK_SIZE) -> Iterator[bytes]:
+    """Lê um arquivo local em blocos de `chunk_size` bytes."""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def iter_zip_stream(members: Iterable[Tuple[str, Iterable[bytes]]]) -> Iterator[bytes]:
+    """
+    Gera um arquivo ZIP em blocos, à medida que os membros são lidos.
+
+    O ZIP é escrito em um destino não-seekable (tamanhos e CRC vão em data
+    descriptors), então a memória usada é a de um bloco, e não a do arquivo
+    inteiro. Imagens já comprimidas (png/jpg/webp) vão como STORED; o resto
+    como DEFLATED.
+
+    :param members: Iterável de (nome no ZIP, iterável de blocos de bytes).
+    :return: Iterador de blocos de bytes, pronto para um StreamingResponse.
+    """
+    buf = _ChunkBuffer()
+    with zipfile.ZipFile(buf, "w", allowZip64=True) as zf:
+        for arcname, chunks in members:
+            info = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+            info.compress_type = (
+                zipfile.ZIP_STORED if arcname.lower().endswith(ZIP_STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            )
+            with zf.open(info, "w", force_zip64=True) as dest:
+                for chunk in chunks:
+                    dest.write(chunk)
+                    data = buf.drain()
+                    if data:
+                        yield data
+            data = buf.drain()
+            if data:
+                yield data
+    yield buf.drain()
+
+
+def _folder_images(folder_path: str) -> Iterator[Tuple[str, Iterable[bytes]]]:
+    for root, _, files in os.walk(folder_path):
+        for file in sorted(files):
+            if file.lower().endswith(IMAGE_EXTENSIONS):
+                file_path = os.path.join(root, file)
+                # Relpath garante a estrutura interna correta dentro do ZIP
+                yield os.path.relpath(file_path, folder_path), iter_local_file(file_path)
+
+
+def stream_zip_of_images(folder_path: str) -> Iterator[bytes]:
+    """
+    ZIP em streaming com todas as imagens (.png, .jpg, .jpeg) do caminho informado.
+
     :param folder_path: Caminho da pasta cujas imagens serão zipadas.
-    :return: BytesIO já posicionado no início, pronto para ser retornado em uma resposta (StreamingResponse).
+    :return: Iterador de blocos de bytes para um StreamingResponse.
     :raises HTTPException: Se a pasta não existir ou não for acessível.
     """
     if not os.path.isdir(folder_path):
-        log.info("create_zip_of_images: Pasta não encontrada", folder_path=folder_path)
+        log.info("stream_zip_of_images: Pasta não encontrada", folder_path=folder_path)
         raise HTTPException(status_code=404, detail="Pasta não encontrada para criar ZIP")
+    return iter_zip_stream(_folder_images(folder_path))
 
+
+def create_zip_of_images(folder_path: str) -> io.BytesIO:
+    """
+    Cria um buffer ZIP contendo todas as imagens (.png, .jpg, .jpeg) encontradas no caminho informado.
+    Mantida por compatibilidade; para respostas HTTP prefira `stream_zip_of_images`.
+    
+    :param folder_path: Caminho da pasta cujas imagens serão zipadas.
+    :return: BytesIO já posicionado no início.
+    :raises HTTPException: Se a pasta não existir ou não for acessível.
+    """
     zip_buffer = io.BytesIO()
-    with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as zip_file:
-        for root, _, files in os.walk(folder_path):
-            for file in files:
-                if file.lower().endswith((".png", ".jpg", ".jpeg")):
-                    file_path = os.path.join(root, file)
-                    # Relpath garante a estrutura interna correta dentro do ZIP
-                    arcname = os.path.relpath(file_path, folder_path)
-                    zip_file.write(file_path, arcname)
+    for chunk in stream_zip_of_images(folder_path):
+        zip_buffer.write(chunk)
     zip_buffer.seek(0)
     return zip_buffer
 
@@ -161,6 +267,8 @@ def count_files_by_hour(directory_path: str) -> Dict[datetime, int]:
     """
     Agrupa arquivos por hora de modificação, retornando um dicionário onde a chave é
     o início da hora (YYYY-MM-DD HH:00:00) e o valor é a quantidade de arquivos modificados nessa hora.
+    Varre a pasta inteira; para o painel use `core.activity.ActivityIndex`, que
+    responde em O(horas) a partir dos contadores mantidos pelo worker.
     
     :param directory_path: Caminho da pasta alvo.
     :return: Dicionário {datetime da hora: quantidade de arquivos}.
@@ -186,6 +294,7 @@ def generate_file_activity_plot_base64(
     """
     Gera um gráfico (PNG) representando atividade de arquivos por hora e retorna
     a imagem codificada em Base64 (para exibição inline em HTML ou JSON).
+    Para o painel prefira `/api/stats/chart`, que serve o PNG binário com ETag e cache.
     
     :param file_activity: Dicionário {datetime da hora: quantidade de arquivos}.
     :param style: 'bar' ou 'line' para tipo de gráfico. Padrão 'bar'.
@@ -194,45 +303,28 @@ def generate_file_activity_plot_base64(
     if not file_activity:
         return ""
 
-    times = sorted(file_activity.keys())
-    counts = [file_activity[t] for t in times]
-
-    plt.figure(figsize=(12, 6))
-    if style.lower() == "bar":
-        plt.bar(times, counts, edgecolor="black")
-    else:
-        plt.plot(times, counts, marker="o", linestyle="-")
-
-    plt.title("Files Modified Per Hour")
-    plt.xlabel("Hour")
-    plt.ylabel("Number of Files")
-    plt.grid(True)
-    plt.xticks(rotation=45)
-    plt.tight_layout()
-
-    buf = io.BytesIO()
-    plt.savefig(buf, format="png")
-    buf.seek(0)
-    plt.close()
-
-    img_base64 = base64.b64encode(buf.getvalue()).decode("utf-8")
-    return img_base64
-
-def remove_old_folders():
-    """
-    A cada execução, verifica em static/download_images subpastas criadas e remove
-    aquelas com mais de 10 minutos.
-    """
-    while True:
-        current_time = time.time()
-        directory = os.path.join(settings.STATIC_DIR, "download_images")
-        minutes = 10
-
-        for foldername in os.listdir(directory):
-            folder_path = os.path.join(directory, foldername)
-            if os.path.isdir(folder_path):
-                creation_time = os.path.getctime(folder_path)
-                if (current_time - creation_time) / 60 > minutes:
-                    shutil.rmtree(folder_path)
-                    log.info('Pasta removida por tempo excedido', folder=foldername)
-        time.sleep(60)
\ No newline at end of file
+    return base64.b64encode(render_activity_png(file_activity, style=style)).decode("utf-8")
+
+
+def remove_old_folders(directory: str = None, max_age_seconds: int = None) -> int:
+    """
+    Remove, em uma única passada, as subpastas de `directory` (padrão:
+    static/download_images) criadas há mais de `max_age_seconds`.
+    A remoção contínua fica com o sweeper de `core.expiry`; esta função serve
+    para limpezas pontuais e não bloqueia.
+
+    :return: Quantidade de pastas removidas.
+    """
+    directory = directory or os.path.join(settings.STATIC_DIR, "download_images")
+    max_age_seconds = settings.EXPIRY_DOWNLOAD_TTL if max_age_seconds is None else max_age_seconds
+    if not os.path.isdir(directory):
+        return 0
+
+    current_time = time.time()
+    removed = 0
+    for entry in os.scandir(directory):
+        if entry.is_dir() and current_time - entry.stat().st_ctime > max_age_seconds:
+            shutil.rmtree(entry.path)
+            removed += 1
+            log.info('Pasta removida por tempo excedido', folder=entry.name)
+    return removed
@@ -0,0 +1,149 @@
+import os
+import re
+import hashlib
+import threading
+
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+# chaves geradas pelo upload_fileobj: {input|output}/{request_id}/{uuid}.{ext}
+IMMUTABLE_KEY_RE = re.compile(r"^(input|output)/[0-9a-fA-F-]{36}/[0-9a-fA-F-]{36}\.\w+$")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+DEFAULT_CACHE_CONTROL = "no-cache"
+
+
+def is_immutable_key(key: str) -> bool:
+    """Chaves com UUID nunca são sobrescritas: o conteúdo pode ser cacheado para sempre."""
+    return bool(IMMUTABLE_KEY_RE.match(key))
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Interpreta um cabeçalho `Range: bytes=...` de intervalo único.
+
+    :return: (início, fim) inclusivos, ou None se o cabeçalho não for suportado
+             (nesse caso a resposta completa é enviada).
+    :raises ValueError: Se o intervalo não puder ser satisfeito (416).
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        if length == 0:
+            raise ValueError("intervalo vazio")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("intervalo fora do arquivo")
+    return start, end
+
+
+class CachedFile:
+    __slots__ = ("path", "etag", "size", "mtime_ns", "content")
+
+    def __init__(self, path: str, etag: str, size: int, mtime_ns: int, content: Optional[bytes]):
+        self.path = path
+        self.etag = etag
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content = content
+
+
+class ImageCache:
+    """
+    Metadados (ETag forte por hash do conteúdo) e bytes das imagens servidas
+    por `/image/{path}`.
+
+    O ETag de todo arquivo servido fica em memória, validado por (mtime, tamanho).
+    Os bytes só dos arquivos até `max_file_bytes`, em LRU limitado a
+    `max_bytes`. Para chaves imutáveis, `peek` responde sem tocar no disco.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, max_file_bytes: int = 8 * 1024 * 1024, max_entries: int = 10000):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedFile]" = OrderedDict()
+        self._content_bytes = 0
+        self._lock = threading.Lock()
+
+    def peek(self, path: str) -> Optional[CachedFile]:
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+            return entry
+
+    def _store(self, entry: CachedFile) -> None:
+        with self._lock:
+            previous = self._entries.pop(entry.path, None)
+            if previous is not None and previous.content is not None:
+                self._content_bytes -= previous.size
+            self._entries[entry.path] = entry
+            if entry.content is not None:
+                self._content_bytes += entry.size
+            # descarta primeiro os bytes dos menos usados, depois as entradas
+            for old in list(self._entries.values()):
+                if self._content_bytes <= self.max_bytes:
+                    break
+                if old.content is not None and old is not entry:
+                    old.content = None
+                    self._content_bytes -= old.size
+            while len(self._entries) > self.max_entries:
+                _, old = self._entries.popitem(last=False)
+                if old.content is not None:
+                    self._content_bytes -= old.size
+
+    def evict(self, path: str) -> None:
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None and entry.content is not None:
+                self._content_bytes -= entry.size
+
+    def load(self, path: str) -> Optional[CachedFile]:
+        """
+        Valida a entrada com um `stat`; relê o arquivo só se ele mudou. None se
+        não existir (ex.: removido pelo sweeper de expiração), e a entrada sai do cache.
+        """
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            self.evict(path)
+            return None
+        if not os.path.isfile(path):
+            self.evict(path)
+            return None
+
+        entry = self.peek(path)
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            if entry.content is not None or st.st_size > self.max_file_bytes:
+                return entry
+
+        keep = st.st_size <= self.max_file_bytes
+        digest = hashlib.sha256()
+        chunks = []
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(chunk)
+                if keep:
+                    chunks.append(chunk)
+        entry = CachedFile(
+            path,
+            etag=f'"{digest.hexdigest()[:32]}"',
+            size=st.st_size,
+            mtime_ns=st.st_mtime_ns,
+            content=b"".join(chunks) if keep else None,
+        )
+        self._store(entry)
+        return entry
@@ -1,47 +1,326 @@
 import csv
+import json
+import os
+import random
+import threading
 import time
 import requests
-import threading
-import os
 import structlog
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
 
 
 log = structlog.get_logger()
 
 
 LOG_DIR = os.path.join(os.path.dirname(__file__), '..', 'logs')
+FIELDNAMES = ['status', 'project', 'additional', 'timePlayed']
+
+OPEN_SUFFIX = '.jsonl.open'
+SEALED_SUFFIX = '.jsonl'
+
+OVERFLOW_POLICIES = ('drop_oldest', 'block', 'spill')
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class RingBuffer:
+    """
+    Fila circular limitada e segura entre threads, usada para desacoplar
+    `LogSender.log()` da escrita em disco.
+
+    Quando cheia, aplica `policy`:
+    - 'drop_oldest': descarta o registro mais antigo;
+    - 'block': espera até `block_timeout` segundos por espaço e, se não houver,
+      descarta o registro novo;
+    - 'spill': não enfileira e devolve False para o chamador gravar direto em disco.
+    """
+
+    def __init__(self, capacity, policy='drop_oldest', block_timeout=1.0):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow policy inválida: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.dropped = 0
+        self._items = deque()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+    def put(self, item):
+        """Enfileira o item. Retorna False se o chamador deve fazer spill."""
+        with self._cond:
+            if len(self._items) >= self.capacity:
+                if self.policy == 'spill':
+                    return False
+                if self.policy == 'drop_oldest':
+                    self._items.popleft()
+                    self.dropped += 1
+                elif not self._cond.wait_for(lambda: len(self._items) < self.capacity, self.block_timeout):
+                    self.dropped += 1
+                    return True
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get_batch(self, max_items, timeout=None):
+        """Retira até `max_items` itens, esperando até `timeout` pelo primeiro."""
+        with self._cond:
+            if not self._items and timeout:
+                self._cond.wait(timeout)
+            batch = []
+            while self._items and len(batch) < max_items:
+                batch.append(self._items.popleft())
+            if batch:
+                self._cond.notify_all()
+            return batch
 
 
 class LogSender:
+    """
+    Envia os datalogs para a LOG_API a partir de um log append-only segmentado.
+
+    - `log()` só coloca o registro em um `RingBuffer` limitado; uma única thread
+      de escrita grava os registros em lote no segmento ativo
+      (`segments/*.jsonl.open`), com fsync conforme `fsync_policy`.
+    - O segmento é selado (renomeado para `.jsonl`) ao atingir `segment_max_bytes`.
+    - A thread de envio lê cada segmento a partir do offset salvo em
+      `segments/cursor.json`, envia em lotes por uma sessão HTTP com pool de
+      conexões e só então avança o cursor. Segmentos selados e totalmente
+      enviados são removidos.
+    - Falhas aplicam backoff exponencial limitado por `max_backoff`.
+
+    Com vários processos no mesmo diretório de logs, cada um mantém o seu buffer
+    e grava os seus segmentos (o nome leva o PID), mas só um deve rodar a thread
+    de envio (`start(upload=False)` + `start_uploader()` no processo eleito).
+    """
     csv_filename = os.path.join(LOG_DIR, 'datalogs.csv')
     backup_filename = os.path.join(LOG_DIR, 'datalogs_backup.csv')
+    dead_letter_filename = os.path.join(LOG_DIR, 'datalogs_dead_letter.jsonl')
+    segment_dir = os.path.join(LOG_DIR, 'segments')
+    cursor_filename = os.path.join(segment_dir, 'cursor.json')
+
+    def __init__(
+        self,
+        log_api,
+        project_id,
+        upload_delay=120,
+        flush_interval=1.0,
+        segment_max_bytes=1024 * 1024,
+        batch_size=200,
+        upload_workers=8,
+        max_backoff=600,
+        buffer_capacity=10000,
+        overflow_policy='drop_oldest',
+        fsync_policy='interval',
+        fsync_interval=1.0,
+        autostart=True,
+    ):
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy inválida: {fsync_policy}")
 
-    def __init__(self, log_api, project_id, upload_delay=120):
         self.project_id = project_id
         self.log_api = log_api
         self.upload_delay = upload_delay
+        self.flush_interval = flush_interval
+        self.segment_max_bytes = segment_max_bytes
+        self.batch_size = batch_size
+        self.upload_workers = upload_workers
+        self.max_backoff = max_backoff
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+
+        self._buffer = RingBuffer(buffer_capacity, policy=overflow_policy)
+        self._last_fsync = 0.0
+        self._spilled = 0
+        self._written = 0
+        self._fsyncs = 0
+        self._segment_lock = threading.Lock()
+        self._segment_seq = 0
+        self._active_segment = None
+        self._failures = 0
+        self._stop = threading.Event()
+        self._upload_stop = threading.Event()
+        self._uploader = None
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=upload_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=upload_workers, thread_name_prefix='log-sender')
+
+        os.makedirs(self.segment_dir, exist_ok=True)
         self._init_csv(self.csv_filename)
         self._init_csv(self.backup_filename)
-        threading.Thread(target=self._process_csv_and_send_logs, daemon=True).start()
+
+        self._flusher = None
+        if autostart:
+            self.start()
+
+    def start(self, upload=True):
+        """Inicia a thread de flush e, se `upload`, a de envio."""
+        if self._flusher is None:
+            self._stop.clear()
+            self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+            self._flusher.start()
+        if upload:
+            self.start_uploader()
+
+    def start_uploader(self):
+        """Inicia a thread de envio (no máximo uma por processo)."""
+        if self._uploader is not None and self._uploader.is_alive():
+            return
+        self._upload_stop.clear()
+        self._uploader = threading.Thread(target=self._process_segments_and_send_logs, daemon=True)
+        self._uploader.start()
+
+    def stop_uploader(self, timeout=30.0):
+        """Para a thread de envio; a gravação dos segmentos continua."""
+        self._upload_stop.set()
+        uploader, self._uploader = self._uploader, None
+        if uploader is not None and uploader is not threading.current_thread():
+            uploader.join(timeout)
 
     @staticmethod
     def _init_csv(filename):
         try:
             with open(filename, mode='x', newline='') as f:
                 writer = csv.writer(f)
-                writer.writerow(['status', 'project', 'additional', 'timePlayed'])
+                writer.writerow(FIELDNAMES)
             log.info("csv_initialized", file=filename)
         except FileExistsError:
             log.debug("csv_already_exists", file=filename)
 
     def log(self, status, additional=''):
         now = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
-        with open(self.csv_filename, mode='a', newline='') as f:
-            writer = csv.writer(f)
-            writer.writerow([status, self.project_id, additional, now])
-        log.info("log_appended", status=status, project=self.project_id, timePlayed=now)
+        record = {
+            'status': status,
+            'project': self.project_id,
+            'additional': additional,
+            'timePlayed': now,
+        }
+        if not self._buffer.put(record):
+            # buffer cheio com política 'spill': grava direto no segmento
+            self._append_records([record], fsync=self.fsync_policy != 'never')
+            self._spilled += 1
+
+    def flush(self):
+        """Grava no segmento ativo todos os registros ainda em memória."""
+        while True:
+            records = self._buffer.get_batch(self.batch_size)
+            if not records:
+                break
+            self._append_records(records, fsync=self._should_fsync())
+
+    def stats(self):
+        """Contadores do pipeline de logs (para health-check/métricas)."""
+        return {
+            'buffered': len(self._buffer),
+            'dropped': self._buffer.dropped,
+            'spilled': self._spilled,
+            'written': self._written,
+            'fsyncs': self._fsyncs,
+        }
+
+    def close(self):
+        """Para as threads, grava o que restou em memória e sela o segmento ativo."""
+        self._stop.set()
+        self._upload_stop.set()
+        self.flush()
+        with self._segment_lock:
+            self._seal_active_segment()
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    # ------------------------------------------------------------------
+    # segmentos
+    # ------------------------------------------------------------------
+
+    def _new_segment_path(self):
+        self._segment_seq += 1
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S")
+        name = f"{stamp}-{os.getpid()}-{self._segment_seq:06d}{OPEN_SUFFIX}"
+        return os.path.join(self.segment_dir, name)
+
+    def _seal_active_segment(self):
+        path = self._active_segment
+        self._active_segment = None
+        if path and os.path.exists(path):
+            os.replace(path, path[: -len(OPEN_SUFFIX)] + SEALED_SUFFIX)
+
+    def _should_fsync(self):
+        if self.fsync_policy == 'always':
+            return True
+        if self.fsync_policy == 'interval':
+            return time.monotonic() - self._last_fsync >= self.fsync_interval
+        return False
+
+    def _append_records(self, records, fsync=False):
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with self._segment_lock:
+            if self._active_segment is None:
+                self._active_segment = self._new_segment_path()
+            with open(self._active_segment, mode='ab') as f:
+                f.write(data)
+                size = f.tell()
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+                    self._last_fsync = time.monotonic()
+                    self._fsyncs += 1
+            self._written += len(records)
+            if size >= self.segment_max_bytes:
+                self._seal_active_segment()
+
+    @staticmethod
+    def _segment_id(filename):
+        for suffix in (OPEN_SUFFIX, SEALED_SUFFIX):
+            if filename.endswith(suffix):
+                return filename[: -len(suffix)]
+        return None
+
+    def _list_segments(self):
+        """Retorna [(segment_id, path, sealed)] em ordem cronológica."""
+        segments = []
+        for entry in os.scandir(self.segment_dir):
+            seg_id = self._segment_id(entry.name)
+            if seg_id:
+                segments.append((seg_id, entry.path, entry.name.endswith(SEALED_SUFFIX)))
+        segments.sort()
+        return segments
+
+    def _load_cursor(self):
+        try:
+            with open(self.cursor_filename, mode='r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_cursor(self, cursor):
+        tmp = self.cursor_filename + '.tmp'
+        with open(tmp, mode='w', encoding='utf-8') as f:
+            json.dump(cursor, f)
+        os.replace(tmp, self.cursor_filename)
+
+    def _import_legacy_csv(self):
+        """Migra linhas pendentes do antigo datalogs.csv para os segmentos."""
+        with open(self.csv_filename, mode="r", newline="") as f:
+            rows = [dict(row) for row in csv.DictReader(f)]
+        if not rows:
+            return
+        self._append_records(rows)
+        with open(self.csv_filename, mode="w", newline="") as f:
+            csv.writer(f).writerow(FIELDNAMES)
+        log.info("legacy_csv_imported", rows=len(rows))
+
+    # ------------------------------------------------------------------
+    # envio
+    # ------------------------------------------------------------------
 
     def _send_log(self, status, project, additional, timePlayed):
         url = f"{self.log_api}/datalog/upload"
@@ -52,9 +331,9 @@ class LogSender:
             'timePlayed': timePlayed
         }
         try:
-            r = requests.post(url, data=payload)
+            r = self.session.post(url, data=payload, timeout=10)
             if r.status_code == 200:
-                log.info("log_sent", **payload)
+                log.debug("log_sent", **payload)
                 return True
             else:
                 log.warning("log_send_failed", status_code=r.status_code, **payload)
@@ -63,26 +342,109 @@ class LogSender:
             log.error("log_send_error", error=str(e), **payload)
             return False
 
-    def _process_csv_and_send_logs(self):
-        while True:
-            keep, backup = [], []
-            with open(self.csv_filename, mode="r", newline="") as f:
-                reader = csv.DictReader(f)
-                for row in reader:
-                    if self._send_log(**row):
-                        backup.append(row)
-                    else:
-                        keep.append(row)
-
-            with open(self.csv_filename, mode="w", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["status","project","additional","timePlayed"])
-                writer.writeheader()
-                writer.writerows(keep)
-
-            with open(self.backup_filename, mode="a", newline="") as f:
-                writer = csv.DictWriter(f, fieldnames=["status","project","additional","timePlayed"])
-                writer.writerows(backup)
-
-            log.info("batch_processed", sent=len(backup), kept=len(keep))
-
-            time.sleep(self.upload_delay)
\ No newline at end of file
+    def _send_batch(self, records):
+        """Envia um lote em paralelo pela sessão compartilhada. Retorna (enviados, falhos)."""
+        results = list(self._executor.map(lambda r: self._send_log(**r), records))
+        sent = [r for r, ok in zip(records, results) if ok]
+        failed = [r for r, ok in zip(records, results) if not ok]
+        return sent, failed
+
+    def _parse_record(self, seg_id, line):
+        """
+        Converte uma linha do segmento no registro a enviar. Linhas inválidas
+        (JSON quebrado, campos faltando) vão para o arquivo de dead-letter e
+        são puladas, para não travar o cursor e tudo o que vem depois.
+        """
+        try:
+            data = json.loads(line)
+            return {field: data[field] for field in FIELDNAMES}
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning("log_record_invalid", segment=seg_id, error=repr(e), line=line[:200])
+            with open(self.dead_letter_filename, mode='ab') as f:
+                f.write(line + b"\n")
+            return None
+
+    def _drain(self):
+        """
+        Envia tudo o que está pendente nos segmentos.
+        Retorna (enviados, sucesso); sucesso=False indica que é preciso aplicar backoff.
+        """
+        cursor = self._load_cursor()
+        sent_total = 0
+
+        for seg_id, path, sealed in self._list_segments():
+            offset = start = cursor.get(seg_id, 0)
+            try:
+                with open(path, mode='rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                # segmento selado durante a leitura; será lido na próxima rodada
+                continue
+
+            # só consome linhas completas
+            end = data.rfind(b"\n") + 1
+            lines = data[:end].split(b"\n")[:-1]
+
+            for i in range(0, len(lines), self.batch_size):
+                chunk = lines[i:i + self.batch_size]
+                records = []
+                for line in chunk:
+                    record = self._parse_record(seg_id, line)
+                    if record is not None:
+                        records.append(record)
+                sent, failed = self._send_batch(records)
+
+                if failed and not sent:
+                    return sent_total, False
+
+                with open(self.backup_filename, mode="a", newline="") as f:
+                    csv.DictWriter(f, fieldnames=FIELDNAMES).writerows(sent)
+                if failed:
+                    # reenvia depois: volta para o final do log, sem reescrever o segmento
+                    self._append_records(failed)
+
+                offset += sum(len(line) + 1 for line in chunk)
+                cursor[seg_id] = offset
+                self._save_cursor(cursor)
+                sent_total += len(sent)
+
+            if sealed and offset == start + len(data):
+                os.remove(path)
+                cursor.pop(seg_id, None)
+                self._save_cursor(cursor)
+
+        return sent_total, True
+
+    def _next_delay(self, ok):
+        if ok:
+            self._failures = 0
+            return self.upload_delay
+        self._failures += 1
+        backoff = min(self.max_backoff, 5 * (2 ** (self._failures - 1)))
+        return random.uniform(backoff / 2, backoff)
+
+    def _flush_loop(self):
+        """Única thread que escreve registros do buffer no segmento ativo."""
+        while not self._stop.is_set():
+            try:
+                records = self._buffer.get_batch(self.batch_size, timeout=self.flush_interval)
+                if records:
+                    self._append_records(records, fsync=self._should_fsync())
+            except Exception as e:
+                log.error("log_flush_error", error=str(e))
+
+    def _process_segments_and_send_logs(self):
+        try:
+            self._import_legacy_csv()
+        except Exception as e:
+            log.error("legacy_csv_import_error", error=str(e))
+
+        while not self._upload_stop.is_set():
+            try:
+                sent, ok = self._drain()
+                log.info("batch_processed", sent=sent, ok=ok)
+            except Exception as e:
+                log.error("log_drain_error", error=str(e))
+                ok = False
+            self._upload_stop.wait(self._next_delay(ok))
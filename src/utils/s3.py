@@ -1,46 +1,81 @@
 import os
 import uuid
+import threading
 import structlog
 
-import boto3
-from botocore.client import Config
-
 from core.config import settings
 
 
 log = structlog.get_logger()
 
+# boto3 (e a busca de credenciais: variáveis, arquivos, metadata da instância)
+# só rodam no primeiro uso do armazenamento, não no import do módulo
+_lock = threading.Lock()
+_use_s3 = None
+_s3_client = None
+
 
 # Usa o próprio boto3 para verificar se existe credenciais configuradas
 def has_aws_credentials() -> bool:
+    import boto3
+
     session = boto3.Session()
     return session.get_credentials() is not None
 
-USE_S3 = has_aws_credentials()
 
-if USE_S3:
-    ENDPOINT = f"https://s3.{settings.AWS_REGION}.amazonaws.com"
-    s3_client = boto3.client(
-        "s3",
-        endpoint_url=ENDPOINT,
-        region_name=settings.AWS_REGION,
-        config=Config(signature_version="s3v4"),
-    )
-else:
-    s3_client = None
+def use_s3() -> bool:
+    """True quando há credenciais da AWS (resolvido uma vez, no primeiro uso)."""
+    global _use_s3
+    if _use_s3 is None:
+        with _lock:
+            if _use_s3 is None:
+                _use_s3 = has_aws_credentials()
+                log.info("s3.storage_selected", use_s3=_use_s3)
+    return _use_s3
+
+
+def _client():
+    global _s3_client
+    if _s3_client is None:
+        with _lock:
+            if _s3_client is None:
+                import boto3
+                from botocore.client import Config
+
+                _s3_client = boto3.client(
+                    "s3",
+                    endpoint_url=f"https://s3.{settings.AWS_REGION}.amazonaws.com",
+                    region_name=settings.AWS_REGION,
+                    config=Config(signature_version="s3v4"),
+                )
+    return _s3_client
+
+
+def warm_up() -> bool:
+    """Resolve as credenciais e cria o cliente antes do primeiro upload (chamado em background no lifespan)."""
+    if use_s3():
+        _client()
+    return use_s3()
+
 
 def public_url(key: str) -> str:
-    if USE_S3:
+    if use_s3():
         return f"https://{settings.S3_BUCKET}.s3.{settings.AWS_REGION}.amazonaws.com/{key}"
     return f"{settings.BASE_URL}/image/{key}"
 
 
+def local_path(key: str):
+    """Caminho no disco de uma chave do armazenamento local (None quando usa S3)."""
+    if use_s3():
+        return None
+    return os.path.join(settings.STATIC_DIR, key)
+
+
 def upload_fileobj(file_obj, key_prefix: str, extension: str = "png") -> str:
     """Upload de arquivo para S3 ou armazenamento local."""
     key = f"{key_prefix}/{uuid.uuid4()}.{extension}"
-    log.debug(f"USE_S3: {USE_S3}")
-    if USE_S3:
-        s3_client.upload_fileobj(
+    if use_s3():
+        _client().upload_fileobj(
             file_obj,
             settings.S3_BUCKET,
             key,
@@ -56,10 +91,22 @@ def upload_fileobj(file_obj, key_prefix: str, extension: str = "png") -> str:
     return key
 
 
+def upload_bytes(key: str, data: bytes, content_type: str) -> str:
+    """Grava bytes em uma chave exata (S3 ou armazenamento local)."""
+    if use_s3():
+        _client().put_object(Bucket=settings.S3_BUCKET, Key=key, Body=data, ContentType=content_type)
+    else:
+        dest = os.path.join(settings.STATIC_DIR, key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(dest, "wb") as f:
+            f.write(data)
+    return key
+
+
 def create_presigned_upload(key_prefix: str, content_type: str, expires_in: int = 3600):
     key = f"{key_prefix}/{uuid.uuid4()}"
-    if USE_S3:
-        url = s3_client.generate_presigned_url(
+    if use_s3():
+        url = _client().generate_presigned_url(
             ClientMethod="put_object",
             Params={"Bucket": settings.S3_BUCKET, "Key": key, "ContentType": content_type},
             ExpiresIn=expires_in,
@@ -70,8 +117,8 @@ def create_presigned_upload(key_prefix: str, content_type: str, expires_in: int
 
 
 def create_presigned_download(key: str, expires_in: int = 3600) -> str:
-    if USE_S3:
-        return s3_client.generate_presigned_url(
+    if use_s3():
+        return _client().generate_presigned_url(
             ClientMethod="get_object",
             Params={"Bucket": settings.S3_BUCKET, "Key": key},
             ExpiresIn=expires_in,
@@ -80,9 +127,28 @@ def create_presigned_download(key: str, expires_in: int = 3600) -> str:
 
 def download_file(key: str) -> bytes:
     """Baixa arquivo do S3 ou do armazenamento local."""
-    if USE_S3:
-        obj = s3_client.get_object(Bucket=settings.S3_BUCKET, Key=key)
+    if use_s3():
+        obj = _client().get_object(Bucket=settings.S3_BUCKET, Key=key)
         return obj["Body"].read()
     path = os.path.join(settings.STATIC_DIR, key)
     with open(path, "rb") as f:
         return f.read()
+
+
+def iter_file_chunks(key: str, chunk_size: int = 64 * 1024):
+    """Lê um arquivo do S3 ou do armazenamento local em blocos, sem carregá-lo inteiro."""
+    if use_s3():
+        obj = _client().get_object(Bucket=settings.S3_BUCKET, Key=key)
+        body = obj["Body"]
+        try:
+            yield from body.iter_chunks(chunk_size)
+        finally:
+            body.close()
+        return
+    path = os.path.join(settings.STATIC_DIR, key)
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
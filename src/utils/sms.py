@@ -1,7 +1,4 @@
-import requests
-import phonenumbers
 import structlog
-from phonenumbers import NumberParseException
 
 from core.config import settings
 
@@ -20,6 +17,8 @@ def send_sms_message(message: str, destination_number: str) -> bool:
         log.error("sms.config_missing", api_url=api_url, api_key=bool(api_key))
         raise RuntimeError("API_KEY ou API_URL não configurados.")
 
+    import requests
+
     try:
         formatted = format_to_e164(destination_number)
         payload = {"key": api_key, "type": 9, "number": formatted, "msg": message}
@@ -51,6 +50,9 @@ def format_to_e164(phone_number: str, country_code: str = "BR") -> str:
     """
     Formata o número de telefone para o padrão internacional E.164.
     """
+    import phonenumbers
+    from phonenumbers import NumberParseException
+
     try:
         parsed = phonenumbers.parse(phone_number, country_code)
         if not phonenumbers.is_valid_number(parsed):
@@ -1,18 +1,30 @@
 import asyncio
 import json
+import os
+import signal
 import sys
 import time
+import sentry_sdk
 import structlog
 
 from io import BytesIO
 from datetime import datetime
 from typing import Optional, Dict, Any
 
+from core import metrics, tracing
+from core.metrics import start_metrics_server
+from core.activity import ActivityIndex
 from core.config import settings
+from core.expiry import ExpiryScheduler
+from core.latency import LatencyModel, workflow_key, enqueued_score, QUEUE_INDEX_KEY, ACTIVE_SERVERS_KEY
 from core.multi_comfyui_api import MultiComfyUiAPI
 from core.redis import redis
+from core.retry import classify_failure, policy_for, PERMANENT
+from core.server_health import ServerHealthRegistry
+from core.supervisor import JobSupervisor
+from utils.derivatives import DerivativeService, parse_specs
 from utils.sms import send_sms_download_message
-from utils.s3 import upload_fileobj, create_presigned_download, download_file
+from utils.s3 import upload_fileobj, create_presigned_download, download_file, local_path
 
 
 log = structlog.get_logger()
@@ -22,66 +34,344 @@ class Worker:
 
     def __init__(self, server_list):
 
+        self.health = ServerHealthRegistry(
+            window_seconds=settings.BREAKER_WINDOW_SECONDS,
+            min_samples=settings.BREAKER_MIN_SAMPLES,
+            error_rate_threshold=settings.BREAKER_ERROR_RATE,
+            max_consecutive_timeouts=settings.BREAKER_CONSECUTIVE_TIMEOUTS,
+            cooldown=settings.BREAKER_COOLDOWN_SECONDS,
+        )
         self.api = MultiComfyUiAPI(
             server_list,
             settings.IMAGE_TEMP_FOLDER,
             settings.WORKFLOW_PATH,
             settings.WORKFLOW_NODE_ID_KSAMPLER,
             settings.WORKFLOW_NODE_ID_IMAGE_LOAD,
-            settings.WORKFLOW_NODE_ID_TEXT_INPUT
+            settings.WORKFLOW_NODE_ID_TEXT_INPUT,
+            health=self.health,
         )
+        self._apis: Dict[str, MultiComfyUiAPI] = {}
+        self._last_status_log = 0.0
         self.queued_jobs: Dict[str, Dict[str, Any]] = {}
+        # jobs em execução neste processo: {request_id: {"task", "server", "api", "prompt_id"}}
+        self.supervisor = JobSupervisor(
+            max_in_flight=settings.WORKER_MAX_IN_FLIGHT,
+            max_per_server=settings.WORKER_MAX_PER_SERVER,
+            on_crash=self._job_crashed,
+        )
+        self._stop = asyncio.Event()
         self.servers_in_use = set()
         self.redis = redis
+        self.latency = LatencyModel(
+            redis,
+            window=settings.LATENCY_WINDOW,
+            default_seconds=settings.ETA_DEFAULT_SECONDS,
+        )
+        self.activity = ActivityIndex(redis, retention_days=settings.STATS_RETENTION_DAYS)
+        self.expiry = ExpiryScheduler(redis, roots=[settings.STATIC_DIR, settings.IMAGE_TEMP_FOLDER])
+        # variantes geradas logo após o upload da saída (ex.: miniaturas da página de resultado)
+        self.derivative_specs = parse_specs(settings.DERIVATIVE_PREGENERATE)
+        self.derivatives = DerivativeService(workers=settings.DERIVATIVE_WORKERS) if self.derivative_specs else None
 
     def _get_api_for_job(self, workflow_path: Optional[str] = None) -> MultiComfyUiAPI:
         """
         Retorna a instância padrão (ENV WORKFLOW_PATH) ou uma instância com workflow_path customizado.
+        As instâncias por workflow ficam em cache e compartilham o cache de templates.
         """
-        if workflow_path:
-            return MultiComfyUiAPI(
+        if not workflow_path:
+            return self.api
+        api = self._apis.get(workflow_path)
+        if api is None:
+            api = self._apis[workflow_path] = MultiComfyUiAPI(
                 self.api.server_address_list,
                 self.api.img_temp_folder,
                 workflow_path,
                 self.api.node_id_ksampler,
                 self.api.node_id_image_load,
-                self.api.node_id_text_input
+                self.api.node_id_text_input,
+                health=self.health,
+                templates=self.api.templates,
             )
-        return self.api
+        return api
 
     def _print_dynamic_status(self, counts: Dict[str, int]) -> None:
         """
-        Escreve uma única linha de status que se sobrescreve no terminal
-        (estilo barra de progresso), sem acumular texto em memória ou disco.
+        Atualiza as métricas de fila/servidores e mostra o status do worker.
+        Em um terminal, é uma única linha que se sobrescreve (estilo barra de
+        progresso); fora dele (coletor de logs), vira um evento estruturado a
+        cada WORKER_STATUS_LOG_INTERVAL segundos.
         """
+        for status in ("queued", "processing", "failed"):
+            metrics.JOBS.labels(status=status).set(counts.get(status, 0))
+        in_flight = self.supervisor.in_flight
+        metrics.WORKER_JOBS.labels(state="in_flight").set(in_flight)
+        metrics.WORKER_JOBS.labels(state="draining").set(in_flight if self.supervisor.draining else 0)
+        metrics.WORKER_JOBS.labels(state="orphaned").set(counts.get("orphaned", 0))
+        # um servidor ocupado pode estar com o breaker aberto: livres = configurados - ocupados - abertos
+        open_breakers = {server for server, b in self.health.snapshot().items() if b["state"] == "open"}
+        free = set(self.api.server_address_list) - self.servers_in_use - open_breakers
+        metrics.SERVER_SLOTS.labels(state="busy").set(len(self.servers_in_use))
+        metrics.SERVER_SLOTS.labels(state="free").set(len(free))
+        metrics.SERVER_SLOTS.labels(state="open").set(len(open_breakers))
+
+        if not sys.stdout.isatty():
+            now = time.monotonic()
+            if now - self._last_status_log >= settings.WORKER_STATUS_LOG_INTERVAL:
+                self._last_status_log = now
+                log.info(
+                    "worker.status",
+                    queued=counts.get("queued", 0),
+                    processing=counts.get("processing", 0),
+                    failed=counts.get("failed", 0),
+                    servers_in_use=len(self.servers_in_use),
+                    in_flight=in_flight,
+                    orphaned=counts.get("orphaned", 0),
+                    draining=self.supervisor.draining,
+                )
+            return
+
         now = datetime.utcnow().strftime("%H:%M:%S")
         line = (
             f"[{now}] queued={counts.get('queued', 0)} "
             f"processing={counts.get('processing', 0)} "
             f"failed={counts.get('failed', 0)} "
-            f"servers_in_use={len(self.servers_in_use)}"
+            f"servers_in_use={len(self.servers_in_use)} "
+            f"in_flight={in_flight}"
+            + (f" orphaned={counts['orphaned']}" if counts.get("orphaned") else "")
+            + (" draining" if self.supervisor.draining else "")
         )
         sys.stdout.write("\r" + line.ljust(80))
         sys.stdout.flush()
 
-    def get_earliest_job(self, queued_jobs: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    def get_earliest_job(
+        self,
+        queued_jobs: Dict[str, Dict[str, Any]],
+        server: Optional[str] = None,
+        free_servers: Optional[set] = None,
+    ) -> Optional[str]:
         """
         Retorna o job_id com menor created_at (ISO string).
+
+        Se `server` for informado, pula jobs que já falharam nesse servidor
+        enquanto houver outro servidor livre (`free_servers`) ainda não tentado.
         """
         min_date = None
         min_job_id = None
         for v in queued_jobs.values():
+            avoid = v.get("avoid_servers") or set()
+            if server and server in avoid and (free_servers or set()) - avoid:
+                continue
             date = v.get("created_at") or ""
             if not min_date or date < min_date:
                 min_date = date
                 min_job_id = v.get("job_id")
         return min_job_id
 
+    async def _fail_job(
+        self,
+        request_id: str,
+        stage: str,
+        error: str,
+        exc: Optional[BaseException] = None,
+        job_data: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        Registra a falha da tentativa atual e decide o próximo passo conforme a
+        classe da falha: agenda novo retry com backoff (status 'failed' +
+        'retry_at') ou encerra o job (status 'error').
+        """
+        key = f"job:{request_id}"
+        if job_data is None:
+            job_data = await self.redis.hgetall(key)
+        attempt = int(job_data.get("attempt") or "1")
+        server = job_data.get("server", "") or ""
+        failure_class = classify_failure(exc, stage)
+        policy = policy_for(failure_class)
+
+        try:
+            attempts_log = json.loads(job_data.get("attempts_log") or "[]")
+        except ValueError:
+            attempts_log = []
+        attempts_log.append({
+            "attempt": attempt,
+            "server": server,
+            "stage": stage,
+            "class": failure_class,
+            "error": error,
+            "at": datetime.utcnow().isoformat(),
+        })
+
+        failed_servers = {x for x in (job_data.get("failed_servers") or "").split(",") if x}
+        if server and failure_class != PERMANENT:
+            failed_servers.add(server)
+            if stage in ("generate", "processing"):
+                timeout = isinstance(exc, (asyncio.TimeoutError, TimeoutError))
+                if self.health.record_failure(server, timeout=timeout):
+                    log.warning("comfyui.breaker_state_changed", server=server, **self.health.get(server).to_dict())
+
+        mapping = {
+            "error": error,
+            "failure_class": failure_class,
+            "attempts_log": json.dumps(attempts_log),
+            "failed_servers": ",".join(sorted(failed_servers)),
+        }
+        workflow = workflow_key(job_data.get("workflow_path"))
+        if isinstance(exc, (asyncio.TimeoutError, TimeoutError)):
+            metrics.TIMEOUTS.labels(stage=stage).inc()
+        if policy.should_retry(attempt):
+            delay = policy.next_delay(attempt)
+            metrics.RETRIES.labels(failure_class=failure_class, stage=stage).inc()
+            mapping.update({"status": "failed", "retry_at": f"{time.time() + delay:.3f}"})
+            log.warning(
+                "worker.job_failed.retry_scheduled",
+                request_id=request_id, stage=stage, failure_class=failure_class,
+                attempt=attempt, delay=round(delay, 2), error=error,
+            )
+        else:
+            mapping["status"] = "error"
+            mapping["finished_at"] = datetime.utcnow().isoformat()
+            metrics.JOBS_FINISHED.labels(result="error").inc()
+            log.error(
+                "worker.job_failed.giving_up",
+                request_id=request_id, stage=stage, failure_class=failure_class,
+                attempt=attempt, error=error,
+            )
+        await self.redis.hset(key, mapping=mapping)
+        await self.activity.record(workflow, "retry" if mapping["status"] == "failed" else "error")
+        tracing.mark_failed(stage, failure_class)
+
+    @staticmethod
+    def _past_deadline(job_data: Dict[str, Any]) -> bool:
+        """
+        O job esperou mais que JOB_QUEUE_DEADLINE desde o envio: quem o enviou
+        provavelmente já foi embora. Jobs de lote não expiram.
+        """
+        if not settings.JOB_QUEUE_DEADLINE or job_data.get("batch_id"):
+            return False
+        return time.time() - enqueued_score(job_data.get("enqueued_at")) > settings.JOB_QUEUE_DEADLINE
+
+    async def _expire_job(self, request_id: str, job_data: Dict[str, Any]) -> None:
+        """Descarta o job antes de ocupar um servidor (status 'error', erro 'queue_deadline_exceeded')."""
+        self.queued_jobs.pop(request_id, None)
+        await self.redis.zrem(QUEUE_INDEX_KEY, request_id)
+        await self.redis.hset(f"job:{request_id}", mapping={
+            "status": "error",
+            "error": "queue_deadline_exceeded",
+            "failure_class": "expired",
+            "finished_at": datetime.utcnow().isoformat(),
+        })
+        await self.activity.record(workflow_key(job_data.get("workflow_path")), "expired")
+        metrics.JOBS_FINISHED.labels(result="expired").inc()
+        log.warning(
+            "worker.job_expired",
+            request_id=request_id,
+            enqueued_at=job_data.get("enqueued_at"),
+            attempt=job_data.get("attempt"),
+        )
+
+    async def _cancel_job(self, request_id: str, job_data: Dict[str, Any]) -> None:
+        """
+        Atende um DELETE /api/jobs/{id}: tira o job da fila interna e do índice,
+        cancela a task em execução e libera o servidor ComfyUI (interrompe o
+        prompt ou o remove da fila do servidor).
+        """
+        self.queued_jobs.pop(request_id, None)
+        running = self.supervisor.pop(request_id)
+        if running:
+            running["task"].cancel()
+            if running.get("prompt_id"):
+                await self._cancel_prompt(running["api"], running["server"], running["prompt_id"], request_id)
+        elif job_data.get("status") == "processing" and job_data.get("prompt_id") and job_data.get("server"):
+            # iniciado por outro processo do worker (ex.: antes de um restart)
+            api = self._get_api_for_job(job_data.get("workflow_path") or None)
+            await self._cancel_prompt(api, job_data["server"], job_data["prompt_id"], request_id)
+
+        if job_data.get("status") == "cancelled":
+            # job ainda na fila: a rota já marcou e contabilizou o cancelamento
+            return
+        # a rota cancelou o job como 'queued' (e já o contabilizou), mas a
+        # tentativa começou antes e trocou o status para 'processing'
+        counted_by_route = bool(job_data.get("finished_at"))
+        await self.redis.zrem(QUEUE_INDEX_KEY, request_id)
+        await self.redis.hset(f"job:{request_id}", mapping={
+            "status": "cancelled",
+            "finished_at": job_data.get("finished_at") or datetime.utcnow().isoformat(),
+        })
+        if not counted_by_route:
+            await self.activity.record(workflow_key(job_data.get("workflow_path")), "cancelled")
+            metrics.JOBS_FINISHED.labels(result="cancelled").inc()
+        log.info(
+            "worker.job_cancelled",
+            request_id=request_id,
+            status=job_data.get("status"),
+            server=job_data.get("server"),
+            prompt_id=(running or job_data).get("prompt_id"),
+        )
+
+    async def _cancel_prompt(self, api: MultiComfyUiAPI, server: str, prompt_id: str, request_id: str) -> None:
+        try:
+            await asyncio.to_thread(api.cancel_prompt, server, prompt_id)
+        except Exception as e:
+            log.warning("worker.cancel_prompt.error", request_id=request_id, server=server, prompt_id=prompt_id, error=str(e))
+
+    def _prompt_queued(self, request_id: str, api: MultiComfyUiAPI, server: str, prompt_id: str) -> None:
+        """
+        Chamado (no loop) quando o ComfyUI aceita o prompt do job. Se a task já
+        não existe (job cancelado ou tentativa abandonada por timeout), ninguém
+        vai esperar pelo resultado: o prompt é cancelado na hora.
+        """
+        running = self.supervisor.get(request_id)
+        if running is not None and running["server"] == server:
+            running["prompt_id"] = prompt_id
+            self.supervisor.spawn(self.redis.hset(f"job:{request_id}", "prompt_id", prompt_id), name=f"prompt:{request_id}")
+        else:
+            self.supervisor.spawn(self._cancel_prompt(api, server, prompt_id, request_id), name=f"cancel:{request_id}")
+
+    def _start_job(self, server_address, request_id, input_path, workflow_path: Optional[str]) -> None:
+        self.supervisor.start(
+            request_id,
+            server_address,
+            self.process_one_job(server_address, request_id, input_path, workflow_path),
+            api=None,  # definida pela task ao carregar o workflow (ver _run_job)
+            prompt_id=None,
+        )
+
+    async def _job_crashed(self, request_id: str, exc: BaseException) -> None:
+        """Exceção que escapou de process_one_job: conta como falha da tentativa (senão o job fica 'processing')."""
+        sentry_sdk.capture_exception(exc)
+        job_data = await self.redis.hgetall(f"job:{request_id}")
+        if job_data.get("status") == "processing":
+            await self._fail_job(request_id, "processing", f"worker_task_crashed: {exc!r}", exc, job_data=job_data)
+
     async def process_one_job(self, server_address, request_id, input_path, workflow_path: Optional[str]):
+        """
+        Executa uma tentativa do job dentro do trace da requisição que o criou
+        (contexto salvo no hash do job), com um span por etapa.
+        """
         log.info("worker.job_popped", server_address=server_address, request_id=request_id, input_path=input_path)
 
-        attempt = int(await self.redis.hget(f"job:{request_id}", "attempt") or "1")
-
+        job_data = await self.redis.hgetall(f"job:{request_id}")
+        if job_data.get("cancel_requested_at"):
+            # cancelado entre a escolha do job e o início da tentativa
+            log.info("worker.job_skipped_cancelled", request_id=request_id)
+            return
+        attempt = int(job_data.get("attempt") or "1")
+        queue_wait = max(time.time() - enqueued_score(job_data.get("enqueued_at")), 0)
+        if attempt == 1:
+            metrics.STAGE_SECONDS.labels(stage=metrics.QUEUE_WAIT).observe(queue_wait)
+
+        with tracing.job_transaction(
+            job_data,
+            "worker.process_job",
+            request_id=request_id,
+            server=server_address,
+            workflow=workflow_key(workflow_path),
+            attempt=attempt,
+        ) as transaction:
+            transaction.set_data("messaging.message.receive.latency", int(queue_wait * 1000))
+            await self._run_job(server_address, request_id, input_path, workflow_path)
+
+    async def _run_job(self, server_address, request_id, input_path, workflow_path: Optional[str]):
         # marca como processing
         now = datetime.utcnow().isoformat()
         await self.redis.hset(
@@ -95,26 +385,39 @@ class Worker:
                 "queue_remaining": "-1",
                 "proc_start_at": now,
                 "server": server_address,
+                "prompt_id": "",
             }
         )
 
+        # seleciona API (workflow_path None => padrão do .env); workflow removido
+        # ou .params.json inválido falham só este job, sem derrubar o worker
+        try:
+            api = self._get_api_for_job(workflow_path if workflow_path else None)
+        except Exception as e:
+            err = f"load_workflow_failed: {e}"
+            log.error("worker.load_workflow.error", request_id=request_id, workflow_path=workflow_path, error=err)
+            await self._fail_job(request_id, "load_workflow", err, e)
+            return
+        running = self.supervisor.get(request_id)
+        if running is not None:
+            running["api"] = api
+
         # obtém imagem de entrada (S3 ou local)
         try:
             log.debug("worker.download_input.start", request_id=request_id, key=input_path)
-            body = download_file(input_path)
+            with tracing.stage(metrics.INPUT_DOWNLOAD):
+                body = await asyncio.to_thread(download_file, input_path)
             if not body:
                 raise RuntimeError("empty body from download_file")
             log.debug("worker.download_input.ok", size=len(body))
         except Exception as e:
             err = f"download_input_failed: {e}"
             log.error("worker.download_input.error", request_id=request_id, error=err)
-            await self.redis.hset(f"job:{request_id}", mapping={"status": "failed", "error": err})
+            await self._fail_job(request_id, "download_input", err, e)
             return
 
         bio = BytesIO(body)
 
-        # seleciona API (workflow_path None => padrão do .env)
-        api = self._get_api_for_job(workflow_path if workflow_path else None)
         await self.redis.hset(f"job:{request_id}", mapping={"server": server_address})
 
         # executa geração com timeout duro
@@ -126,33 +429,56 @@ class Worker:
                 workflow_path=(workflow_path or settings.WORKFLOW_PATH)
             )
             # roda em thread com timeout — usando upload interno da API
+            # (to_thread leva o contexto do trace para os spans do ComfyUI)
+            params = json.loads(await self.redis.hget(f"job:{request_id}", "params") or "{}")
             loop = asyncio.get_running_loop()
-            fut = loop.run_in_executor(None, api.generate_image_buffer_from_bytes, server_address, bio, request_id)
-            out = await asyncio.wait_for(fut, timeout=180)
-            log.info("worker.generate.ok")
-        except asyncio.TimeoutError:
+
+            def on_prompt(prompt_id: str) -> None:
+                loop.call_soon_threadsafe(self._prompt_queued, request_id, api, server_address, prompt_id)
+
+            with sentry_sdk.start_span(op="comfyui.generate", name=server_address):
+                fut = asyncio.to_thread(api.generate_images_from_bytes, server_address, bio, request_id, params, on_prompt)
+                outputs = await asyncio.wait_for(fut, timeout=180)
+            log.info("worker.generate.ok", outputs=len(outputs))
+        except asyncio.TimeoutError as e:
             err = "comfyui_timeout_while_generating"
             log.error("worker.generate.timeout", request_id=request_id)
-            await self.redis.hset(f"job:{request_id}", mapping={"status": "failed", "error": err})
+            # a thread de geração continua presa no websocket e o prompt segue na
+            # GPU: interrompe/remove o prompt (o que também encerra o websocket)
+            running = self.supervisor.get(request_id)
+            prompt_id = running.get("prompt_id") if running is not None else None
+            if prompt_id:
+                running["prompt_id"] = None
+                await self._cancel_prompt(api, server_address, prompt_id, request_id)
+            await self._fail_job(request_id, "generate", err, e)
             return
         except Exception as e:
             err = f"generate_error: {e}"
             log.error("worker.generate.error", request_id=request_id, error=err)
-            await self.redis.hset(f"job:{request_id}", mapping={"status": "failed", "error": err})
+            await self._fail_job(request_id, "generate", err, e)
             return
 
-        # volta o ponteiro pra leitura
+        # envia todas as saídas para o armazenamento configurado, em paralelo
         try:
-            out.seek(0)
-
-            # envia a saída para o armazenamento configurado
-            s3_key = upload_fileobj(out, key_prefix=f"output/{request_id}")
-            image_url = create_presigned_download(s3_key, expires_in=86400)
-            log.info("worker.uploaded_storage", request_id=request_id, key=s3_key)
+            with tracing.stage(metrics.STORAGE_UPLOAD):
+                s3_keys = await asyncio.gather(*(
+                    asyncio.to_thread(upload_fileobj, out, f"output/{request_id}") for out in outputs
+                ))
+            image_urls = [create_presigned_download(k, expires_in=86400) for k in s3_keys]
+            log.info("worker.uploaded_storage", request_id=request_id, keys=s3_keys)
+            if self.derivatives:
+                for out, s3_key in zip(outputs, s3_keys):
+                    self.supervisor.spawn(
+                        self.derivatives.pregenerate(s3_key, self.derivative_specs, original=out.getvalue()),
+                        name=f"derivatives:{request_id}",
+                    )
+            output_dir = local_path(f"output/{request_id}")
+            if output_dir:
+                await self.expiry.schedule(output_dir, settings.EXPIRY_OUTPUT_TTL)
         except Exception as e:
             err = f"upload_output_failed: {e}"
             log.error("worker.upload.error", request_id=request_id, error=err)
-            await self.redis.hset(f"job:{request_id}", mapping={"status": "failed", "error": err})
+            await self._fail_job(request_id, "upload_output", err, e)
             return
 
         duration = time.time() - start
@@ -171,56 +497,36 @@ class Worker:
             }
         )
 
-        # atualiza média móvel
-        prev_avg = float(await self.redis.get("avg_processing_time") or duration)
-        new_avg = prev_avg * 0.8 + duration * 0.2
-        await self.redis.set("avg_processing_time", new_avg)
-        log.info("worker.avg_updated", new_avg=new_avg)
+        # alimenta o modelo de latência por (workflow, servidor) e o circuit breaker
+        await self.latency.record(workflow_key(workflow_path), server_address, duration)
+        self.health.record_success(server_address, duration)
 
         # grava resultado final
-        await self.redis.hset(f"job:{request_id}", mapping={"status": "done", "output": image_url})
-        log.info("worker.job_finished", request_id=request_id, image_url=image_url)
+        # 'output'/'output_key' seguem apontando para a primeira imagem (compatibilidade)
+        await self.redis.hset(f"job:{request_id}", mapping={
+            "status": "done",
+            "finished_at": datetime.utcnow().isoformat(),
+            "output": image_urls[0],
+            "output_key": s3_keys[0],
+            "outputs": json.dumps(image_urls),
+            "output_keys": json.dumps(s3_keys),
+        })
+        await self.activity.record(workflow_key(workflow_path), "done")
+        metrics.JOBS_FINISHED.labels(result="done").inc()
+        log.info("worker.job_finished", request_id=request_id, image_url=image_urls[0], outputs=len(image_urls))
 
         # se tiver telefone, manda SMS síncrono
         phone = await self.redis.hget(f"job:{request_id}", "phone")
         if phone:
             download_url = f"{settings.BASE_URL}/download?image_id={request_id}"
-            sent = send_sms_download_message(download_url, phone)
+            with tracing.stage(metrics.SMS):
+                sent = await asyncio.to_thread(send_sms_download_message, download_url, phone)
             await self.redis.hset(f"job:{request_id}", "sms_status", "sent" if sent else "failed")
             log.info("worker.sms_sent", request_id=request_id, phone=phone, success=sent)
         else:
             log.info("worker.no_phone", request_id=request_id)
 
 
-    async def check_for_new_jobs(self):
-        """
-        Move itens da 'submissions_queue' (lista) para hashes 'job:{id}' normalizados.
-        Evita serializar None como "None". Usa 'enqueued_at' como timestamp de ordenação.
-        """
-        while True:
-            raw = await self.redis.rpop("submissions_queue")
-            if raw is None:
-                break
-
-            job = json.loads(raw)
-            request_id = job["id"]
-            input_path = job["input"]
-            workflow_path = job.get("workflow_path")  # pode estar ausente
-
-            now = datetime.utcnow().isoformat()
-            job_key = f"job:{request_id}"
-
-            mapping = {
-                "status": "queued",
-                "input": input_path,
-                "attempt": "1",
-                "enqueued_at": now,
-            }
-            if workflow_path:
-                mapping["workflow_path"] = workflow_path
-
-            await self.redis.hset(job_key, mapping=mapping)
-
     async def process_jobs(self):
         """
         Carrega jobs do Redis e popula a fila interna self.queued_jobs,
@@ -242,21 +548,6 @@ class Worker:
         matching_statuses = {"processing", "queued", "failed"}
         self.servers_in_use.clear()
 
-        # lê tempo médio de processamento (em segundos), com fallback
-        avg_str = await self.redis.get("avg_processing_time")
-        if isinstance(avg_str, bytes):
-            try:
-                avg_str = avg_str.decode("utf-8")
-            except Exception:
-                avg_str = None
-        try:
-            avg_processing_time = float(avg_str) if avg_str is not None else 20.0
-        except (TypeError, ValueError):
-            avg_processing_time = 20.0
-
-        # min 5s, max 20s
-        estimated_total = max(5.0, min(avg_processing_time, 20.0))
-
         counts: Dict[str, int] = {}
 
         async for key in self.redis.scan_iter("job:*"):
@@ -271,6 +562,11 @@ class Worker:
                 for k, v in job_data.items():
                     log.debug(f"  {k}: {v}")
 
+            if job_data.get("cancel_requested_at"):
+                if status in matching_statuses or request_id in self.queued_jobs or request_id in self.supervisor:
+                    await self._cancel_job(request_id, job_data)
+                continue
+
             if status not in matching_statuses:
                 # se não tem status, não processa
                 if settings.DEBUG_WORKER:
@@ -278,6 +574,10 @@ class Worker:
                     log.debug("-" * 40)
                 continue
 
+            if status in ("queued", "failed") and self._past_deadline(job_data):
+                await self._expire_job(request_id, job_data)
+                continue
+
             counts[status] = counts.get(status, 0) + 1
 
             if status == "queued":
@@ -290,22 +590,31 @@ class Worker:
                         "created_at": enq,           # usado por get_earliest_job
                         "input": input_path,
                         "workflow_path": workflow_path,
+                        "avoid_servers": {x for x in (job_data.get("failed_servers") or "").split(",") if x},
                     }
 
             elif status == "failed":
-                attempt = int(job_data.get("attempt", "1")) + 1
-                if attempt <= 3:
+                # só reenfileira quando o backoff da classe de falha expirar
+                try:
+                    retry_at = float(job_data.get("retry_at") or 0)
+                except ValueError:
+                    retry_at = 0.0
+                if time.time() >= retry_at:
+                    attempt = int(job_data.get("attempt", "1")) + 1
                     await self.redis.hset(
                         f"job:{request_id}",
                         mapping={"status": "queued", "attempt": str(attempt)}
                     )
-                else:
-                    await self.redis.hset(f"job:{request_id}", mapping={"status": "error"})
+                    # volta ao índice na posição original
+                    await self.redis.zadd(QUEUE_INDEX_KEY, {request_id: enqueued_score(job_data.get("enqueued_at"))})
 
             elif status == "processing":
                 server = job_data.get("server", "")
                 if server:
                     self.servers_in_use.add(server)
+                if request_id not in self.supervisor:
+                    # sem task neste processo: de outro worker (deploy em andamento) ou de um que morreu
+                    counts["orphaned"] = counts.get("orphaned", 0) + 1
                 proc_start_at = job_data.get("proc_start_at", "")
                 # se estiver vazio, usa agora para que duration seja zero
                 try:
@@ -317,12 +626,14 @@ class Worker:
 
                 # timeout hard de 300s continua valendo
                 if dur_seconds > 300:
-                    await self.redis.hset(
-                        f"job:{request_id}",
-                        mapping={"status": "failed", "error": "Timeout while processing"},
+                    await self._fail_job(
+                        request_id, "processing", "Timeout while processing",
+                        asyncio.TimeoutError(), job_data=job_data,
                     )
                 else:
-                    # estima progresso com base em tempo decorrido / tempo estimado
+                    # estima progresso com base em tempo decorrido / p50 do (workflow, servidor)
+                    q = await self.latency.quantiles(workflow_key(job_data.get("workflow_path")), server or None)
+                    estimated_total = max(5.0, q["p50"])
                     ratio = dur_seconds / estimated_total if estimated_total > 0 else 0.0
                     percent = int(ratio * 100)
 
@@ -353,24 +664,41 @@ class Worker:
                 log.debug("job.status", job_id=request_id, status=status)
                 log.debug("-" * 40)
 
+        await self.health.publish(self.redis)
+
         if not settings.DEBUG_WORKER:
             self._print_dynamic_status(counts)
 
     async def activate_queued_jobs(self):
         """
-        Escolhe o job mais antigo e ativa em um servidor disponível.
+        Escolhe o job mais antigo e ativa em um servidor disponível, respeitando
+        os limites de jobs em voo (WORKER_MAX_IN_FLIGHT e WORKER_MAX_PER_SERVER).
         """
         earliest_job_id = self.get_earliest_job(self.queued_jobs)
-        if not earliest_job_id:
+        if not earliest_job_id or not self.supervisor.can_start():
             return
 
         available_servers = await self.api.get_available_server_addresses()
+        # publica os servidores ativos para o cálculo de ETA nas rotas
+        active = sorted(set(available_servers) | self.servers_in_use)
+        await self.redis.set(ACTIVE_SERVERS_KEY, json.dumps(active), ex=30)
+
+        # servidores ocupados só com jobs deste processo ainda recebem até WORKER_MAX_PER_SERVER
+        ours = self.supervisor.servers()
+        candidates = available_servers + self.health.rank(
+            [s for s in ours - set(available_servers) if self.health.allow(s)]
+        )
+        busy_elsewhere = self.servers_in_use - ours
+        free_servers = {s for s in candidates if s not in busy_elsewhere and self.supervisor.can_start(s)}
 
-        for available_server in available_servers:
-            if available_server in self.servers_in_use:
+        for available_server in candidates:
+            if available_server not in free_servers:
                 continue
+            if not self.supervisor.can_start():
+                break
 
-            earliest_job_id = self.get_earliest_job(self.queued_jobs)
+            # prefere jobs que ainda não falharam neste servidor
+            earliest_job_id = self.get_earliest_job(self.queued_jobs, available_server, free_servers)
             if earliest_job_id:
                 earliest = self.queued_jobs[earliest_job_id]
                 request_id = earliest["job_id"]
@@ -384,6 +712,7 @@ class Worker:
                 if not input_path:
                     log.warning(f"Input path is empty - request_id:'{request_id}'")
                     self.queued_jobs.pop(request_id, None)
+                    await self.redis.zrem(QUEUE_INDEX_KEY, request_id)
                     await self.redis.hset(
                         f"job:{request_id}",
                         mapping={"status": "error", "error": "No input path"}
@@ -392,27 +721,121 @@ class Worker:
 
                 log.debug(f"Process Job: {request_id} - {input_path}")
                 self.queued_jobs.pop(request_id, None)
+                await self.redis.zrem(QUEUE_INDEX_KEY, request_id)
 
                 # dispara processamento
-                asyncio.create_task(self.process_one_job(available_server, request_id, input_path, workflow_path))
-            else:
+                self.health.acquire(available_server)
+                self._start_job(available_server, request_id, input_path, workflow_path)
+                if not self.supervisor.can_start(available_server):
+                    free_servers.discard(available_server)
+            elif not self.queued_jobs:
                 break
 
+    async def start_expiry(self) -> None:
+        """
+        Agenda o que já existia nas pastas locais (uma única varredura) e inicia
+        o sweeper que remove arquivos vencidos.
+        """
+        seeds = [
+            (os.path.join(settings.STATIC_DIR, "download_images"), settings.EXPIRY_DOWNLOAD_TTL),
+            (settings.IMAGE_TEMP_FOLDER, settings.EXPIRY_TEMP_TTL),
+        ]
+        if local_path("input"):
+            seeds += [
+                (local_path("input"), settings.EXPIRY_INPUT_TTL),
+                (local_path("output"), settings.EXPIRY_OUTPUT_TTL),
+            ]
+        for directory, ttl in seeds:
+            seeded = await self.expiry.seed_directory(directory, ttl)
+            if seeded:
+                log.info("expiry.seeded", directory=directory, entries=seeded)
+        self._expiry_task = asyncio.create_task(self.expiry.run(settings.EXPIRY_SWEEP_INTERVAL))
+
+    async def backfill_activity(self) -> None:
+        """
+        Na primeira subida após a troca para o índice de atividade, importa as
+        saídas locais já existentes, para o `/api/stats` não começar vazio. A
+        marca `stats:backfilled:{pasta}` no Redis garante uma única importação,
+        mesmo com vários workers.
+        """
+        output_dir = local_path("output")
+        if not output_dir:
+            return
+        try:
+            imported = await self.activity.backfill_directory(output_dir)
+        except Exception as e:
+            log.warning("activity.backfill_failed", directory=output_dir, error=str(e))
+            return
+        if imported:
+            log.info("activity.backfilled", directory=output_dir, jobs=imported)
+
+    def request_shutdown(self) -> None:
+        """Handler de SIGTERM/SIGINT: o loop para de pegar jobs e entra em `drain`."""
+        if not self._stop.is_set():
+            log.info("worker.shutdown_requested", in_flight=self.supervisor.in_flight)
+            self._stop.set()
+
+    async def drain(self, timeout: float) -> None:
+        """
+        Desligamento gracioso: nenhum job novo é iniciado; os que estão rodando
+        têm até `timeout` segundos para terminar (o ciclo de process_jobs segue
+        rodando, para progresso e cancelamentos). Os que não terminarem voltam
+        para a fila, para o próximo worker.
+        """
+        self.supervisor.draining = True
+        deadline = time.monotonic() + timeout
+        log.info("worker.draining", in_flight=self.supervisor.in_flight, timeout=timeout)
+        while self.supervisor.in_flight:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            await self.supervisor.wait(timeout=min(remaining, 0.5))
+            await self.process_jobs()
+
+        leftover = self.supervisor.cancel_all()
+        if leftover:
+            await asyncio.wait([job["task"] for _, job in leftover], timeout=5)
+        for request_id, job in leftover:
+            await self._hand_back(request_id, job)
+        await self.supervisor.wait_background(timeout=5)
+        log.info("worker.drained", handed_back=len(leftover))
+
+    async def _hand_back(self, request_id: str, job: Dict[str, Any]) -> None:
+        """Devolve à fila (mesma posição, sem contar tentativa) um job interrompido pelo desligamento."""
+        if job.get("prompt_id"):
+            await self._cancel_prompt(job["api"], job["server"], job["prompt_id"], request_id)
+        job_data = await self.redis.hgetall(f"job:{request_id}")
+        status = job_data.get("status")
+        if status not in ("queued", "processing"):
+            return  # terminou, falhou ou foi cancelado enquanto esperávamos
+        if status == "processing":
+            await self.redis.hset(f"job:{request_id}", mapping={
+                "status": "queued",
+                "server": "",
+                "proc_start_at": "",
+                "prompt_id": "",
+                "percent": "0",
+            })
+        await self.redis.zadd(QUEUE_INDEX_KEY, {request_id: enqueued_score(job_data.get("enqueued_at"))})
+        metrics.JOBS_HANDED_BACK.inc()
+        log.warning("worker.job_handed_back", request_id=request_id, server=job["server"])
+
     async def worker_loop(self):
         """
-        Loop infinito que consome jobs da fila 'submissions_queue' no Redis,
-        processa cada um sequencialmente, atualiza métricas e envia SMS quando
-        o usuário tiver registrado um telefone.
+        Loop que consome os jobs criados pelas rotas (hash 'job:{id}' + índice
+        da fila, ver core.jobs), atualiza métricas e envia SMS quando o usuário
+        tiver registrado um telefone. Termina com `drain` após `request_shutdown`.
         """
-        while True:
+        await self.start_expiry()
+        await self.backfill_activity()
+        while not self._stop.is_set():
             if settings.DEBUG_WORKER:
                 log.debug("sleep")
-            await asyncio.sleep(0.5)
-
-            # verifica se tem novos jobs
-            if settings.DEBUG_WORKER:
-                log.debug("check_for_new_jobs")
-            await self.check_for_new_jobs()
+            try:
+                await asyncio.wait_for(self._stop.wait(), timeout=0.5)
+                break
+            except asyncio.TimeoutError:
+                pass
 
             if settings.DEBUG_WORKER:
                 log.debug("process_jobs")
@@ -425,6 +848,9 @@ class Worker:
             if settings.DEBUG_WORKER:
                 log.debug("=" * 40)
 
+        await self.drain(settings.WORKER_DRAIN_TIMEOUT)
+        self._expiry_task.cancel()
+
 
 if __name__ == "__main__":
     """
@@ -439,6 +865,15 @@ if __name__ == "__main__":
     # filtra vazios
     server_list = [s for s in server_list if s]
 
+    tracing.init_sentry(settings.SENTRY_DSN, settings.SENTRY_TRACES_SAMPLE_RATE)
     worker = Worker(server_list)
-    log.info("worker.startup", servers=server_list)
-    asyncio.run(worker.worker_loop())
+    start_metrics_server(settings.WORKER_METRICS_PORT)
+    log.info("worker.startup", servers=server_list, metrics_port=settings.WORKER_METRICS_PORT)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, worker.request_shutdown)
+        await worker.worker_loop()
+
+    asyncio.run(main())
@@ -0,0 +1,20 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+# Ambiente mínimo exigido por core.config, definido antes de qualquer módulo
+# de teste importar o código da aplicação.
+os.environ.setdefault("BASE_URL", "http://testserver")
+os.environ.setdefault("STATIC_DIR", "static")
+os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
+os.environ.setdefault("AWS_REGION", "us-east-1")
+os.environ.setdefault("S3_BUCKET", "dummy-bucket")
+os.environ.setdefault("COMFYUI_API_SERVER1", "http://localhost")
+os.environ.setdefault("COMFYUI_API_SERVER2", "http://localhost")
+os.environ.setdefault("COMFYUI_API_SERVER3", "http://localhost")
+os.environ.setdefault("COMFYUI_API_SERVER4", "http://localhost")
+os.environ.setdefault("TIMER_TERMS", "20")
+os.environ.setdefault("CONFIG_INDEX", "6")
+os.environ.setdefault("WORKFLOW_NODE_ID_KSAMPLER", "-1")
+os.environ.setdefault("WORKFLOW_NODE_ID_IMAGE_LOAD", "3023")
+os.environ.setdefault("WORKFLOW_NODE_ID_TEXT_INPUT", "-1")
@@ -0,0 +1,89 @@
+import asyncio
+import os
+import sys
+
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.activity import ActivityIndex
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def hincrby(self, key, field, amount=1):
+        data = self.store.setdefault(key, {})
+        data[field] = str(int(data.get(field, 0)) + amount)
+        return int(data[field])
+
+    async def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key, 0)) + 1)
+        return int(self.store[key])
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, nx=False):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+
+def test_buckets_by_hour_workflow_and_status():
+    index = ActivityIndex(FakeRedis())
+
+    async def run():
+        await index.record("wf_a", "done", when=datetime(2024, 5, 1, 10, 15))
+        await index.record("wf_a", "done", when=datetime(2024, 5, 1, 10, 50))
+        await index.record("wf_b", "done", when=datetime(2024, 5, 1, 12, 5))
+        await index.record("wf_b", "error", when=datetime(2024, 5, 1, 12, 6))
+        series = await index.by_hour(datetime(2024, 5, 1, 9), datetime(2024, 5, 1, 13))
+        only_b = await index.count_between(datetime(2024, 5, 1, 0), datetime(2024, 5, 1, 23), workflow="wf_b", status=None)
+        return series, only_b, await index.totals(), await index.version()
+
+    series, only_b, totals, version = asyncio.run(run())
+    assert series == {datetime(2024, 5, 1, 10): 2, datetime(2024, 5, 1, 12): 1}
+    assert only_b == 2
+    assert totals["by_status"] == {"done": 3, "error": 1}
+    assert totals["by_workflow"]["wf_a"] == {"done": 2}
+    assert version == 4
+
+
+def test_backfill_runs_once(tmp_path):
+    for i in range(2):
+        (tmp_path / f"{i}.png").write_bytes(b"x")
+    (tmp_path / "request-id").mkdir()  # saída local de um job: output/{request_id}/
+    (tmp_path / "request-id" / "a.png").write_bytes(b"x")
+    index = ActivityIndex(FakeRedis())
+
+    async def run():
+        return await index.backfill_directory(str(tmp_path)), await index.backfill_directory(str(tmp_path))
+
+    first, second = asyncio.run(run())
+    assert (first, second) == (3, 0)
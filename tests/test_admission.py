@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.admission import AdmissionController
+from core.latency import LatencyModel, QUEUE_INDEX_KEY
+
+
+class FakeRedis:
+    def __init__(self, queued=0, samples=None):
+        self.zsets = {QUEUE_INDEX_KEY: {str(i): float(i) for i in range(queued)}}
+        self.lists = samples or {}
+
+    async def zcard(self, key):
+        return len(self.zsets.get(key, {}))
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+
+def _controller(queued, **kwargs):
+    # 2 servidores com p50 de 10s => vazão de 0,2 job/s
+    redis = FakeRedis(queued, {"latency:default:*": ["10"] * 5})
+    latency = LatencyModel(redis, default_seconds=10.0)
+    return AdmissionController(redis, latency, **kwargs)
+
+
+def test_admits_while_projected_wait_is_under_limit():
+    controller = _controller(queued=10, max_wait=60)
+    decision = asyncio.run(controller.check("default", ["a", "b"]))
+    assert decision.admitted
+    assert decision.queue_depth == 10
+    assert abs(decision.estimated_wait - 50) < 1e-6
+
+
+def test_rejects_with_retry_after_for_the_excess():
+    controller = _controller(queued=20, max_wait=60)
+    decision = asyncio.run(controller.check("default", ["a", "b"]))
+    assert not decision.admitted
+    assert decision.reason == "wait_too_long"
+    # 20 jobs à frente, 12 cabem em 60s: o excedente (8) escoa em 40s
+    assert decision.retry_after == 40
+
+
+def test_queue_cap_and_disabled_controller():
+    capped = _controller(queued=5, max_wait=0, max_queue=5)
+    decision = asyncio.run(capped.check("default", ["a"]))
+    assert not decision.admitted and decision.reason == "queue_full"
+    assert decision.retry_after >= capped.min_retry_after
+
+    assert not _controller(queued=1000, max_wait=0, max_queue=0).enabled
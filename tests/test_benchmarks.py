@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+import run as bench
+
+
+def _report(**medians):
+    return {"machine": "m", "results": {name: {"median": m} for name, m in medians.items()}}
+
+
+def test_measure_runs_sync_and_async_cases():
+    calls = []
+
+    async def tick():
+        calls.append(1)
+
+    times = bench.measure(tick, rounds=3, min_time=0)
+    assert len(times) == 3 and len(calls) == 4  # + aquecimento
+    assert bench.stats(times)["rounds"] == 3
+
+
+def test_compare_flags_only_regressions_above_threshold():
+    baseline = _report(a=1.0, b=1.0, c=1.0)
+    current = _report(a=1.1, b=1.3, c=0.5, d=2.0)
+    assert bench.compare(baseline, current, threshold=0.15) == ["b"]
+
+
+def test_compare_flags_cases_that_failed():
+    current = _report(a=1.0)
+    current["errors"] = {"b": "ValidationError: boom"}
+    assert bench.compare(_report(a=1.0, b=1.0), current, threshold=0.15) == ["b"]
+
+
+def test_run_cases_reports_a_failing_case_and_continues(monkeypatch):
+    import cases
+
+    def broken():
+        raise RuntimeError("setup")
+
+    monkeypatch.setattr(cases, "CASES", {"broken": (broken, {}, 1), "ok": (lambda: (lambda: None), {}, 1)})
+    report = bench.run_cases()
+    assert list(report["errors"]) == ["broken"] and list(report["results"]) == ["ok"]
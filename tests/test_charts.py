@@ -0,0 +1,28 @@
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.charts import ChartCache, chart_etag, render_activity_png
+
+
+DATA = {datetime(2024, 5, 1, h): h for h in range(1, 6)}
+
+
+def test_render_is_thread_safe_png():
+    with ThreadPoolExecutor(4) as pool:
+        images = list(pool.map(lambda style: render_activity_png(DATA, style=style), ["bar", "line"] * 4))
+    assert all(img.startswith(b"\x89PNG") for img in images)
+
+
+def test_cache_renders_once_per_key_and_evicts():
+    cache = ChartCache(max_entries=1)
+    etag, png = cache.get_or_render(("k", 1), DATA)
+    assert etag == chart_etag(("k", 1))
+    assert cache.get(("k", 1)) is png
+
+    cache.get_or_render(("k", 2), DATA)  # nova versão dos dados
+    assert cache.get(("k", 1)) is None
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.comfyui_probe import ComfyUiHealthProbe
+
+
+async def _hanging_server():
+    """Aceita conexões TCP e nunca responde ao handshake do websocket."""
+    async def handle(reader, writer):
+        await asyncio.sleep(60)
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def test_probes_run_concurrently_under_one_deadline():
+    async def run():
+        servers = [await _hanging_server() for _ in range(4)]
+        probe = ComfyUiHealthProbe([url for _, url in servers], deadline=0.3)
+        started = time.monotonic()
+        result = await probe.probe_all()
+        elapsed = time.monotonic() - started
+        for server, _ in servers:
+            server.close()
+        return result, elapsed
+
+    result, elapsed = asyncio.run(run())
+    assert elapsed < 1.0  # 4 servidores, mas um único prazo de 0.3s
+    assert result["status"] == "error"
+    assert all(r["status"] == "error" for r in result["details"].values())
+
+
+def test_snapshot_is_served_from_cache():
+    calls = []
+
+    class CountingProbe(ComfyUiHealthProbe):
+        async def probe_all(self):
+            calls.append(1)
+            return {"status": "ok", "details": {}}
+
+    async def run():
+        probe = CountingProbe([], ttl=60)
+        first = await asyncio.gather(*(probe.snapshot() for _ in range(10)))
+        second = await probe.snapshot()
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert len(calls) == 1
+    assert second["status"] == "ok"
+    assert "age_seconds" in second
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def hgetall(self, key):
+        return {}
+
+
+def test_only_one_process_probes_per_round():
+    calls = []
+
+    class CountingProbe(ComfyUiHealthProbe):
+        async def probe_all(self):
+            calls.append(self.token)
+            return {"status": "ok", "details": {}}
+
+    async def run():
+        redis = FakeRedis()
+        probes = [CountingProbe(["http://gpu"], redis=redis, ttl=60) for _ in range(4)]
+        return [await p.snapshot() for p in probes]
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    # os demais processos servem o resultado publicado no Redis
+    assert [r["status"] for r in results] == ["ok"] * 4
@@ -0,0 +1,66 @@
+import asyncio
+import io
+import os
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.derivatives import DerivativeService, derivative_key, normalize_request, render_derivative
+
+
+def _png(width=800, height=400):
+    buf = io.BytesIO()
+    Image.new("RGBA", (width, height), (255, 0, 0, 255)).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_normalize_request_snaps_width_and_format():
+    assert normalize_request(300, "jpg") == (320, "jpeg")
+    assert normalize_request(5000, None) == (1600, "webp")
+    with pytest.raises(ValueError):
+        normalize_request(100, "bmp")
+
+
+def test_render_resizes_without_upscaling():
+    small = Image.open(io.BytesIO(render_derivative(_png(), 320, "jpeg")))
+    assert (small.format, small.size) == ("JPEG", (320, 160))
+    same = Image.open(io.BytesIO(render_derivative(_png(200, 100), 640, "webp")))
+    assert same.size == (200, 100)
+
+
+def test_concurrent_requests_render_once_and_store():
+    stored = {}
+    loads = []
+    original = _png()
+
+    def load(key):
+        loads.append(key)
+        if key in stored:
+            return stored[key]
+        if key == "output/x/a.png":
+            return original
+        raise FileNotFoundError(key)
+
+    service = DerivativeService(
+        load=load,
+        store=lambda key, data, ct: stored.__setitem__(key, data),
+        executor=ThreadPoolExecutor(2),
+    )
+
+    async def run():
+        return await asyncio.gather(*(service.get("output/x/a.png", 320, "webp") for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert len({data for data, _ in results}) == 1
+    assert list(stored) == [derivative_key("output/x/a.png", 320, "webp")] == ["output/x/a.w320.webp"]
+    assert loads.count("output/x/a.png") == 1
+
+    # segunda instância (outro processo): acha a variante no armazenamento, sem renderizar
+    other = DerivativeService(load=load, store=lambda *a: pytest.fail("não deveria gravar"), executor=ThreadPoolExecutor(1))
+    data, media_type = asyncio.run(other.get("output/x/a.png", 320, "webp"))
+    assert media_type == "image/webp" and data == results[0][0]
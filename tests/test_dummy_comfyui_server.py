@@ -0,0 +1,79 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from dummy_comfyui_server import Faults, LatencyDist, SimulatedComfyUI
+
+
+PROMPT = {
+    "3": {"class_type": "KSampler", "inputs": {"steps": 20, "seed": 1}},
+    "5": {"class_type": "EmptyLatentImage", "inputs": {"batch_size": 2}},
+    "9": {"class_type": "SaveImage", "inputs": {}},
+}
+
+
+class FakeSocket:
+    def __init__(self):
+        self.messages = []
+        self.closed = False
+
+    async def send_json(self, message):
+        self.messages.append(message)
+
+    async def close(self, code=1000):
+        self.closed = True
+
+
+def test_latency_dist_parse_and_floor():
+    import random
+
+    rng = random.Random(0)
+    assert LatencyDist.parse("2.5").sample(rng) == 2.5
+    assert LatencyDist.parse("fixed:0").sample(rng) == 0.05
+    values = [LatencyDist.parse("uniform:1,2").sample(rng) for _ in range(50)]
+    assert all(1 <= v <= 2 for v in values)
+
+
+def test_prompts_run_one_at_a_time_in_order_with_progress():
+    async def run_test():
+        sim = SimulatedComfyUI(LatencyDist("fixed", 0.05), steps=4, seed=1)
+        ws = FakeSocket()
+        sim.sockets["c1"] = ws
+        first = sim.enqueue(PROMPT, "c1")
+        second = sim.enqueue(PROMPT, "c1")
+        assert len(sim.queue_status()["queue_pending"]) == 2
+
+        runner = asyncio.create_task(sim.run())
+        await asyncio.sleep(0.01)
+        status = sim.queue_status()
+        assert status["queue_running"][0][1] == first["prompt_id"]
+        assert [p[1] for p in status["queue_pending"]] == [second["prompt_id"]]
+
+        while sim.completed < 2:
+            await asyncio.sleep(0.01)
+        runner.cancel()
+
+        done = [m["data"]["prompt_id"] for m in ws.messages if m["type"] == "executing" and m["data"]["node"] is None]
+        assert done == [first["prompt_id"], second["prompt_id"]]
+        progress = [m["data"]["value"] for m in ws.messages if m["type"] == "progress" and m["data"]["prompt_id"] == first["prompt_id"]]
+        assert progress == [1, 2, 3, 4]
+        assert len(sim.history[first["prompt_id"]]["outputs"]["9"]["images"]) == 2
+
+    asyncio.run(run_test())
+
+
+def test_injected_error_and_disconnect():
+    async def run_test():
+        sim = SimulatedComfyUI(LatencyDist("fixed", 0.05), steps=2, faults=Faults(error_rate=1.0, disconnect_rate=1.0), seed=1)
+        ws = FakeSocket()
+        sim.sockets["c1"] = ws
+        sim.enqueue(PROMPT, "c1")
+        runner = asyncio.create_task(sim.run())
+        while not sim.failed:
+            await asyncio.sleep(0.01)
+        runner.cancel()
+        assert ws.closed or any(m["type"] == "execution_error" for m in ws.messages)
+
+    asyncio.run(run_test())
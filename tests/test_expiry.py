@@ -0,0 +1,66 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.expiry import ExpiryScheduler, EXPIRY_KEY
+
+
+class FakeRedis:
+    def __init__(self):
+        self.zsets = {}
+
+    async def zadd(self, key, mapping):
+        self.zsets.setdefault(key, {}).update(mapping)
+
+    async def zscore(self, key, member):
+        return self.zsets.get(key, {}).get(member)
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.zsets.get(key, {}).pop(m, None)
+
+    async def zrangebyscore(self, key, lo, hi, start=0, num=None):
+        items = sorted((s, m) for m, s in self.zsets.get(key, {}).items() if s <= hi)
+        return [m for _, m in items][start:start + num if num else None]
+
+    async def zrange(self, key, start, end, withscores=False):
+        items = sorted((s, m) for m, s in self.zsets.get(key, {}).items())[start:end + 1]
+        return [(m, s) for s, m in items] if withscores else [m for _, m in items]
+
+
+def test_sweep_removes_only_expired_entries(tmp_path):
+    old_dir = tmp_path / "download_images" / "old"
+    old_dir.mkdir(parents=True)
+    (old_dir / "a.png").write_bytes(b"x")
+    fresh = tmp_path / "fresh.png"
+    fresh.write_bytes(b"x")
+
+    fake = FakeRedis()
+    expiry = ExpiryScheduler(fake, roots=[str(tmp_path)])
+
+    async def run():
+        await expiry.schedule(str(old_dir), ttl=10, now=0)
+        await expiry.schedule(str(fresh), ttl=10, now=100)
+        await expiry.schedule("/etc/passwd", ttl=0, now=0)  # fora das raízes: ignorado
+        removed = await expiry.sweep(now=50)
+        return removed, await expiry.next_deadline()
+
+    removed, next_deadline = asyncio.run(run())
+    assert removed == 1
+    assert not old_dir.exists()
+    assert fresh.exists()
+    assert next_deadline == 110
+    assert "/etc/passwd" not in fake.zsets[EXPIRY_KEY]
+
+
+def test_seed_directory_schedules_existing_entries_once(tmp_path):
+    for name in ("a", "b"):
+        (tmp_path / name).mkdir()
+    expiry = ExpiryScheduler(FakeRedis(), roots=[str(tmp_path)])
+
+    async def run():
+        return await expiry.seed_directory(str(tmp_path), ttl=60), await expiry.seed_directory(str(tmp_path), ttl=60)
+
+    assert asyncio.run(run()) == (2, 0)
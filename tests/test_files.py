@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import zipfile
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from fastapi import HTTPException
+
+from utils.files import create_zip_of_images, iter_zip_stream, open_zip_images
+
+
+def _zip(names):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name in names:
+            zf.writestr(name, b"data")
+    buf.seek(0)
+    return buf
+
+
+def test_open_zip_images_lists_only_images():
+    zf, names = open_zip_images(_zip(["a.png", "dir/b.JPG", "notes.txt", "__MACOSX/._c.png", ".hidden.png"]))
+    zf.close()
+    assert names == ["a.png", "dir/b.JPG"]
+
+
+def test_open_zip_images_limits_and_rejects_invalid():
+    with pytest.raises(HTTPException) as exc:
+        open_zip_images(_zip(["a.png", "b.png", "c.png"]), max_members=2)
+    assert exc.value.status_code == 413
+
+    with pytest.raises(HTTPException) as exc:
+        open_zip_images(io.BytesIO(b"not a zip"))
+    assert exc.value.status_code == 400
+
+
+def test_zip_stream_is_chunked_and_stores_images():
+    big = os.urandom(300 * 1024)
+    members = [
+        ("a.png", (big[i:i + 64 * 1024] for i in range(0, len(big), 64 * 1024))),
+        ("notes.txt", [b"hello " * 100]),
+    ]
+    chunks = list(iter_zip_stream(members))
+    assert len(chunks) > 3
+
+    with zipfile.ZipFile(io.BytesIO(b"".join(chunks))) as zf:
+        assert zf.read("a.png") == big
+        assert zf.read("notes.txt") == b"hello " * 100
+        assert zf.getinfo("a.png").compress_type == zipfile.ZIP_STORED
+        assert zf.getinfo("notes.txt").compress_type == zipfile.ZIP_DEFLATED
+
+
+def test_create_zip_of_images_still_returns_buffer(tmp_path):
+    (tmp_path / "x.png").write_bytes(b"png")
+    (tmp_path / "skip.txt").write_bytes(b"txt")
+    buf = create_zip_of_images(str(tmp_path))
+    with zipfile.ZipFile(buf) as zf:
+        assert zf.namelist() == ["x.png"]
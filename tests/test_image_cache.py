@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils.image_cache import ImageCache, etag_matches, is_immutable_key, parse_range
+
+
+RID = "0b6f2a4e-3c1d-4e7f-9a8b-1c2d3e4f5a6b"
+
+
+def test_immutable_keys_are_uuid_outputs():
+    assert is_immutable_key(f"output/{RID}/{RID}.png")
+    assert not is_immutable_key("templates/logo.png")
+
+
+def test_parse_range():
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=0-500", 100) == (0, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None  # multi-range: resposta completa
+    with pytest.raises(ValueError):
+        parse_range("bytes=100-", 100)
+
+
+def test_etag_is_content_hash_and_revalidated_on_change(tmp_path):
+    f = tmp_path / "a.png"
+    f.write_bytes(b"one")
+    cache = ImageCache()
+
+    first = cache.load(str(f))
+    assert cache.load(str(f)) is first
+    assert first.content == b"one"
+    assert etag_matches(f'W/{first.etag}, "other"', first.etag)
+
+    f.write_bytes(b"two!")
+    os.utime(f, ns=(first.mtime_ns + 10**9, first.mtime_ns + 10**9))
+    second = cache.load(str(f))
+    assert second.etag != first.etag and second.content == b"two!"
+    assert cache.load(str(tmp_path / "missing.png")) is None
+
+
+def test_content_lru_is_bounded(tmp_path):
+    cache = ImageCache(max_bytes=10, max_file_bytes=8)
+    for name in ("a", "b"):
+        (tmp_path / name).write_bytes(b"x" * 6)
+    (tmp_path / "big").write_bytes(b"x" * 9)
+
+    a = cache.load(str(tmp_path / "a"))
+    b = cache.load(str(tmp_path / "b"))
+    big = cache.load(str(tmp_path / "big"))
+    assert a.content is None and b.content is not None
+    assert big.content is None and big.etag  # grande demais: só o ETag
+
+
+def test_removed_large_file_is_evicted(tmp_path):
+    cache = ImageCache(max_file_bytes=4)
+    f = tmp_path / "big.png"
+    f.write_bytes(b"x" * 9)
+    assert cache.load(str(f)).content is None
+
+    f.unlink()  # removido pelo sweeper de expiração
+    assert cache.load(str(f)) is None
+    assert cache.peek(str(f)) is None
+
+
+def test_route_returns_404_for_small_cached_file_removed_from_disk(monkeypatch, tmp_path):
+    import asyncio
+    from fastapi import HTTPException
+    from starlette.requests import Request
+    from routes import routes
+
+    monkeypatch.setattr(routes.settings, "STATIC_DIR", str(tmp_path))
+    monkeypatch.setattr(routes, "image_cache", ImageCache())
+    key = "output/00000000-0000-0000-0000-000000000001/00000000-0000-0000-0000-000000000002.png"
+    (tmp_path / key).parent.mkdir(parents=True)
+    (tmp_path / key).write_bytes(b"png")
+    request = Request({"type": "http", "method": "GET", "path": f"/image/{key}", "headers": []})
+
+    async def get():
+        return await routes.serve_image(key, request, w=None, fmt=None)
+
+    assert asyncio.run(get()).body == b"png"  # agora com os bytes em memória
+    (tmp_path / key).unlink()  # removido pelo sweeper do worker
+    with pytest.raises(HTTPException) as err:
+        asyncio.run(get())
+    assert err.value.status_code == 404
+    assert routes.image_cache.peek(str(tmp_path / key)) is None
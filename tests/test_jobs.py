@@ -0,0 +1,53 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core import jobs
+from core.latency import QUEUE_INDEX_KEY, enqueued_score
+
+
+class FakePipeline:
+    def __init__(self, redis, transaction):
+        self.redis = redis
+        self.transaction = transaction
+        self.ops = []
+
+    def hset(self, key, mapping):
+        self.ops.append(("hset", key, mapping))
+
+    def zadd(self, key, mapping):
+        self.ops.append(("zadd", key, mapping))
+
+    async def execute(self):
+        self.redis.executed.append((self.transaction, [op[0] for op in self.ops]))
+        for name, key, mapping in self.ops:
+            self.redis.store.setdefault(key, {}).update(mapping)
+
+
+class FakeRedis:
+    def __init__(self):
+        self.store = {}
+        self.executed = []
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self, transaction)
+
+
+def test_enqueue_creates_hash_and_index_entry_in_one_transaction():
+    redis = FakeRedis()
+    job = jobs.new_job("input/r1/a.png", "2026-01-01T12:00:00", params=None, trace={"sentry_trace": "t"})
+
+    asyncio.run(jobs.enqueue(redis, "r1", job))
+
+    assert redis.executed == [(True, ["hset", "zadd"])]
+    assert redis.store["job:r1"] == {
+        "status": "queued",
+        "input": "input/r1/a.png",
+        "output": "",
+        "attempt": "1",
+        "enqueued_at": "2026-01-01T12:00:00",
+        "sentry_trace": "t",
+    }
+    assert redis.store[QUEUE_INDEX_KEY] == {"r1": enqueued_score("2026-01-01T12:00:00")}
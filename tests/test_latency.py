@@ -0,0 +1,82 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.latency import LatencyModel, quantile, workflow_key
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def lpush(self, key, value):
+        self.ops.append(("lpush", key, value))
+
+    def ltrim(self, key, start, end):
+        self.ops.append(("ltrim", key, start, end))
+
+    async def execute(self):
+        for op, key, *args in self.ops:
+            if op == "lpush":
+                self.redis.lists.setdefault(key, []).insert(0, args[0])
+            else:
+                start, end = args
+                self.redis.lists[key] = self.redis.lists.get(key, [])[start:end + 1]
+
+
+class FakeRedis:
+    def __init__(self):
+        self.lists = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def lrange(self, key, start, end):
+        return list(self.lists.get(key, []))
+
+
+def test_quantile_interpolates():
+    assert quantile([1.0, 2.0, 3.0, 4.0], 0.5) == pytest.approx(2.5)
+    assert quantile([10.0], 0.9) == 10.0
+
+
+def test_workflow_key_uses_file_stem():
+    assert workflow_key("src/workflows/orfeu_production_model_v11.json") == "orfeu_production_model_v11"
+    assert workflow_key(None) == "default"
+
+
+def test_quantiles_per_server_fall_back_to_workflow_and_default():
+    model = LatencyModel(FakeRedis(), window=3, default_seconds=80.0, cache_ttl=0)
+
+    async def run():
+        assert (await model.quantiles("wf", "a"))["p50"] == 80.0
+        for d in (10.0, 20.0, 30.0, 40.0):
+            await model.record("wf", "a", d)
+        per_server = await model.quantiles("wf", "a")
+        other_server = await model.quantiles("wf", "b")
+        return per_server, other_server
+
+    per_server, other_server = asyncio.run(run())
+    # janela de 3 amostras: 20, 30, 40
+    assert per_server["count"] == 3
+    assert per_server["p50"] == pytest.approx(30.0)
+    # servidor sem amostras usa o agregado do workflow
+    assert other_server["p50"] == pytest.approx(30.0)
+
+
+def test_estimate_wait_scales_with_active_servers():
+    model = LatencyModel(FakeRedis(), default_seconds=10.0, cache_ttl=0)
+
+    async def run():
+        one = await model.estimate_wait(4, "wf", ["a"])
+        two = await model.estimate_wait(4, "wf", ["a", "b"])
+        return one, two
+
+    one, two = asyncio.run(run())
+    assert one["p50"] == pytest.approx(4 * 10.0 + 10.0)
+    assert two["p50"] == pytest.approx(4 * 5.0 + 10.0)
@@ -0,0 +1,51 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.leader import LeaderLock, RELEASE_SCRIPT
+
+
+class FakeRedis:
+    """SET NX e os dois scripts do lock, sem expiração real."""
+
+    def __init__(self):
+        self.store = {}
+
+    async def set(self, key, value, nx=False, px=None):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def eval(self, script, numkeys, key, token, *args):
+        if self.store.get(key) != token:
+            return 0
+        if script == RELEASE_SCRIPT:
+            del self.store[key]
+        return 1
+
+
+def test_single_leader_and_handover_on_stop():
+    redis = FakeRedis()
+    events = []
+
+    def lock(name):
+        return LeaderLock(
+            redis, "log_sender",
+            on_elected=lambda: events.append(f"{name}:elected"),
+            on_deposed=lambda: events.append(f"{name}:deposed"),
+        )
+
+    async def run():
+        a, b = lock("a"), lock("b")
+        assert await a.tick() and not await b.tick()
+        assert await a.tick()  # renovação
+        await a.stop()
+        assert await b.tick()
+        redis.store["leader:log_sender"] = "outro"  # lock expirou e foi tomado
+        assert not await b.tick()
+
+    asyncio.run(run())
+    assert events == ["a:elected", "a:deposed", "b:elected", "b:deposed"]
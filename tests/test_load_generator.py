@@ -0,0 +1,36 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from load_generator import percentile, summarize
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([3.0], 95) == 3.0
+    assert percentile([], 50) is None
+
+
+def test_summarize_splits_queue_wait_and_service_time():
+    results = [
+        {"status": "done", "latency": 12.0, "timings": {
+            "enqueued_at": "2026-01-01T10:00:00", "started_at": "2026-01-01T10:00:04",
+            "finished_at": "2026-01-01T10:00:12", "attempt": 1,
+        }},
+        {"status": "done", "latency": 9.0, "timings": {
+            "enqueued_at": "2026-01-01T10:00:01", "started_at": "2026-01-01T10:00:02",
+            "finished_at": "2026-01-01T10:00:10", "attempt": 2,
+        }},
+        {"status": "error", "latency": 3.0},
+        {"status": "rejected", "latency": 0.1},
+    ]
+    report = summarize(results, duration=20.0)
+    assert report["counts"] == {"done": 2, "error": 1, "rejected": 1}
+    assert report["throughput"] == 0.1
+    assert report["queue_wait"]["p50"] == 1.0
+    assert report["queue_wait"]["max"] == 4.0
+    assert report["service_time"]["p99"] == 8.0
+    assert report["retries"] == 1
@@ -0,0 +1,169 @@
+import csv
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from utils import log_sender as log_sender_module
+from utils.log_sender import LogSender, RingBuffer
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeSession:
+    def __init__(self, status_code=200):
+        self.status_code = status_code
+        self.posts = []
+
+    def post(self, url, data=None, timeout=None):
+        self.posts.append(data)
+        return FakeResponse(self.status_code)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def sender(tmp_path, monkeypatch):
+    segment_dir = tmp_path / "segments"
+    monkeypatch.setattr(LogSender, "csv_filename", str(tmp_path / "datalogs.csv"))
+    monkeypatch.setattr(LogSender, "backup_filename", str(tmp_path / "datalogs_backup.csv"))
+    monkeypatch.setattr(LogSender, "dead_letter_filename", str(tmp_path / "datalogs_dead_letter.jsonl"))
+    monkeypatch.setattr(LogSender, "segment_dir", str(segment_dir))
+    monkeypatch.setattr(LogSender, "cursor_filename", str(segment_dir / "cursor.json"))
+    s = LogSender("http://logs", "proj", autostart=False)
+    yield s
+    s.close()
+
+
+def test_drain_sends_and_advances_cursor(sender):
+    sender.session = FakeSession(200)
+    for i in range(5):
+        sender.log("played", additional=str(i))
+    sender.flush()
+
+    sent, ok = sender._drain()
+
+    assert ok and sent == 5
+    assert [p["additional"] for p in sender.session.posts] == ["0", "1", "2", "3", "4"]
+    with open(sender.backup_filename, newline="") as f:
+        assert len(list(csv.DictReader(f))) == 5
+
+    # nada novo: segundo drain não reenvia
+    sender.session.posts.clear()
+    sent, ok = sender._drain()
+    assert ok and sent == 0 and sender.session.posts == []
+
+
+def test_drain_keeps_cursor_when_api_is_down(sender):
+    sender.session = FakeSession(500)
+    sender.log("played")
+    sender.flush()
+
+    sent, ok = sender._drain()
+    assert not ok and sent == 0
+
+    sender.session = FakeSession(200)
+    sent, ok = sender._drain()
+    assert ok and sent == 1
+
+
+def test_invalid_record_goes_to_dead_letter_and_does_not_block(sender):
+    sender.session = FakeSession(200)
+    sender.log("before")
+    sender._append_records([{"status": "no-project"}])
+    sender.flush()
+    sender._append_records([{"status": "after", "project": "proj", "additional": "", "timePlayed": "t"}])
+
+    sent, ok = sender._drain()
+
+    assert ok and sent == 2
+    assert [p["status"] for p in sender.session.posts] == ["before", "after"]
+    with open(sender.dead_letter_filename) as f:
+        assert [json.loads(line)["status"] for line in f] == ["no-project"]
+    sent, ok = sender._drain()
+    assert ok and sent == 0
+
+
+def test_sealed_segment_is_removed_after_drain(sender):
+    sender.session = FakeSession(200)
+    sender.segment_max_bytes = 1
+    sender.log("played")
+    sender.flush()
+    assert any(n.endswith(log_sender_module.SEALED_SUFFIX) for n in os.listdir(sender.segment_dir))
+
+    sender._drain()
+
+    names = [n for n in os.listdir(sender.segment_dir) if n != "cursor.json"]
+    assert names == []
+    with open(sender.cursor_filename) as f:
+        assert json.load(f) == {}
+
+
+def test_legacy_csv_rows_are_imported(sender):
+    with open(sender.csv_filename, "a", newline="") as f:
+        csv.writer(f).writerow(["played", "proj", "legacy", "2024-01-01T00:00:00Z"])
+    sender.session = FakeSession(200)
+
+    sender._import_legacy_csv()
+    sent, ok = sender._drain()
+
+    assert ok and sent == 1
+    assert sender.session.posts[0]["additional"] == "legacy"
+    with open(sender.csv_filename, newline="") as f:
+        assert list(csv.DictReader(f)) == []
+
+
+def test_ring_buffer_drop_oldest_counts_dropped():
+    buf = RingBuffer(2, policy="drop_oldest")
+    for i in range(4):
+        assert buf.put(i)
+
+    assert buf.dropped == 2
+    assert buf.get_batch(10) == [2, 3]
+
+
+def test_ring_buffer_block_drops_new_record_after_timeout():
+    buf = RingBuffer(1, policy="block", block_timeout=0.01)
+    buf.put("a")
+    buf.put("b")
+
+    assert buf.dropped == 1
+    assert buf.get_batch(10) == ["a"]
+
+
+def test_spill_policy_writes_straight_to_segment(sender):
+    sender._buffer = RingBuffer(1, policy="spill")
+    sender.session = FakeSession(200)
+    sender.log("played", additional="buffered")
+    sender.log("played", additional="spilled")
+
+    assert sender.stats()["spilled"] == 1
+    sender.flush()
+    sent, ok = sender._drain()
+    assert ok and sent == 2
+    assert [p["additional"] for p in sender.session.posts] == ["spilled", "buffered"]
+
+
+def test_uploader_runs_only_when_started(sender):
+    sender.session = FakeSession(200)
+    sender.start(upload=False)
+    sender.log("ok")
+    sender.flush()
+    assert sender._uploader is None
+
+    sender.start_uploader()
+    assert sender._uploader.is_alive()
+    deadline = time.monotonic() + 5
+    while not sender.session.posts and time.monotonic() < deadline:
+        time.sleep(0.01)
+    sender.stop_uploader(timeout=5)
+    assert sender._uploader is None
+    assert len(sender.session.posts) == 1
@@ -0,0 +1,30 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core import metrics
+
+
+def _sample(name, **labels):
+    from prometheus_client import REGISTRY
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_timed_observes_stage_even_on_error():
+    before = _sample("comfyui_job_stage_seconds_count", stage=metrics.VIEW_FETCH)
+    with metrics.timed(metrics.VIEW_FETCH):
+        pass
+    with pytest.raises(RuntimeError):
+        with metrics.timed(metrics.VIEW_FETCH):
+            raise RuntimeError("x")
+    assert _sample("comfyui_job_stage_seconds_count", stage=metrics.VIEW_FETCH) == before + 2
+
+
+def test_render_latest_exposes_openmetrics_text():
+    metrics.cache_result("image", True)
+    body, content_type = metrics.render_latest()
+    assert content_type.startswith("text/plain")
+    assert b'comfyui_cache_requests_total{cache="image",result="hit"}' in body
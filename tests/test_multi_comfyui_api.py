@@ -0,0 +1,96 @@
+import io
+import os
+import sys
+import time
+
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.multi_comfyui_api import MultiComfyUiAPI
+
+
+def _png(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (4, 4), color).save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_collect_outputs_returns_every_image_in_order(tmp_path):
+    workflow = tmp_path / "wf.json"
+    workflow.write_text("{}")
+    api = MultiComfyUiAPI([], str(tmp_path), str(workflow), "3", "10", "6")
+
+    history = {"p1": {"outputs": {
+        "9": {"images": [
+            {"filename": "a_0.png", "subfolder": "", "type": "output"},
+            {"filename": "a_1.png", "subfolder": "", "type": "output"},
+        ]},
+        "12": {"images": [{"filename": "b_0.png", "subfolder": "", "type": "output"}]},
+        "20": {"images": [{"filename": "preview.png", "subfolder": "", "type": "temp"}]},
+    }}}
+    colors = {"a_0.png": "red", "a_1.png": "green", "b_0.png": "blue"}
+
+    def slow_get_image(server, filename, subfolder, folder_type):
+        time.sleep(0.2)
+        return _png(colors[filename])
+
+    api.get_history = lambda server, prompt_id: history
+    api.get_image = slow_get_image
+
+    started = time.monotonic()
+    outputs = api.collect_outputs("http://srv", "p1")
+    elapsed = time.monotonic() - started
+
+    assert elapsed < 0.5  # /view em paralelo
+    pixels = [Image.open(o).getpixel((0, 0)) for o in outputs]
+    assert pixels == [(255, 0, 0), (0, 128, 0), (0, 0, 255)]  # node "9" antes de "12"; preview ignorado
+
+
+class _Response:
+    def __init__(self, data=None):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+class _QueueSession:
+    """Sessão HTTP falsa com o /queue do ComfyUI: p1 rodando, p2 pendente."""
+
+    def __init__(self):
+        self.posts = []
+
+    def get(self, url, timeout=None):
+        return _Response({
+            "queue_running": [[0, "p1", {}, {}, []]],
+            "queue_pending": [[1, "p2", {}, {}, []]],
+        })
+
+    def post(self, url, json=None, timeout=None):
+        self.posts.append((url.rsplit("/", 1)[-1], json))
+        return _Response()
+
+
+class _Socket:
+    aborted = False
+
+    def abort(self):
+        self.aborted = True
+
+
+def test_cancel_prompt_interrupts_running_and_deletes_pending(tmp_path):
+    workflow = tmp_path / "wf.json"
+    workflow.write_text("{}")
+    api = MultiComfyUiAPI([], str(tmp_path), str(workflow), "3", "10", "6")
+    api.session = _QueueSession()
+    ws = api._open_ws["p2"] = _Socket()
+
+    assert api.cancel_prompt("http://srv/", "p1") == "interrupted"
+    assert api.cancel_prompt("http://srv/", "p2") == "deleted"
+    assert api.cancel_prompt("http://srv/", "p3") == "not_found"
+    assert api.session.posts == [("interrupt", {"prompt_id": "p1"}), ("queue", {"delete": ["p2"]})]
+    assert ws.aborted and not api._open_ws  # a thread que esperava p2 é liberada
@@ -0,0 +1,221 @@
+import io
+import json
+import os
+import zipfile
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from core.latency import QUEUE_INDEX_KEY
+from routes import routes
+from utils import s3
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+WORKFLOW = "no_flux_ex_v01_api.json"
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
+class FakeRedis:
+    """Subconjunto assíncrono do redis-py usado pelas rotas (decode_responses=True)."""
+
+    def __init__(self):
+        self.store = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def exists(self, key):
+        return int(key in self.store)
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, nx=False, **kwargs):
+        if nx and key in self.store:
+            return None
+        self.store[key] = value
+        return True
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key) or 0) + 1)
+        return int(self.store[key])
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def hset(self, key, field=None, value=None, mapping=None):
+        data = self.store.setdefault(key, {})
+        if field is not None:
+            data[field] = value
+        data.update(mapping or {})
+
+    async def hget(self, key, field):
+        return self.store.get(key, {}).get(field)
+
+    async def hmget(self, key, *fields):
+        data = self.store.get(key, {})
+        return [data.get(f) for f in fields]
+
+    async def hgetall(self, key):
+        return dict(self.store.get(key, {}))
+
+    async def hincrby(self, key, field, amount=1):
+        data = self.store.setdefault(key, {})
+        data[field] = str(int(data.get(field, 0)) + amount)
+
+    async def rpush(self, key, *values):
+        self.store.setdefault(key, []).extend(values)
+
+    async def lpush(self, key, *values):
+        self.store.setdefault(key, [])[:0] = reversed(values)
+
+    async def ltrim(self, key, start, end):
+        self.store[key] = self.store.get(key, [])[start:end + 1]
+
+    async def lrange(self, key, start, end):
+        items = self.store.get(key, [])
+        return list(items[start:] if end == -1 else items[start:end + 1])
+
+    async def zadd(self, key, mapping):
+        self.store.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.store.get(key, {}).pop(m, None)
+
+    async def zcard(self, key):
+        return len(self.store.get(key, {}))
+
+    async def zrank(self, key, member):
+        ranked = sorted(self.store.get(key, {}).items(), key=lambda kv: kv[1])
+        return next((i for i, (m, _) in enumerate(ranked) if m == member), None)
+
+
+@pytest.fixture
+def fake(monkeypatch, tmp_path):
+    fake = FakeRedis()
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(routes, "redis", fake)
+    for component in (routes.latency, routes.activity, routes.admission, routes.expiry):
+        monkeypatch.setattr(component, "redis", fake)
+    monkeypatch.setattr(s3, "_use_s3", False)
+    monkeypatch.setattr(s3.settings, "STATIC_DIR", str(tmp_path))
+    return fake
+
+
+@pytest.fixture
+def client(fake):
+    app = FastAPI()
+    app.include_router(routes.router)
+    with TestClient(app) as client:
+        yield client
+
+
+def _zip(*names):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name in names:
+            zf.writestr(name, b"png-" + name.encode())
+    return buf.getvalue()
+
+
+def test_batch_create_progress_and_download(client, fake, tmp_path):
+    resp = client.post(
+        "/api/batch",
+        data={"workflow": WORKFLOW, "params": json.dumps({"steps": 8})},
+        files=[
+            ("images", ("a.png", b"png-a", "image/png")),
+            ("archive", ("lote.zip", _zip("b.png", "c.jpg", "notas.txt"), "application/zip")),
+        ],
+    )
+    assert resp.status_code == 200
+    body = resp.json()
+    batch_id, rids = body["batch_id"], body["request_ids"]
+    assert body["total"] == 3 and len(rids) == 3
+    assert list(fake.store[f"batch:{batch_id}:jobs"]) == rids
+    # lote inteiro na fila, na ordem de envio
+    assert sorted(rids, key=fake.store[QUEUE_INDEX_KEY].get) == rids
+    job = fake.store[f"job:{rids[0]}"]
+    assert job["status"] == "queued" and job["batch_id"] == batch_id
+    assert job["workflow_path"] == f"src/workflows/{WORKFLOW}"
+    assert json.loads(job["params"]) == {"steps": 8}
+    assert (tmp_path / job["input"]).read_bytes() == b"png-a"
+
+    # um job pronto e um com erro
+    output_key = f"output/{rids[0]}/out.png"
+    (tmp_path / output_key).parent.mkdir(parents=True)
+    (tmp_path / output_key).write_bytes(b"resultado")
+    fake.store[f"job:{rids[0]}"].update(status="done", output_key=output_key, output_keys=json.dumps([output_key]))
+    fake.store[f"job:{rids[1]}"]["status"] = "error"
+
+    progress = client.get(f"/api/batch/{batch_id}").json()
+    assert progress["counts"] == {"done": 1, "error": 1, "queued": 1}
+    assert progress["percent"] == 66
+    assert progress["complete"] is False
+
+    resp = client.get(f"/api/batch/{batch_id}/download")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as zf:
+        assert zf.namelist() == [f"{rids[0]}.png"]
+        assert zf.read(f"{rids[0]}.png") == b"resultado"
+
+
+def test_batch_not_found(client):
+    assert client.get("/api/batch/nao-existe").status_code == 404
+    assert client.get("/api/batch/nao-existe/download").status_code == 404
+
+
+def test_invalid_params_return_422(client, fake):
+    resp = client.post(
+        "/api/batch",
+        data={"workflow": WORKFLOW, "params": json.dumps({"steps": 1000})},
+        files=[("images", ("a.png", b"png-a", "image/png"))],
+    )
+    assert resp.status_code == 422
+    assert QUEUE_INDEX_KEY not in fake.store
+
+
+def test_cancel_job_status_codes(client, fake):
+    fake.store["job:run"] = {"status": "processing", "server": "srv"}
+    resp = client.delete("/api/jobs/run")
+    assert resp.status_code == 202
+    assert resp.json()["status"] == "cancelling"
+    assert fake.store["job:run"]["cancel_requested_at"]
+    assert fake.store["job:run"]["status"] == "processing"  # o worker conclui o cancelamento
+
+    fake.store["job:fila"] = {"status": "queued"}
+    fake.store[QUEUE_INDEX_KEY] = {"fila": 1.0}
+    resp = client.delete("/api/jobs/fila")
+    assert resp.status_code == 200
+    assert fake.store["job:fila"]["status"] == "cancelled"
+    assert "fila" not in fake.store[QUEUE_INDEX_KEY]
+
+    fake.store["job:pronto"] = {"status": "done"}
+    assert client.delete("/api/jobs/pronto").status_code == 409
+    assert client.delete("/api/jobs/nao-existe").status_code == 404
+
+
+def test_upload_rejected_with_retry_after_when_queue_is_full(client, fake, monkeypatch):
+    monkeypatch.setattr(routes.admission, "max_queue", 2)
+    fake.store[QUEUE_INDEX_KEY] = {"a": 1.0, "b": 2.0}
+
+    resp = client.post("/api/upload", files={"image": ("a.png", b"png-a", "image/png")})
+    assert resp.status_code == 503
+    assert int(resp.headers["Retry-After"]) >= routes.admission.min_retry_after
+    assert resp.json()["detail"]["reason"] == "queue_full"
+    assert len(fake.store[QUEUE_INDEX_KEY]) == 2
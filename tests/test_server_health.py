@@ -0,0 +1,60 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.server_health import CircuitBreaker, ServerHealthRegistry, CLOSED, OPEN, HALF_OPEN
+
+
+def test_breaker_trips_on_error_rate_and_recovers_through_half_open():
+    b = CircuitBreaker(min_samples=4, error_rate_threshold=0.5, cooldown=10)
+    now = 1000.0
+    b.record_success(now=now)
+    b.record_success(now=now)
+    b.record_failure(now=now)
+    assert b.state == CLOSED
+    b.record_failure(now=now)
+    assert b.state == OPEN
+    assert not b.allow(now=now + 5)
+
+    # cooldown expirou: libera um único job de teste
+    assert b.allow(now=now + 11)
+    assert b.state == HALF_OPEN
+    b.acquire(now=now + 11)
+    assert not b.allow(now=now + 12)
+
+    b.record_success(duration=3.0, now=now + 20)
+    assert b.state == CLOSED
+    assert b.allow(now=now + 20)
+
+
+def test_breaker_trips_on_consecutive_timeouts_and_backs_off():
+    b = CircuitBreaker(max_consecutive_timeouts=2, cooldown=10, min_samples=100)
+    b.record_failure(timeout=True, now=0)
+    b.record_failure(timeout=True, now=1)
+    assert b.state == OPEN
+
+    assert b.allow(now=12)
+    b.acquire(now=12)
+    b.record_failure(timeout=True, now=13)
+    # segunda abertura seguida: cooldown dobra
+    assert b.state == OPEN
+    assert not b.allow(now=13 + 15)
+    assert b.allow(now=13 + 21)
+
+
+def test_registry_ranks_healthy_servers_first():
+    reg = ServerHealthRegistry(min_samples=100)
+    reg.record_success("fast", 5.0)
+    reg.record_success("slow", 30.0)
+    reg.record_failure("flaky")
+    assert reg.rank(["flaky", "slow", "fast"]) == ["fast", "slow", "flaky"]
+
+
+def test_explicit_zero_timestamp_is_not_replaced_by_the_clock():
+    b = CircuitBreaker(max_consecutive_timeouts=1, cooldown=10)
+    b.record_failure(timeout=True, now=0)
+    assert b.opened_at == 0
+    # com `now or time.time()` o instante 0 virava "agora" e o cooldown já teria passado
+    assert not b.allow(now=0)
+    assert b.error_rate(now=0) == 1.0
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(__file__), "..", "src")
+sys.path.insert(0, SRC)
+
+from utils import s3
+
+# dependências pesadas que só podem carregar no primeiro uso, nunca no import da API
+HEAVY_MODULES = ("matplotlib", "boto3", "PIL", "websockets", "phonenumbers", "aiohttp")
+
+
+def _loaded_after_import(module: str):
+    code = (
+        f"import sys, {module}\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True, timeout=60
+    )
+    return [m for m in out.stdout.strip().split(",") if m]
+
+
+def test_routes_import_does_not_load_heavy_dependencies():
+    assert _loaded_after_import("routes.routes") == []
+
+
+def test_storage_is_resolved_on_first_use(monkeypatch, tmp_path):
+    monkeypatch.setattr(s3, "_use_s3", None)
+    monkeypatch.setattr(s3.settings, "STATIC_DIR", str(tmp_path))
+    calls = []
+    monkeypatch.setattr(s3, "has_aws_credentials", lambda: calls.append(1) or False)
+
+    assert s3.warm_up() is False
+    s3.upload_bytes("output/x.png", b"data", "image/png")
+
+    assert calls == [1]
+    assert s3.download_file("output/x.png") == b"data"
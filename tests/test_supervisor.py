@@ -0,0 +1,55 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.supervisor import JobSupervisor
+
+
+def test_limits_per_server_and_global():
+    async def run():
+        sup = JobSupervisor(max_in_flight=2, max_per_server=1)
+        sup.start("a", "srv1", asyncio.sleep(10))
+        assert not sup.can_start("srv1")
+        assert sup.can_start("srv2")
+        sup.start("b", "srv2", asyncio.sleep(10))
+        assert not sup.can_start("srv3")  # limite global
+        sup.draining = True
+        leftover = sup.cancel_all()
+        return sorted(rid for rid, _ in leftover), sup.in_flight
+
+    assert asyncio.run(run()) == (["a", "b"], 0)
+
+
+def test_crashed_task_is_reported_and_released():
+    crashes = []
+
+    async def on_crash(request_id, exc):
+        crashes.append((request_id, str(exc)))
+
+    async def boom():
+        raise RuntimeError("redis caiu")
+
+    async def run():
+        sup = JobSupervisor(on_crash=on_crash)
+        sup.start("a", "srv1", boom())
+        await sup.wait(timeout=1)
+        await asyncio.sleep(0)
+        return sup.in_flight
+
+    assert asyncio.run(run()) == 0
+    assert crashes == [("a", "redis caiu")]
+
+
+def test_spawned_tasks_are_kept_until_done():
+    async def run():
+        sup = JobSupervisor()
+        gate = asyncio.Event()
+        task = sup.spawn(gate.wait())
+        held = task in sup.background
+        gate.set()
+        await sup.wait_background(timeout=1)
+        return held, sup.background
+
+    assert asyncio.run(run()) == (True, set())
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import sentry_sdk
+from sentry_sdk.transport import Transport
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core import tracing
+
+
+class CaptureTransport(Transport):
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def capture_envelope(self, envelope):
+        for item in envelope.items:
+            if item.type == "transaction":
+                self.events.append(item.payload.json)
+
+
+def _init(rate=1.0):
+    transport = CaptureTransport()
+    tracing.init_sentry("http://public@localhost/1", rate, transport=transport)
+    return transport
+
+
+def test_worker_transaction_continues_route_trace():
+    transport = _init()
+    with sentry_sdk.start_transaction(op="http.server", name="/api/upload") as route_tx:
+        fields = tracing.trace_fields()
+
+    job = {"status": "queued", **fields}
+    with tracing.job_transaction(job, "worker.process_job", request_id="r1"):
+        with tracing.stage("input_download"):
+            pass
+        nodes = tracing.NodeSpans({"3": {"class_type": "KSampler"}, "9": {"class_type": "SaveImage"}})
+        nodes.executing("3")
+        nodes.executing("9")
+        nodes.executing(None)
+    sentry_sdk.flush()
+
+    worker_tx = next(e for e in transport.events if e["transaction"] == "worker.process_job")
+    assert worker_tx["contexts"]["trace"]["trace_id"] == route_tx.trace_id
+    names = [s["description"] for s in worker_tx["spans"]]
+    assert sorted(names) == ["3 KSampler", "9 SaveImage", "input_download"]
+    tracing.init_sentry(None, 0.0)
+
+
+def test_sampler_follows_parent_and_skips_health_checks():
+    sampler = tracing.make_traces_sampler(0.25)
+    assert sampler({"parent_sampled": True}) == 1.0
+    assert sampler({"parent_sampled": False}) == 0.0
+    assert sampler({"asgi_scope": {"path": "/alive"}}) == 0.0
+    assert sampler({"asgi_scope": {"path": "/api/upload"}}) == 0.25
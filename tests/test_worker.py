@@ -6,32 +6,50 @@ import sys
 import pytest
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
-# Set minimal environment variables required by the settings module before
-# importing the worker module.
-os.environ.setdefault("BASE_URL", "http://testserver")
-os.environ.setdefault("STATIC_DIR", "static")
-os.environ.setdefault("REDIS_URL", "redis://localhost:6379/0")
-os.environ.setdefault("AWS_REGION", "us-east-1")
-os.environ.setdefault("S3_BUCKET", "dummy-bucket")
-os.environ.setdefault("COMFYUI_API_SERVER1", "http://localhost")
-os.environ.setdefault("COMFYUI_API_SERVER2", "http://localhost")
-os.environ.setdefault("COMFYUI_API_SERVER3", "http://localhost")
-os.environ.setdefault("COMFYUI_API_SERVER4", "http://localhost")
-os.environ.setdefault("TIMER_TERMS", "20")
-os.environ.setdefault("CONFIG_INDEX", "6")
 
 import worker as worker_module
+from core.multi_comfyui_api import ComfyUiExecutionError, ComfyUiInterrupted
+from core.retry import classify_failure, TRANSIENT, SERVER, PERMANENT
 
 
 class DummyAPI:
+    server_address_list = []
+
     async def get_available_server_addresses(self):
         return []
 
 
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.ops = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.ops.append((name, args, kwargs))
+        return queue
+
+    async def execute(self):
+        return [await getattr(self.redis, name)(*args, **kwargs) for name, args, kwargs in self.ops]
+
+
 class FakeRedis:
     def __init__(self):
         self.store = {}
 
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def hincrby(self, key, field, amount=1):
+        data = self.store.setdefault(key, {})
+        data[field] = str(int(data.get(field, 0)) + amount)
+
+    async def expire(self, key, seconds):
+        return True
+
+    async def incr(self, key):
+        self.store[key] = str(int(self.store.get(key) or 0) + 1)
+
     async def hset(self, key, mapping=None, **kwargs):
         data = self.store.setdefault(key, {})
         if mapping:
@@ -54,12 +72,22 @@ class FakeRedis:
     async def rpop(self, key):
         return None
 
+    async def lrange(self, key, start, end):
+        return list(self.store.get(key, []))
+
     async def set(self, key, value):
         self.store[key] = value
 
     async def get(self, key):
         return self.store.get(key)
 
+    async def zadd(self, key, mapping):
+        self.store.setdefault(key, {}).update(mapping)
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.store.get(key, {}).pop(m, None)
+
 
 @pytest.mark.usefixtures("monkeypatch")
 def test_timeout_sets_failed_status(monkeypatch):
@@ -77,3 +105,358 @@ def test_timeout_sets_failed_status(monkeypatch):
 
     status = asyncio.run(run_test())
     assert status == "failed"
+
+
+def test_classify_failure():
+    class NoSuchKey(Exception):
+        response = {"Error": {"Code": "NoSuchKey"}}
+
+    assert classify_failure(NoSuchKey(), "download_input") == PERMANENT
+    assert classify_failure(ConnectionRefusedError(), "generate") == TRANSIENT
+    assert classify_failure(asyncio.TimeoutError(), "generate") == TRANSIENT
+    assert classify_failure(ComfyUiExecutionError("CUDA out of memory"), "generate") == SERVER
+    assert classify_failure(ComfyUiInterrupted("interrupted"), "generate") == PERMANENT
+
+
+def test_failed_job_waits_for_backoff_then_requeues(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+
+    async def run_test():
+        await fake.hset("job:test", mapping={"status": "processing", "server": "srv-a", "attempt": "1"})
+        await worker._fail_job("test", "generate", "boom", ConnectionRefusedError())
+        first = dict(fake.store["job:test"])
+
+        # backoff ainda não expirou: continua 'failed'
+        fake.store["job:test"]["retry_at"] = "9999999999"
+        await worker.process_jobs()
+        waiting = await fake.hget("job:test", "status")
+
+        fake.store["job:test"]["retry_at"] = "0"
+        await worker.process_jobs()
+        return first, waiting, dict(fake.store["job:test"])
+
+    first, waiting, requeued = asyncio.run(run_test())
+    assert first["status"] == "failed"
+    assert first["failure_class"] == TRANSIENT
+    assert first["failed_servers"] == "srv-a"
+    assert waiting == "failed"
+    assert requeued["status"] == "queued"
+    assert requeued["attempt"] == "2"
+    assert "test" in fake.store[worker_module.QUEUE_INDEX_KEY]
+
+
+def test_permanent_failure_is_not_retried(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+
+    async def run_test():
+        await fake.hset("job:test", mapping={"status": "processing", "server": "srv-a", "attempt": "1"})
+        await worker._fail_job("test", "download_input", "missing", FileNotFoundError())
+        return dict(fake.store["job:test"])
+
+    job = asyncio.run(run_test())
+    assert job["status"] == "error"
+    assert job["failure_class"] == PERMANENT
+
+
+def test_interrupted_prompt_is_not_retried_nor_blamed_on_the_server(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    blamed = []
+    monkeypatch.setattr(worker.health, "record_failure", lambda server, timeout=False: blamed.append(server))
+
+    async def run_test():
+        await fake.hset("job:test", mapping={"status": "processing", "server": "srv-a", "attempt": "1"})
+        await worker._fail_job("test", "generate", "interrupted", ComfyUiInterrupted("interrupted"))
+        return dict(fake.store["job:test"])
+
+    job = asyncio.run(run_test())
+    assert job["status"] == "error"
+    assert job["failure_class"] == PERMANENT
+    assert blamed == []
+
+
+def test_earliest_job_prefers_servers_not_yet_tried(monkeypatch):
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+    worker = worker_module.Worker(server_list=[])
+    queued = {
+        "old": {"job_id": "old", "created_at": "2024-01-01T00:00:00", "avoid_servers": {"a"}},
+        "new": {"job_id": "new", "created_at": "2024-01-01T00:00:05", "avoid_servers": set()},
+    }
+
+    # outro servidor livre existe: o job antigo espera por ele
+    assert worker.get_earliest_job(queued, "a", {"a", "b"}) == "new"
+    assert worker.get_earliest_job(queued, "b", {"a", "b"}) == "old"
+    # nenhuma alternativa livre: roda mesmo assim
+    assert worker.get_earliest_job(queued, "a", {"a"}) == "old"
+
+
+def test_jobs_past_queue_deadline_are_dropped_before_dispatch(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+    monkeypatch.setattr(worker_module.settings, "JOB_QUEUE_DEADLINE", 600)
+
+    worker = worker_module.Worker(server_list=[])
+    old = (datetime.utcnow() - timedelta(seconds=601)).isoformat()
+    recent = datetime.utcnow().isoformat()
+
+    async def run_test():
+        await fake.hset("job:old", mapping={"status": "queued", "input": "in", "enqueued_at": old})
+        await fake.hset("job:batch", mapping={"status": "queued", "input": "in", "enqueued_at": old, "batch_id": "b"})
+        await fake.hset("job:new", mapping={"status": "queued", "input": "in", "enqueued_at": recent})
+        await fake.zadd(worker_module.QUEUE_INDEX_KEY, {"old": 1, "batch": 2, "new": 3})
+        await worker.process_jobs()
+
+    asyncio.run(run_test())
+    assert fake.store["job:old"]["status"] == "error"
+    assert fake.store["job:old"]["error"] == "queue_deadline_exceeded"
+    assert "old" not in fake.store[worker_module.QUEUE_INDEX_KEY]
+    assert set(worker.queued_jobs) == {"batch", "new"}
+
+
+def test_cancel_request_stops_running_task_and_frees_server(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    cancelled_prompts = []
+
+    class CancelAPI:
+        def cancel_prompt(self, server, prompt_id):
+            cancelled_prompts.append((server, prompt_id))
+            return "interrupted"
+
+    async def run_test():
+        task = asyncio.create_task(asyncio.sleep(60))
+        worker.supervisor.jobs["run"] = {"task": task, "server": "srv", "api": CancelAPI(), "prompt_id": "p1"}
+        now = datetime.utcnow().isoformat()
+        await fake.hset("job:run", mapping={
+            "status": "processing", "server": "srv", "proc_start_at": now, "cancel_requested_at": now,
+        })
+        # cancelado pela rota enquanto ainda estava na fila interna do worker
+        worker.queued_jobs["queued"] = {"job_id": "queued", "created_at": now, "input": "in"}
+        await fake.hset("job:queued", mapping={"status": "cancelled", "cancel_requested_at": now})
+        await worker.process_jobs()
+        await asyncio.sleep(0)
+        return task
+
+    task = asyncio.run(run_test())
+    assert task.cancelled()
+    assert cancelled_prompts == [("srv", "p1")]
+    assert fake.store["job:run"]["status"] == "cancelled"
+    assert "srv" not in worker.servers_in_use
+    assert not worker.supervisor.jobs and not worker.queued_jobs
+
+
+def test_worker_consumes_enqueued_job_without_rewriting_it(monkeypatch):
+    from core import jobs
+
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    enqueued_at = datetime.utcnow().isoformat()
+
+    async def run_test():
+        await jobs.enqueue(fake, "r1", jobs.new_job("input/r1/a.png", enqueued_at, workflow_path="src/workflows/x.json"))
+        before = dict(fake.store["job:r1"])
+        await worker.process_jobs()
+        return before
+
+    before = asyncio.run(run_test())
+    assert fake.store["job:r1"] == before
+    assert worker.queued_jobs["r1"]["created_at"] == enqueued_at
+
+
+def test_drain_hands_unfinished_jobs_back_to_the_queue(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    enqueued_at = datetime.utcnow().isoformat()
+
+    async def run_test():
+        await fake.hset("job:slow", mapping={
+            "status": "processing", "server": "srv", "enqueued_at": enqueued_at, "attempt": "1",
+            "proc_start_at": datetime.utcnow().isoformat(),
+        })
+        await fake.hset("job:fast", mapping={"status": "processing", "server": "srv2", "attempt": "1"})
+
+        async def finish_fast():
+            await asyncio.sleep(0.05)
+            await fake.hset("job:fast", mapping={"status": "done"})
+
+        slow = worker.supervisor.start("slow", "srv", asyncio.sleep(60), prompt_id=None)
+        worker.supervisor.start("fast", "srv2", finish_fast(), prompt_id=None)
+        worker.request_shutdown()
+        await worker.drain(timeout=0.3)
+        return slow
+
+    slow = asyncio.run(run_test())
+    assert slow.cancelled()
+    assert fake.store["job:fast"]["status"] == "done"
+    assert fake.store["job:slow"]["status"] == "queued"
+    assert fake.store["job:slow"]["attempt"] == "1"
+    assert "slow" in fake.store[worker_module.QUEUE_INDEX_KEY]
+    assert not worker.supervisor.can_start()
+
+
+def test_late_prompt_is_cancelled_by_a_held_task(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    cancelled_prompts = []
+
+    class CancelAPI:
+        def cancel_prompt(self, server, prompt_id):
+            cancelled_prompts.append((server, prompt_id))
+            return "deleted"
+
+    async def run_test():
+        # a tentativa já foi abandonada quando o ComfyUI aceitou o prompt
+        worker._prompt_queued("gone", CancelAPI(), "srv", "p9")
+        held = len(worker.supervisor.background)
+        await worker.supervisor.wait_background(timeout=1)
+        return held
+
+    assert asyncio.run(run_test()) == 1
+    assert cancelled_prompts == [("srv", "p9")]
+
+
+def test_missing_workflow_fails_only_the_job(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    def make_api(servers, temp_folder, workflow_path, *args, **kwargs):
+        if workflow_path.endswith("removido.json"):
+            raise FileNotFoundError(workflow_path)
+        api = DummyAPI()
+        api.server_address_list, api.img_temp_folder, api.templates = servers, temp_folder, None
+        api.node_id_ksampler = api.node_id_image_load = api.node_id_text_input = "-1"
+        return api
+
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", make_api)
+
+    worker = worker_module.Worker(server_list=[])
+
+    async def run_test():
+        await fake.hset("job:r1", mapping={"status": "queued", "input": "in", "attempt": "1"})
+        # não pode levantar: o workflow só é carregado dentro da task do job
+        worker._start_job("srv", "r1", "in", "src/workflows/removido.json")
+        await worker.supervisor.wait(timeout=5)
+        await asyncio.sleep(0)
+        return dict(fake.store["job:r1"])
+
+    job = asyncio.run(run_test())
+    assert job["status"] == "error"
+    assert job["failure_class"] == PERMANENT
+    assert job["error"].startswith("load_workflow_failed")
+    assert "srv" not in job.get("failed_servers", "")
+
+
+def test_generate_timeout_cancels_the_running_prompt(monkeypatch):
+    import threading
+
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+    monkeypatch.setattr(worker_module, "download_file", lambda key: b"img")
+    wait_for = asyncio.wait_for
+    monkeypatch.setattr(worker_module.asyncio, "wait_for", lambda fut, timeout: wait_for(fut, 0.2))
+
+    worker = worker_module.Worker(server_list=[])
+    aborted = threading.Event()
+    cancelled_prompts = []
+
+    class StuckAPI:
+        def generate_images_from_bytes(self, server, bio, request_id, params, on_prompt):
+            on_prompt("p1")
+            # websocket preso até o prompt ser interrompido
+            aborted.wait(5)
+            raise RuntimeError("websocket closed")
+
+        def cancel_prompt(self, server, prompt_id):
+            cancelled_prompts.append((server, prompt_id))
+            aborted.set()
+            return "interrupted"
+
+    monkeypatch.setattr(worker, "_get_api_for_job", lambda workflow_path: StuckAPI())
+
+    async def run_test():
+        await fake.hset("job:r1", mapping={"status": "queued", "input": "in", "attempt": "1"})
+        worker._start_job("srv", "r1", "in", None)
+        await worker.supervisor.wait(timeout=5)
+        await worker.supervisor.wait_background(timeout=1)
+        return dict(fake.store["job:r1"])
+
+    job = asyncio.run(run_test())
+    assert cancelled_prompts == [("srv", "p1")]
+    assert job["error"] == "comfyui_timeout_while_generating"
+
+
+def test_cancel_counted_by_route_is_not_recorded_again(monkeypatch):
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    recorded = []
+
+    async def record(workflow, result):
+        recorded.append(result)
+
+    monkeypatch.setattr(worker.activity, "record", record)
+
+    async def run_test():
+        now = datetime.utcnow().isoformat()
+        # a rota cancelou como 'queued', mas a tentativa já tinha começado
+        await fake.hset("job:r1", mapping={
+            "status": "processing", "server": "srv", "cancel_requested_at": now, "finished_at": now,
+        })
+        worker.supervisor.jobs["r1"] = {
+            "task": asyncio.create_task(asyncio.sleep(60)), "server": "srv", "api": None, "prompt_id": None,
+        }
+        await worker.process_jobs()
+        await asyncio.sleep(0)
+        return dict(fake.store["job:r1"]), now
+
+    job, now = asyncio.run(run_test())
+    assert job["status"] == "cancelled"
+    assert job["finished_at"] == now
+    assert recorded == []
+
+
+def test_free_server_slots_do_not_count_busy_open_servers_twice(monkeypatch):
+    from core import metrics
+
+    fake = FakeRedis()
+    monkeypatch.setattr(worker_module, "redis", fake)
+    monkeypatch.setattr(worker_module, "MultiComfyUiAPI", lambda *args, **kwargs: DummyAPI())
+
+    worker = worker_module.Worker(server_list=[])
+    worker.api.server_address_list = ["a", "b", "c"]
+    worker.servers_in_use = {"a"}
+    # 'a' está ocupado e com o breaker aberto ao mesmo tempo
+    monkeypatch.setattr(worker.health, "snapshot", lambda: {"a": {"state": "open"}, "b": {"state": "open"}})
+
+    worker._print_dynamic_status({})
+
+    def slots(state):
+        return metrics.SERVER_SLOTS.labels(state=state)._value.get()
+
+    assert (slots("busy"), slots("open"), slots("free")) == (1, 2, 1)
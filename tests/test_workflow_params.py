@@ -0,0 +1,100 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from core.workflow_params import WorkflowParamError, WorkflowTemplates, params_path
+
+
+TEMPLATE = {
+    "3": {"class_type": "KSampler", "inputs": {"seed": 1, "denoise": 1.0, "steps": 20}},
+    "6": {"class_type": "CLIPTextEncode", "inputs": {"text": "original"}},
+    "10": {"class_type": "LoadImage", "inputs": {"image": "x.png"}},
+}
+
+
+@pytest.fixture
+def workflow(tmp_path):
+    path = tmp_path / "wf.json"
+    path.write_text(json.dumps(TEMPLATE))
+    return str(path)
+
+
+def test_default_schema_comes_from_configured_nodes(workflow):
+    templates = WorkflowTemplates("3", "6")
+    assert set(templates.schema(workflow)) == {"seed", "strength", "prompt"}
+
+    prompt = templates.build_prompt(workflow, {"prompt": "novo", "strength": "0.4", "seed": 42})
+    assert prompt["6"]["inputs"]["text"] == "novo"
+    assert prompt["3"]["inputs"]["denoise"] == 0.4
+    assert prompt["3"]["inputs"]["seed"] == 42
+    # o template em cache não é alterado
+    assert templates.get(workflow)[0]["6"]["inputs"]["text"] == "original"
+
+    assert templates.build_prompt(workflow)["3"]["inputs"]["seed"] == 1
+    assert templates.build_prompt(workflow, {"seed": -1})["3"]["inputs"]["seed"] != -1
+
+
+def test_validation_errors(workflow):
+    templates = WorkflowTemplates("3", "6")
+    for bad in (
+        {"strength": 2}, {"strength": "muito"}, {"steps": 10}, {"seed": -5},
+        {"strength": "nan"}, {"strength": float("nan")}, {"strength": "-inf"},
+    ):
+        with pytest.raises(WorkflowParamError):
+            templates.build_params(workflow, bad)
+
+
+def test_sidecar_schema_is_reloaded_when_changed(workflow):
+    sidecar = params_path(workflow)
+    with open(sidecar, "w") as f:
+        json.dump({"params": {"steps": {"type": "int", "node": "3", "input": "steps", "min": 1, "max": 50}}}, f)
+    templates = WorkflowTemplates("3", "6")
+    assert templates.build_prompt(workflow, {"steps": 8})["3"]["inputs"]["steps"] == 8
+    with pytest.raises(WorkflowParamError):
+        templates.build_params(workflow, {"prompt": "x"})
+
+    with open(sidecar, "w") as f:
+        json.dump({"params": {"steps": {"type": "int", "node": "99", "input": "steps"}}}, f)
+    os.utime(sidecar, ns=(os.stat(sidecar).st_mtime_ns + 10**9,) * 2)
+    with pytest.raises(WorkflowParamError):
+        templates.schema(workflow)  # node inexistente no workflow
+
+
+def test_non_finite_float_is_rejected_without_bounds(workflow):
+    with open(params_path(workflow), "w") as f:
+        json.dump({"params": {"cfg": {"type": "float", "node": "3", "input": "denoise"}}}, f)
+    templates = WorkflowTemplates("3", "6")
+    assert templates.build_params(workflow, {"cfg": "7.5"}) == {"cfg": 7.5}
+    for bad in ("nan", "inf", float("inf")):
+        with pytest.raises(WorkflowParamError):
+            templates.build_params(workflow, {"cfg": bad})
+
+
+def test_shipped_sidecars_match_their_workflows():
+    workflows_dir = os.path.join(os.path.dirname(__file__), "..", "src", "workflows")
+    templates = WorkflowTemplates("-1", "-1")
+    for name in os.listdir(workflows_dir):
+        if name.endswith(".params.json"):
+            templates.schema(os.path.join(workflows_dir, name.replace(".params.json", ".json")))
+
+
+def test_workflow_listing_skips_workflow_removed_after_listing(monkeypatch, workflow):
+    import asyncio
+    from types import SimpleNamespace
+
+    from routes import routes
+
+    templates = WorkflowTemplates("3", "6")
+    paths = {
+        "src/workflows/wf.json": workflow,
+        "src/workflows/removido.json": os.path.join(os.path.dirname(workflow), "removido.json"),
+    }
+    monkeypatch.setattr(routes, "list_workflows", lambda: ["wf.json", "removido.json"])
+    monkeypatch.setattr(routes, "workflow_templates", SimpleNamespace(schema=lambda path: templates.schema(paths[path])))
+
+    result = asyncio.run(routes.workflows_with_params())
+    assert list(result) == ["wf.json"]